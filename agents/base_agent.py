@@ -7,6 +7,7 @@ from abc import ABC, abstractmethod
 from playwright.async_api import async_playwright, Page, BrowserContext
 from core.models import AgentConfig, SessionLocal
 from core.credential_manager import CredentialManager
+from core.llm_metrics import call_context
 
 logger = logging.getLogger(__name__)
 
@@ -122,7 +123,8 @@ class BaseAgent(ABC):
             logger.info(f"    URL Cible: {self.target_url}")
             self._update_status("RUNNING")
             await self.init_browser()
-            await self.process()
+            with call_context(agent=self.agent_nom):
+                await self.process()
             duration = time.time() - start_time
             self._update_status("IDLE", duration_s=round(duration, 2))
             logger.info(f"═══ Agent [{self.agent_nom}] terminé en {duration:.1f}s ═══")
@@ -1,55 +1,81 @@
 """
 AGENT PIVOT EAN — Minion de Résolution d'Identité Produit.
-Flux: Read GEN-XXXX products -> DuckDuckGo -> Regex -> Gemini fallback -> Update EAN + merge.
+Flux: Read GEN-XXXX products -> DuckDuckGo -> Regex -> Gemini fallback (K produits par prompt) -> Update EAN + merge.
 """
 import re
-import json
+import asyncio
 import logging
 from datetime import datetime
-import google.generativeai as genai
 
 from agents.base_agent import BaseAgent
 from core.models import ProduitReference, OffreRetail, SessionLocal
-from core.credential_manager import CredentialManager
+from core.config import LLM_BATCH_SIZE
+from core.llm_client import llm_client
+from core.text_reducer import reduce_text
 
 logger = logging.getLogger(__name__)
 
 EAN_EXTRACTION_PROMPT = """Tu es un assistant spécialisé dans l'identification de produits de grande consommation.
 
-À partir du texte ci-dessous (résultats de recherche web), trouve le code EAN (code-barres à 13 chiffres) du produit suivant :
-- Nom : {product_name}
-- Marque : {brand}
+Pour CHAQUE produit ci-dessous (repéré par son "id"), trouve le code EAN (code-barres à 13 chiffres)
+à partir du texte de recherche web qui l'accompagne.
 
-Réponds UNIQUEMENT avec un JSON strict :
-{{
-  "ean_found": "1234567890123 ou null si introuvable",
-  "confidence": 85,
-  "source_hint": "Site ou contexte d'où vient l'EAN"
-}}
+Réponds UNIQUEMENT avec une liste JSON stricte, un objet par produit :
+[
+  {{
+    "id": 1,
+    "ean_found": "1234567890123 ou null si introuvable",
+    "confidence": 85,
+    "source_hint": "Site ou contexte d'où vient l'EAN"
+  }}
+]
+
+RÈGLES :
+- Reprends exactement l'"id" de chaque produit, y compris quand l'EAN est introuvable.
+- L'EAN doit faire exactement 13 chiffres.
+- Si plusieurs EAN sont visibles, choisis celui qui correspond le mieux au produit.
+- N'utilise que le texte de recherche du produit concerné.
+- Si aucun EAN n'est trouvable, mets "ean_found": null.
+- confidence = ta certitude de 0 à 100.
 
+PRODUITS :
+{products}"""
+
+EAN_PRODUCT_BLOCK = """
+=== PRODUIT id={id} ===
+- Nom : {product_name}
+- Marque : {brand}
 TEXTE DE RECHERCHE :
 ---
 {search_text}
 ---
+"""
 
-RÈGLES :
-- L'EAN doit faire exactement 13 chiffres.
-- Si plusieurs EAN sont visibles, choisis celui qui correspond le mieux au produit.
-- Si aucun EAN n'est trouvable, mets "ean_found": null.
-- confidence = ta certitude de 0 à 100."""
+
+EAN_SEARCH_TOKENS = 1500  # budget par produit dans le prompt
+
+
+def render_ean_prompt(items: list[dict]) -> str:
+    """Prompt multi-produits (items : id, nom, marque, search_text)."""
+    return EAN_EXTRACTION_PROMPT.format(products="".join(
+        EAN_PRODUCT_BLOCK.format(id=item["id"], product_name=item["nom"], brand=item["marque"],
+                                 search_text=item["search_text"])
+        for item in items
+    ))
 
 
 class EanPivotAgent(BaseAgent):
-    def __init__(self, agent_config_id: int):
+    def __init__(self, agent_config_id: int, only_eans: list[str] = None):
         super().__init__(agent_config_id)
-        self.gemini_cred = CredentialManager(service_name="gemini")
+        self.only_eans = only_eans  # Pipeline : limite la résolution aux EAN GEN- impactés
 
     def _get_pending_products(self) -> list:
         db = SessionLocal()
         try:
-            products = db.query(ProduitReference).filter(
-                ProduitReference.ean.like("GEN-%")
-            ).limit(50).all()
+            query = db.query(ProduitReference).filter(ProduitReference.ean.like("GEN-%"))
+            if self.only_eans is not None:
+                query = query.filter(ProduitReference.ean.in_(self.only_eans))
+            products = query.limit(50).all()
             return [{"ean": p.ean, "nom": p.nom_genere, "marque": p.marque or "Inconnue"} for p in products]
         finally:
             db.close()
@@ -66,10 +92,10 @@ class EanPivotAgent(BaseAgent):
                     if (results.length > 0) {
                         return Array.from(results).slice(0, 5).map(r => r.innerText).join('\\n---\\n');
                     }
-                    return document.body.innerText.substring(0, 5000);
+                    return document.body.innerText;
                 }
             """)
-            return text[:8000] if text else ""
+            return text or ""
         except Exception as e:
             logger.warning(f"[{self.agent_nom}] Recherche web échouée: {e}")
             return ""
@@ -78,31 +104,28 @@ class EanPivotAgent(BaseAgent):
         matches = re.findall(r'\b(\d{13})\b', text)
         return matches[0] if matches else None
 
-    async def _extract_ean_gemini(self, product_name: str, brand: str, search_text: str) -> dict:
-        api_key = self.gemini_cred.get_api_key()
-        if not api_key:
-            return {"ean_found": None, "confidence": 0}
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(
-                model_name="gemini-1.5-flash",
-                generation_config={"response_mime_type": "application/json"}
-            )
-            prompt = EAN_EXTRACTION_PROMPT.format(
-                product_name=product_name, brand=brand, search_text=search_text[:6000]
-            )
-            response = model.generate_content(prompt)
-            if response.text:
-                raw = response.text.strip()
-                if raw.startswith("```json"):
-                    raw = raw[7:-3].strip()
-                return json.loads(raw)
-        except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "quota" in error_str.lower():
-                self.gemini_cred.report_error(api_key, status_code=429)
-            logger.error(f"[{self.agent_nom}] Erreur Gemini EAN: {e}")
-        return {"ean_found": None, "confidence": 0}
+    async def _extract_eans_gemini(self, batch: list[tuple[dict, str]]) -> dict:
+        """Un prompt pour K produits ; retourne {EAN GEN-: réponse ou None}."""
+        items = [
+            {"id": i, "nom": product["nom"], "marque": product["marque"], "search_text": search_text}
+            for i, (product, search_text) in enumerate(batch, start=1)
+        ]
+        answers = await llm_client.generate_batch(items, render=render_ean_prompt, namespace="ean_pivot")
+        return {product["ean"]: answers.get(str(i)) for i, (product, _) in enumerate(batch, start=1)}
+
+    async def _resolve_with_gemini(self, batch: list[tuple[dict, str]]) -> int:
+        results = await self._extract_eans_gemini(batch)
+        resolved = 0
+        for product, _ in batch:
+            result = results.get(product["ean"]) or {}
+            found_ean = str(result.get("ean_found") or "")
+            confidence = result.get("confidence") or 0
+            if len(found_ean) == 13 and found_ean.isdigit() and confidence >= 60:
+                self._update_ean(product["ean"], found_ean)
+                resolved += 1
+            else:
+                logger.info(f"[{self.agent_nom}] EAN non r\u00e9solu pour: {product['nom']} (confiance: {confidence}%)")
+        return resolved
 
     def _update_ean(self, old_ean: str, new_ean: str):
         db = SessionLocal()
@@ -142,6 +165,9 @@ class EanPivotAgent(BaseAgent):
         context = await self.get_new_context()
         page = await context.new_page()
         resolved = 0
+        # La navigation reste séquentielle (un onglet) ; dès que LLM_BATCH_SIZE produits
+        # sont en attente, leur extraction Gemini part en un seul prompt, en parallèle
+        llm_tasks, batch = [], []
         try:
             for product in pending:
                 old_ean = product["ean"]
@@ -155,15 +181,20 @@ class EanPivotAgent(BaseAgent):
                     self._update_ean(old_ean, ean_regex)
                     resolved += 1
                     continue
-                result = await self._extract_ean_gemini(nom, marque, search_text)
-                found_ean = result.get("ean_found")
-                confidence = result.get("confidence", 0)
-                if found_ean and len(found_ean) == 13 and found_ean.isdigit() and confidence >= 60:
-                    self._update_ean(old_ean, found_ean)
-                    resolved += 1
-                else:
-                    logger.info(f"[{self.agent_nom}] EAN non r\u00e9solu pour: {nom} (confiance: {confidence}%)")
+                # Le regex a vu tout le texte ; Gemini ne reçoit que les blocs les plus pertinents
+                search_text = reduce_text(search_text, query=f"{marque} {nom} EAN", max_tokens=EAN_SEARCH_TOKENS)
+                batch.append((product, search_text))
+                if len(batch) >= LLM_BATCH_SIZE:
+                    llm_tasks.append(asyncio.create_task(self._resolve_with_gemini(batch)))
+                    batch = []
                 await page.wait_for_timeout(1500)
         finally:
             await context.close()
+            if batch:
+                llm_tasks.append(asyncio.create_task(self._resolve_with_gemini(batch)))
+            for outcome in await asyncio.gather(*llm_tasks, return_exceptions=True):
+                if isinstance(outcome, BaseException):
+                    logger.error(f"[{self.agent_nom}] Lot Gemini EAN en \u00e9chec: {outcome!r}")
+                else:
+                    resolved += outcome
         logger.info(f"[{self.agent_nom}] R\u00e9solution termin\u00e9e: {resolved}/{len(pending)} EAN trouv\u00e9s.")
@@ -5,11 +5,11 @@ Flux: Navigate -> Extract Text -> Gemini AST Prompt -> RulesMatrix Upsert.
 import json
 import logging
 from datetime import datetime
-import google.generativeai as genai
 
 from agents.base_agent import BaseAgent
 from core.models import RulesMatrix, SessionLocal
-from core.credential_manager import CredentialManager
+from core.llm_client import llm_client
+from core.text_reducer import reduce_html
 
 logger = logging.getLogger(__name__)
 
@@ -60,59 +60,34 @@ R\u00c8GLES IMP\u00c9RATIVES :
 - R\u00e9ponds UNIQUEMENT avec le JSON."""
 
 
-class LogicMiner(BaseAgent):
-    def __init__(self, agent_config_id: int):
-        super().__init__(agent_config_id)
-        self.gemini_cred = CredentialManager(service_name="gemini")
+LEGAL_TEXT_TOKENS = 7500
+# Termes qui font remonter les clauses utiles quand le texte dépasse le budget
+LEGAL_QUERY = ("cumul cumulable cumulables promotion remise carte fidélité odr remboursement coupon "
+               "bon réduction exclusion exclus plafond limite foyer validité période conditions")
+
 
+class LogicMiner(BaseAgent):
     async def _extract_page_text(self, page) -> str:
-        text = await page.evaluate("""
-            () => {
-                const selectors = ['main', 'article', '.content', '#content', '.main-content', 'body'];
-                for (const sel of selectors) {
-                    const el = document.querySelector(sel);
-                    if (el && el.innerText && el.innerText.length > 200) {
-                        return el.innerText;
-                    }
-                }
-                return document.body.innerText;
-            }
-        """)
-        return text.strip() if text else ""
+        """Contenu principal de la page (sans menus / pieds de page), réduit au budget du prompt."""
+        html = await page.content()
+        return reduce_html(html, query=LEGAL_QUERY, max_tokens=LEGAL_TEXT_TOKENS) if html else ""
 
     async def extract_data(self, page) -> dict:
         legal_text = await self._extract_page_text(page)
         if len(legal_text) < 100:
             logger.warning(f"[{self.agent_nom}] Texte trop court ({len(legal_text)} chars).")
             return {}
-        if len(legal_text) > 30000:
-            legal_text = legal_text[:30000]
         logger.info(f"[{self.agent_nom}] Texte juridique extrait: {len(legal_text)} caract\u00e8res.")
 
-        api_key = self.gemini_cred.get_api_key()
-        if not api_key:
-            return {}
-
+        prompt = AST_EXTRACTION_PROMPT.format(legal_text=legal_text)
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(
-                model_name="gemini-1.5-flash",
-                generation_config={"response_mime_type": "application/json"}
-            )
-            prompt = AST_EXTRACTION_PROMPT.format(legal_text=legal_text)
-            response = model.generate_content(prompt)
-            if response.text:
-                raw = response.text.strip()
-                if raw.startswith("```json"):
-                    raw = raw[7:-3].strip()
+            raw = await llm_client.generate([prompt], namespace="logic_miner")
+            if raw:
                 ast_result = json.loads(raw)
                 logger.info(f"[{self.agent_nom}] AST extrait. Confiance: {ast_result.get('extraction_confidence', '?')}%")
                 return {"ast": ast_result, "raw_text": legal_text}
             return {}
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "quota" in error_str.lower():
-                self.gemini_cred.report_error(api_key, status_code=429)
             logger.error(f"[{self.agent_nom}] Erreur Gemini AST: {e}")
             return {}
 
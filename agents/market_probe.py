@@ -1,49 +1,77 @@
 """
 AGENT MARKET PROBE — Sonde de Marché (Amazon / Rakuten / Google Shopping).
-Flux: EAN réels -> Amazon.fr Playwright -> Google Shopping fallback -> Gemini -> MarketSonde DB.
+Flux: EAN réels -> Amazon.fr Playwright -> Google Shopping fallback -> Gemini (K produits par prompt) -> MarketSonde DB.
 Stratégie Coût Zéro : Pas d'API Keepa payante.
+Les pages de recherche lues (et les recherches sans résultat) sont mémorisées dans le
+cache marché partagé (core/market_cache.py) : pas de nouvelle navigation dans la fenêtre TTL.
+Les produits sondés à chaque run sont choisis par valeur attendue du relevé (core/refresh_planner.py).
 """
-import json
+import asyncio
 import logging
-from datetime import datetime
-import google.generativeai as genai
 
 from agents.base_agent import BaseAgent
-from core.models import ProduitReference, MarketSonde, SessionLocal
-from core.credential_manager import CredentialManager
+from core.models import MarketSonde, SessionLocal
+from core.config import LLM_BATCH_SIZE
+from core.llm_client import llm_client
+from core.text_reducer import reduce_text
+from core.market_cache import market_cache, SOURCE_AMAZON, SOURCE_GOOGLE_SHOPPING
+from core.refresh_planner import RefreshPlanner, SCOPE_PROBE
+from core.pipeline import emit, EVENT_MARKET_UPDATED
 
 logger = logging.getLogger(__name__)
 
 MARKET_EXTRACTION_PROMPT = """Tu es un analyste e-commerce expert en marketplaces.
-À partir du texte ci-dessous (venant d'une page de recherche Amazon.fr ou Google Shopping),
-identifie les informations du produit suivant :
-
-- Produit recherché : {product_name} ({brand})
-- EAN : {ean}
-
-Extrais les données suivantes dans un JSON STRICT :
-{{
-  "product_found": true,
-  "asin": "B0XXXXXXXX ou null",
-  "buy_box_price": 99.99,
-  "seller_count": 5,
-  "bsr_estimate": 15000,
-  "fba_available": true,
-  "category": "Catégorie principale du produit",
-  "confidence": 80
-}}
+Pour CHAQUE produit ci-dessous (repéré par son "id"), analyse le texte qui l'accompagne
+(page de recherche Amazon.fr ou Google Shopping) et identifie les informations du produit.
+
+Réponds UNIQUEMENT avec une liste JSON STRICTE, un objet par produit :
+[
+  {{
+    "id": 1,
+    "product_found": true,
+    "asin": "B0XXXXXXXX ou null",
+    "buy_box_price": 99.99,
+    "seller_count": 5,
+    "bsr_estimate": 15000,
+    "fba_available": true,
+    "category": "Catégorie principale du produit",
+    "confidence": 80
+  }}
+]
 
 RÈGLES :
+- Reprends exactement l'"id" de chaque produit, y compris quand il n'est pas trouvé.
+- N'utilise que le texte de la page du produit concerné.
 - buy_box_price = le prix actuel affiché (le plus bas visible), en euros, nombre décimal.
 - seller_count = nombre de vendeurs/offres visibles pour ce produit. Si absent, mets 1.
 - bsr_estimate = Best Sellers Rank si visible, sinon estime-le grossièrement ou mets null.
 - Si le produit n'est PAS trouvé dans le texte, mets "product_found": false et tout à null.
 - confidence = certitude de 0 à 100 que c'est bien le bon produit.
 
+PRODUITS :
+{products}"""
+
+MARKET_PRODUCT_BLOCK = """
+=== PRODUIT id={id} ===
+- Produit recherché : {product_name} ({brand})
+- EAN : {ean}
 TEXTE DE LA PAGE :
 ---
 {page_text}
----"""
+---
+"""
+
+
+def render_market_prompt(items: list[dict]) -> str:
+    """Prompt multi-produits (items : id, nom, marque, ean, page_text)."""
+    return MARKET_EXTRACTION_PROMPT.format(products="".join(
+        MARKET_PRODUCT_BLOCK.format(id=item["id"], product_name=item["nom"], brand=item["marque"],
+                                    ean=item["ean"], page_text=item["page_text"])
+        for item in items
+    ))
+
+MARKET_PAGE_TOKENS = 2000  # budget par page de recherche dans le prompt
+MIN_PAGE_TEXT = 100        # en dessous : page sans résultat exploitable
 
 AMAZON_FEE_ESTIMATES = {
     "default": {"commission_pct": 15.0, "fba_fee": 4.50, "shipping": 0.0},
@@ -57,27 +85,34 @@ AMAZON_FEE_ESTIMATES = {
 class MarketProbeAgent(BaseAgent):
     def __init__(self, agent_config_id: int):
         super().__init__(agent_config_id)
-        self.gemini_cred = CredentialManager(service_name="gemini")
         self.max_products_per_run = 30
+        self.navigations = 0
 
     def _get_products_needing_market_data(self) -> list:
-        db = SessionLocal()
-        try:
-            products = db.query(ProduitReference).filter(
-                ~ProduitReference.ean.like("GEN-%")
-            ).all()
-            result = []
-            for p in products:
-                latest = db.query(MarketSonde).filter(
-                    MarketSonde.ean == p.ean
-                ).order_by(MarketSonde.timestamp.desc()).first()
-                if not latest or (datetime.utcnow() - latest.timestamp).total_seconds() > 86400:
-                    result.append({"ean": p.ean, "nom": p.nom_genere, "marque": p.marque or ""})
-            return result[:self.max_products_per_run]
-        finally:
-            db.close()
+        """Produits sans sonde depuis REFRESH_PROBE_MIN_AGE_H, par valeur attendue du relevé (core/refresh_planner.py)."""
+        plan = RefreshPlanner().plan(SCOPE_PROBE, budget=self.max_products_per_run)
+        return [{"ean": c.ean, "nom": c.nom, "marque": c.marque} for c in plan]
+
+    async def _cached_search(self, source: str, search, page, product_name: str, ean: str) -> str:
+        """Texte de recherche depuis le cache marché, sinon navigation puis mémorisation (négative si vide)."""
+        quote = await asyncio.to_thread(market_cache.get, source, ean=ean, query=product_name)
+        if quote is not None:
+            return quote.payload["text"] if quote.found else ""
+        self.navigations += 1
+        text = await search(page, product_name, ean)
+        if text is not None:
+            await asyncio.to_thread(market_cache.put, source, {"text": text} if len(text) >= MIN_PAGE_TEXT else None,
+                                    ean=ean, query=product_name)
+        return text or ""
 
     async def _search_amazon(self, page, product_name: str, ean: str) -> str:
+        return await self._cached_search(SOURCE_AMAZON, self._navigate_amazon, page, product_name, ean)
+
+    async def _search_google_shopping(self, page, product_name: str, ean: str) -> str:
+        return await self._cached_search(SOURCE_GOOGLE_SHOPPING, self._navigate_google_shopping, page, product_name, ean)
+
+    async def _navigate_amazon(self, page, product_name: str, ean: str):
+        """Page de recherche Amazon.fr réduite ; None si la navigation a échoué (non mis en cache)."""
         search_query = ean if not ean.startswith("GEN-") else product_name
         url = f"https://www.amazon.fr/s?k={search_query.replace(' ', '+')}"
         try:
@@ -92,15 +127,15 @@ class MarketProbeAgent(BaseAgent):
                         return Array.from(results).slice(0, 5).map(r => r.innerText).join('\\n===PRODUCT===\\n');
                     }
                     const main = document.querySelector('#search, .s-main-slot, #dp');
-                    return main ? main.innerText.substring(0, 8000) : document.body.innerText.substring(0, 5000);
+                    return main ? main.innerText : document.body.innerText;
                 }
             """)
-            return text[:10000] if text else ""
+            return reduce_text(text, query=f"{product_name} {ean}", max_tokens=MARKET_PAGE_TOKENS) if text else ""
         except Exception as e:
             logger.warning(f"[{self.agent_nom}] Recherche Amazon échouée: {e}")
-            return ""
+            return None
 
-    async def _search_google_shopping(self, page, product_name: str, ean: str) -> str:
+    async def _navigate_google_shopping(self, page, product_name: str, ean: str):
         query = f"{product_name} {ean} prix" if not ean.startswith("GEN-") else f"{product_name} prix achat"
         url = f"https://www.google.fr/search?q={query.replace(' ', '+')}&tbm=shop"
         try:
@@ -112,13 +147,13 @@ class MarketProbeAgent(BaseAgent):
                     if (results.length > 0) {
                         return Array.from(results).slice(0, 5).map(r => r.innerText).join('\\n===RESULT===\\n');
                     }
-                    return document.body.innerText.substring(0, 6000);
+                    return document.body.innerText;
                 }
             """)
-            return text[:8000] if text else ""
+            return reduce_text(text, query=f"{product_name} {ean}", max_tokens=MARKET_PAGE_TOKENS) if text else ""
         except Exception as e:
             logger.warning(f"[{self.agent_nom}] Recherche Google Shopping échouée: {e}")
-            return ""
+            return None
 
     def _estimate_fees(self, category: str) -> dict:
         cat_lower = (category or "").lower()
@@ -130,7 +165,7 @@ class MarketProbeAgent(BaseAgent):
     async def extract_data(self, page) -> list:
         return []
 
-    def _persist_market_data(self, ean: str, data: dict, marketplace: str):
+    def _persist_market_data(self, ean: str, data: dict, marketplace: str) -> bool:
         db = SessionLocal()
         try:
             fees = self._estimate_fees(data.get("category", ""))
@@ -144,12 +179,29 @@ class MarketProbeAgent(BaseAgent):
             db.add(market)
             db.commit()
             logger.info(f"[{self.agent_nom}] MarketSonde enregistrée pour EAN={ean}: Buy Box={data.get('buy_box_price')}€")
+            return True
         except Exception as e:
             logger.error(f"[{self.agent_nom}] Erreur persistence MarketSonde: {e}")
             db.rollback()
+            return False
         finally:
             db.close()
 
+    async def _probe_with_gemini(self, batch: list[tuple[dict, str, str]]) -> list[str]:
+        """Extraction Gemini de K pages de recherche en un prompt, puis persistance. Retourne les EAN sondés."""
+        items = [
+            {"id": i, "nom": product["nom"], "marque": product["marque"], "ean": product["ean"], "page_text": page_text}
+            for i, (product, page_text, _) in enumerate(batch, start=1)
+        ]
+        answers = await llm_client.generate_batch(items, render=render_market_prompt, namespace="market_probe")
+        probed = []
+        for i, (product, _, marketplace) in enumerate(batch, start=1):
+            data = answers.get(str(i)) or {}
+            if data.get("product_found") and (data.get("confidence") or 0) >= 50:
+                if self._persist_market_data(product["ean"], data, marketplace):
+                    probed.append(product["ean"])
+        return probed
+
     async def process(self):
         products = self._get_products_needing_market_data()
         if not products:
@@ -158,46 +210,37 @@ class MarketProbeAgent(BaseAgent):
         logger.info(f"[{self.agent_nom}] {len(products)} produits à sonder.")
         context = await self.get_new_context()
         page = await context.new_page()
-        probed = 0
+        probed_eans = []
+        # La navigation reste séquentielle (un onglet) ; dès que LLM_BATCH_SIZE pages sont
+        # capturées, leur extraction Gemini part en un seul prompt, en parallèle
+        llm_tasks, batch = [], []
         try:
             for product in products:
                 ean = product["ean"]
                 nom = product["nom"]
-                marque = product["marque"]
+                navigations = self.navigations
                 page_text = await self._search_amazon(page, nom, ean)
                 marketplace = "amazon_fr"
-                if len(page_text) < 100:
+                if len(page_text) < MIN_PAGE_TEXT:
                     page_text = await self._search_google_shopping(page, nom, ean)
                     marketplace = "google_shopping"
-                if len(page_text) < 100:
+                if len(page_text) < MIN_PAGE_TEXT:
                     continue
-                api_key = self.gemini_cred.get_api_key()
-                if not api_key:
-                    break
-                try:
-                    genai.configure(api_key=api_key)
-                    model = genai.GenerativeModel(
-                        model_name="gemini-1.5-flash",
-                        generation_config={"response_mime_type": "application/json"}
-                    )
-                    prompt = MARKET_EXTRACTION_PROMPT.format(
-                        product_name=nom, brand=marque, ean=ean, page_text=page_text[:8000]
-                    )
-                    response = model.generate_content(prompt)
-                    if response.text:
-                        raw = response.text.strip()
-                        if raw.startswith("```json"):
-                            raw = raw[7:-3].strip()
-                        data = json.loads(raw)
-                        if data.get("product_found") and data.get("confidence", 0) >= 50:
-                            self._persist_market_data(ean, data, marketplace)
-                            probed += 1
-                except Exception as e:
-                    error_str = str(e)
-                    if "429" in error_str or "quota" in error_str.lower():
-                        self.gemini_cred.report_error(api_key, status_code=429)
-                    logger.error(f"[{self.agent_nom}] Erreur Gemini Market: {e}")
-                await page.wait_for_timeout(2000)
+                batch.append((product, page_text, marketplace))
+                if len(batch) >= LLM_BATCH_SIZE:
+                    llm_tasks.append(asyncio.create_task(self._probe_with_gemini(batch)))
+                    batch = []
+                if self.navigations > navigations:  # anti-ban, inutile si tout vient du cache
+                    await page.wait_for_timeout(2000)
         finally:
             await context.close()
-        logger.info(f"[{self.agent_nom}] Sonde terminée: {probed}/{len(products)} produits sondés.")
+            if batch:
+                llm_tasks.append(asyncio.create_task(self._probe_with_gemini(batch)))
+            for result in await asyncio.gather(*llm_tasks, return_exceptions=True):
+                if isinstance(result, list):
+                    probed_eans.extend(result)
+                else:
+                    logger.error(f"[{self.agent_nom}] Erreur Gemini Market: {result}")
+            if probed_eans:
+                emit(EVENT_MARKET_UPDATED, {"eans": probed_eans})
+        logger.info(f"[{self.agent_nom}] Sonde terminée: {len(probed_eans)}/{len(products)} produits sondés.")
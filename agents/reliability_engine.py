@@ -6,8 +6,7 @@ from pathlib import Path
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from serpapi import GoogleSearch
-from core.config import SERPAPI_KEY
+from core.market_fetcher import MarketFetcher
 
 # Logging configuration
 logging.basicConfig(
@@ -22,22 +21,14 @@ FEES_ESTIMATE = 0.15  # 15% estimated selling/shipping fees
 def get_market_price(product_name: str) -> dict:
     """
     Searches for market prices using SerpApi (Google Shopping).
+    Passe par MarketFetcher.search_shopping : rotation des clés SERPAPI et cache marché
+    partagé (une même requête normalisée n'est pas repayée dans la fenêtre TTL).
     Filters out accessories results (abnormally low prices).
     """
     try:
         logger.info(f"Recherche de prix pour : {product_name}")
-        
-        params = {
-            "engine": "google_shopping",
-            "q": product_name,
-            "api_key": SERPAPI_KEY,
-            "hl": "fr",
-            "gl": "fr"
-        }
-        
-        search = GoogleSearch(params)
-        results = search.get_dict()
-        shopping_results = results.get("shopping_results", [])
+
+        shopping_results = MarketFetcher().search_shopping(None, product_name) or []
         
         if not shopping_results:
             logger.warning(f"Aucun résultat Shopping pour : {product_name}")
@@ -2,18 +2,16 @@
 AGENT SCOUT — Minion de Capture Visuelle & Extraction Produit.
 Flux: Navigate -> Scroll -> Capture HD -> Gemini Vision -> ProduitReference + OffreRetail.
 """
-import json
 import uuid
 import logging
 from pathlib import Path
 from datetime import datetime
 from PIL import Image
-import google.generativeai as genai
 
 from agents.base_agent import BaseAgent
 from core.models import ProduitReference, OffreRetail, SessionLocal
 from core.config import SCREENSHOTS_DIR
-from core.credential_manager import CredentialManager
+from core.flyer_tiler import analyze_tiled
 
 logger = logging.getLogger(__name__)
 
@@ -46,10 +44,6 @@ RÈGLES :
 
 
 class ScoutAgent(BaseAgent):
-    def __init__(self, agent_config_id: int):
-        super().__init__(agent_config_id)
-        self.gemini_cred = CredentialManager(service_name="gemini")
-
     async def extract_data(self, page) -> list:
         timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         filename = f"scout_{self.agent_nom}_{timestamp}.png"
@@ -57,33 +51,17 @@ class ScoutAgent(BaseAgent):
         await self.capture_screenshot(page, str(screenshot_path), full_page=True)
         logger.info(f"[{self.agent_nom}] Capture HD enregistrée: {screenshot_path}")
 
-        api_key = self.gemini_cred.get_api_key()
-        if not api_key:
-            logger.error(f"[{self.agent_nom}] Aucune clé Gemini disponible. Abandon.")
-            return []
-
+        img = Image.open(screenshot_path)
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(
-                model_name="gemini-1.5-flash",
-                generation_config={"response_mime_type": "application/json"}
-            )
-            img = Image.open(screenshot_path)
-            response = model.generate_content([VISION_EXTRACTION_PROMPT, img])
-            if response.text:
-                raw = response.text.strip()
-                if raw.startswith("```json"):
-                    raw = raw[7:-3].strip()
-                products = json.loads(raw)
+            # Capture découpée en tuiles analysées en parallèle, produits fusionnés / dédoublonnés
+            products = await analyze_tiled(img, VISION_EXTRACTION_PROMPT, namespace="scout")
+            if products:
                 logger.info(f"[{self.agent_nom}] Gemini a extrait {len(products)} produits.")
                 return [{"data": p, "screenshot_path": str(screenshot_path)} for p in products]
             else:
                 logger.warning(f"[{self.agent_nom}] Réponse Gemini vide.")
                 return []
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "quota" in error_str.lower():
-                self.gemini_cred.report_error(api_key, status_code=429)
             logger.error(f"[{self.agent_nom}] Erreur Gemini Vision: {e}")
             return []
 
@@ -4,12 +4,12 @@ import logging
 import sys
 from pathlib import Path
 from PIL import Image
-import google.generativeai as genai
 
 # Add project root to sys.path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from core.config import GEMINI_API_KEY, TEMP_FLYERS_DIR
+from core.config import TEMP_FLYERS_DIR
+from core.flyer_tiler import analyze_tiled_sync
 
 # Logging configuration
 logging.basicConfig(
@@ -18,9 +18,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-
 MASTER_PROMPT = (
     "Tu es un expert en arbitrage retail. Analyse l'image du catalogue fournie. "
     "Pour chaque produit visible, extrais les informations suivantes de manière très précise. "
@@ -62,24 +59,11 @@ def analyze_image(image_path_str: str) -> list:
                 return []
             
             logger.info(f"Analyse de l'image : {image_path.name} ({file_size_mb:.2f}MB)")
-            
-            # Prepare the model with JSON output constraint
-            model = genai.GenerativeModel(
-                model_name="gemini-1.5-flash",
-                generation_config={"response_mime_type": "application/json"}
-            )
-            
-            # Request generation
-            # Note: Gemini 1.5 handles image objects directly from PIL or file path
-            response = model.generate_content([MASTER_PROMPT, img])
-            
-            if response.text:
-                # Cleanup potential artifacts (though mime_type should handle it)
-                raw_json = response.text.strip()
-                if raw_json.startswith("```json"):
-                    raw_json = raw_json[7:-3].strip()
-                
-                products = json.loads(raw_json)
+
+            # Tuiles analysées en parallèle via le client partagé (cache, rotation des clés, timeout)
+            products = analyze_tiled_sync(img, MASTER_PROMPT, namespace="vision_analyzer")
+
+            if products:
                 logger.info(f"Extraction réussie : {len(products)} produits trouvés.")
                 return products
             else:
@@ -0,0 +1,277 @@
+"""
+MODULE 20 — AI Parser (Parsing sémantique des pages capturées)
+Transforme le HTML / les screenshots produits par les Workers du ScraperEngine en
+objets Pydantic (CatalogueItem / RegleItem) via Gemini, puis les persiste :
+  - "catalogue" -> ProduitReference (+ EAN temporaire GEN-XXXX si absent) et OffreRetail
+  - "regles"    -> LevierActif
+La persistance est idempotente : une offre déjà connue (même EAN, enseigne, URL) ou un
+levier déjà connu (même type, enseigne, marque, EAN, URL, description) est mis à jour
+au lieu d'être dupliqué (retry d'un job de parsing, mission relancée).
+Avec un profil d'extraction (core/extraction_profiles.py), les pages HTML sont d'abord
+lues par sélecteurs CSS / XPath ; Gemini n'intervient que si la couverture est faible.
+
+Usage:
+    parser = AiParser("catalogue", mission_id=5)
+    raw = parser.parse_page(html, "https://www.carrefour.fr/promotions")
+    valid, errors = parser.validate(raw, "https://www.carrefour.fr/promotions")
+    db = SessionLocal()
+    offre_ids = parser.persist(valid, db)
+    db.commit()
+"""
+import io
+import json
+import uuid
+import logging
+from datetime import datetime
+from typing import Iterator, Optional, Union
+from urllib.parse import urlparse
+
+from sqlalchemy import or_
+
+from core.models import ProduitReference, OffreRetail, LevierActif
+from core.extraction_schemas import validate_batch, get_json_schema_for_prompt, CatalogueItem, RegleItem
+from core.llm_client import llm_client
+from core.text_reducer import reduce_html
+from core.extraction_profiles import extract_with_profile, min_coverage
+
+logger = logging.getLogger("ai_parser")
+
+MODEL_NAME = "gemini-1.5-flash"
+MAX_PAGE_TOKENS = 7500  # budget du texte de page après réduction (core/text_reducer.py)
+
+PARSE_PROMPT = """Tu es un expert en arbitrage retail. Extrais de la page ci-dessous TOUS les éléments
+correspondant au schéma JSON suivant (un objet par élément) :
+
+{schema}
+
+Enseigne probable : {enseigne}
+URL source : {source_url}
+
+RÈGLES :
+- Ne rien inventer : si une donnée est absente, mets null.
+- Les prix sont des nombres (ex: 24.99), pas des chaînes.
+- Réponds UNIQUEMENT avec une liste JSON d'objets. Aucun texte autour.
+{extra}"""
+
+ENSEIGNES = {
+    "carrefour": "Carrefour", "leclerc": "Leclerc", "auchan": "Auchan",
+    "intermarche": "Intermarché", "lidl": "Lidl", "casino": "Casino",
+    "cora": "Cora", "monoprix": "Monoprix", "franprix": "Franprix",
+    "promobutler": "PromoButler", "bonial": "Bonial",
+}
+
+
+def guess_enseigne(url: str) -> str:
+    host = urlparse(url or "").netloc.lower()
+    for key, name in ENSEIGNES.items():
+        if key in host:
+            return name
+    return "Inconnue"
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+class AiParser:
+    """Parsing Gemini d'une page capturée + validation + persistance."""
+
+    def __init__(self, template_type: str = "catalogue", prompt_override: str = None,
+                 mission_id: int = None, agent_config_id: int = None, lax_prices: bool = False,
+                 profile: Union[str, dict] = None):
+        self.template_type = template_type
+        self.lax_prices = lax_prices  # prix en chaîne ("24,99 €") convertis avant validation
+        self.profile = profile if template_type == "catalogue" else None  # profil CSS / XPath pré-LLM
+        self.stats = {"profile_pages": 0, "llm_pages": 0}
+        self.prompt_override = prompt_override
+        self.mission_id = mission_id
+        self.agent_config_id = agent_config_id
+        self.schema_json = json.dumps(get_json_schema_for_prompt(template_type), ensure_ascii=False)
+
+    def _build_prompt(self, source_url: str, page_text: str = None) -> str:
+        prompt = PARSE_PROMPT.format(
+            schema=self.schema_json,
+            enseigne=guess_enseigne(source_url),
+            source_url=source_url,
+            extra=self.prompt_override or "",
+        )
+        if page_text is not None:
+            prompt += f"\nCONTENU DE LA PAGE :\n---\n{page_text}\n---"
+        return prompt
+
+    def iter_page(self, content: Union[str, bytes], source_url: str) -> Iterator[dict]:
+        """Éléments bruts d'une page, rendus au fil de la génération (HTML) ; objets d'une réponse tronquée conservés."""
+        if isinstance(content, bytes):
+            # Screenshot full-page (VisionSniper) : tuiles en parallèle, produits rendus au fil de l'eau
+            from PIL import Image
+            from core.flyer_tiler import iter_tiled_sync
+            yield from iter_tiled_sync(Image.open(io.BytesIO(content)), self._build_prompt(source_url),
+                                       namespace="ai_parser", model_name=MODEL_NAME)
+            return
+
+        if self.profile:
+            items, coverage = extract_with_profile(content, self.profile, source_url, guess_enseigne(source_url))
+            if items and coverage >= min_coverage(self.profile):
+                self.stats["profile_pages"] += 1
+                yield from items
+                return
+            logger.info(f"  Profil d'extraction: couverture {coverage:.0%} sur {source_url}, repli sur Gemini.")
+
+        self.stats["llm_pages"] += 1
+        parts = [self._build_prompt(source_url, reduce_html(content, max_tokens=MAX_PAGE_TOKENS))]
+        yield from llm_client.stream_items_sync(parts, namespace="ai_parser", model_name=MODEL_NAME)
+
+    def parse_page(self, content: Union[str, bytes], source_url: str) -> list[dict]:
+        """Retourne la liste brute (dicts) extraite d'une page HTML ou d'un screenshot PNG."""
+        return list(self.iter_page(content, source_url))
+
+    def prepare(self, raw_items: list, source_url: str) -> list[dict]:
+        """Complète enseigne / source_url manquants (les éléments non-dict sont écartés)."""
+        enseigne = guess_enseigne(source_url)
+        items = [item for item in raw_items if isinstance(item, dict)]
+        for item in items:
+            item.setdefault("source_url", source_url)
+            if self.template_type == "catalogue" and not item.get("enseigne"):
+                item["enseigne"] = enseigne
+            if self.template_type == "regles" and not item.get("enseigne_cible"):
+                item["enseigne_cible"] = enseigne
+        return items
+
+    def validate(self, raw_items: list[dict], source_url: str) -> tuple[list, list[dict]]:
+        """Complète enseigne / source_url manquants puis valide le batch Pydantic."""
+        valid, errors = validate_batch(self.template_type, self.prepare(raw_items, source_url),
+                                       lax_prices=self.lax_prices)
+        if errors:
+            logger.info(f"  AiParser: {len(errors)} élément(s) rejeté(s) par le schéma ({source_url}).")
+        return valid, errors
+
+    # --- Persistance ---
+
+    def _resolve_eans(self, db, items: list[CatalogueItem]) -> list[str]:
+        """
+        EAN réel si fourni, sinon EAN temporaire GEN- (réutilisé si le produit est déjà connu).
+        Les produits déjà en base sont chargés en deux requêtes pour tout le lot.
+        """
+        real_eans = {item.ean for item in items if item.ean}
+        known = {
+            row.ean for row in db.query(ProduitReference.ean).filter(ProduitReference.ean.in_(real_eans)).all()
+        } if real_eans else set()
+        names = {item.nom_produit for item in items if not item.ean}
+        generated = {}
+        if names:
+            for produit in db.query(ProduitReference).filter(
+                ProduitReference.ean.like("GEN-%"), ProduitReference.nom_genere.in_(names)
+            ).all():
+                generated.setdefault((produit.nom_genere, produit.marque), produit.ean)
+
+        eans = []
+        for item in items:
+            if item.ean:
+                if item.ean not in known:
+                    db.add(ProduitReference(ean=item.ean, nom_genere=item.nom_produit,
+                                            marque=item.marque, categorie=item.categorie))
+                    known.add(item.ean)
+                eans.append(item.ean)
+                continue
+            key = (item.nom_produit, item.marque)
+            if key not in generated:
+                generated[key] = f"GEN-{uuid.uuid4().hex[:12].upper()}"
+                db.add(ProduitReference(ean=generated[key], nom_genere=item.nom_produit,
+                                        marque=item.marque, categorie=item.categorie))
+            eans.append(generated[key])
+        db.flush()  # FK : les produits doivent exister avant les offres
+        return eans
+
+    def _persist_offers(self, db, items: list[CatalogueItem]) -> list[int]:
+        eans = self._resolve_eans(db, items)
+        existing = {
+            (offre.ean, offre.enseigne, offre.source_url): offre
+            for offre in db.query(OffreRetail).filter(
+                OffreRetail.ean.in_(set(eans)), OffreRetail.is_active == True
+            ).all()
+        }
+        offres = []
+        for item, ean in zip(items, eans):
+            values = {
+                "prix_public": round(item.prix_public, 2),
+                "prix_brut": item.prix_brut,
+                "prix_initial_barre": item.prix_initial_barre,
+                "promo_directe_type": item.promo_directe_type,
+                "remise_immediate": item.remise_immediate,
+                "valeur_coupon": item.valeur_coupon,
+                "valeur_odr": item.valeur_odr,
+                "remise_fidelite": item.remise_fidelite,
+                "date_fin_promo": _parse_date(item.date_fin_promo),
+            }
+            key = (ean, item.enseigne, item.source_url)
+            offre = existing.get(key)
+            if offre:
+                for field, value in values.items():
+                    setattr(offre, field, value)
+                offre.timestamp = datetime.utcnow()
+            else:
+                offre = OffreRetail(
+                    agent_config_id=self.agent_config_id, ean=ean, enseigne=item.enseigne,
+                    source_url=item.source_url, **values,
+                )
+                db.add(offre)
+                existing[key] = offre
+            offres.append(offre)
+        db.flush()
+        return list(dict.fromkeys(offre.id for offre in offres))
+
+    def _persist_levers(self, db, items: list[RegleItem]) -> list[int]:
+        cibles = {item.ean_cible for item in items if item.ean_cible}
+        known_eans = {
+            ean for (ean,) in db.query(ProduitReference.ean).filter(ProduitReference.ean.in_(cibles)).all()
+        } if cibles else set()
+        urls = {item.source_url for item in items}
+        same_source = LevierActif.source_url.in_(urls - {None})
+        if None in urls:
+            same_source = or_(same_source, LevierActif.source_url == None)
+        existing = {
+            (lever.type_levier, lever.enseigne_cible, lever.marque_cible, lever.ean_cible,
+             lever.source_url, lever.description): lever
+            for lever in db.query(LevierActif).filter(same_source, LevierActif.is_active == True).all()
+        }
+        levers = []
+        for item in items:
+            # FK : un EAN inconnu laisse le levier ciblé par marque / enseigne
+            ean_cible = item.ean_cible if item.ean_cible in known_eans else None
+            values = {
+                "valeur_absolue": item.valeur_absolue,
+                "valeur_pourcentage": item.valeur_pourcentage,
+                "ast_conditions": [c.model_dump() for c in item.conditions],
+                "date_fin": _parse_date(item.date_fin),
+            }
+            key = (item.type_levier, item.enseigne_cible, item.marque_cible, ean_cible,
+                   item.source_url, item.description)
+            lever = existing.get(key)
+            if lever:
+                for field, value in values.items():
+                    setattr(lever, field, value)
+            else:
+                lever = LevierActif(
+                    agent_config_id=self.agent_config_id,
+                    type_levier=item.type_levier, description=item.description,
+                    marque_cible=item.marque_cible, ean_cible=ean_cible, enseigne_cible=item.enseigne_cible,
+                    source_url=item.source_url, **values,
+                )
+                db.add(lever)
+                existing[key] = lever
+            levers.append(lever)
+        db.flush()
+        return list(dict.fromkeys(lever.id for lever in levers))
+
+    def persist(self, items: list, db) -> list[int]:
+        """Écrit les items validés dans la session fournie, en un seul flush (commit laissé à l'appelant)."""
+        if not items:
+            return []
+        if self.template_type == "regles":
+            return self._persist_levers(db, items)
+        return self._persist_offers(db, items)
@@ -14,11 +14,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 SCREENSHOTS_DIR = DATA_DIR / "screenshots"
 TEMP_FLYERS_DIR = BASE_DIR / "temp_flyers"
+SESSIONS_DIR = DATA_DIR / "sessions"
+PAGES_DIR = DATA_DIR / "pages"
 
 # Ensure directories exist
 DATA_DIR.mkdir(exist_ok=True)
 SCREENSHOTS_DIR.mkdir(exist_ok=True)
 TEMP_FLYERS_DIR.mkdir(exist_ok=True)
+SESSIONS_DIR.mkdir(exist_ok=True)
+PAGES_DIR.mkdir(exist_ok=True)
 
 # Path to .env file
 ENV_PATH = BASE_DIR / ".env"
@@ -60,76 +64,60 @@ class AllKeysExhaustedError(Exception):
 class KeyManager:
     """
     Gère une liste de clés API pour un service donné BDD (table ApiKey).
-    Permet la rotation automatique en ignorant les clés épuisées.
+    Permet la rotation automatique en mettant en pause les clés refusées (429 / quota).
+    Les clés sont servies depuis l'ordonnanceur en mémoire (core/key_pool.py) rechargé
+    sur TTL : créneaux par clé, quota restant, cooldown et réactivation automatique.
     """
     def __init__(self, service_name: str):
         self.service_name = service_name.upper()
-        
+        self._key_pool = None
+
+    @property
+    def pool(self):
+        if self._key_pool is None:
+            from core.key_pool import KeyPool
+            self._key_pool = KeyPool(self.service_name)
+        return self._key_pool
+
     @property
     def has_keys(self) -> bool:
         """Vérifie si au moins une clé (ACTIVE ou EXHAUSTED) existe en BDD."""
-        from core.models import SessionLocal, ApiKey
-        db = SessionLocal()
-        try:
-            return db.query(ApiKey).filter(ApiKey.service_name == self.service_name).count() > 0
-        finally:
-            db.close()
+        return self.pool.has_keys
 
     def get_key(self) -> str:
-        """Retourne la première clé ACTIVE trouvée en BDD pour ce service."""
-        from core.models import SessionLocal, ApiKey
-        from datetime import datetime
-        db = SessionLocal()
-        try:
-            key_obj = db.query(ApiKey).filter(
-                ApiKey.service_name == self.service_name,
-                ApiKey.status == "ACTIVE"
-            ).first()
-            
-            if not key_obj:
-                raise AllKeysExhaustedError(f"API Quota Exceeded (or no keys) for {self.service_name}")
-                
-            key_obj.last_used = datetime.utcnow()
-            key_value = key_obj.api_key
-            db.commit()
-            return key_value
-            
-        except AllKeysExhaustedError:
-            raise
-        except Exception as e:
-            db.rollback()
-            raise RuntimeError(f"Database error while fetching key for {self.service_name}: {e}")
-        finally:
-            db.close()
-        
-    def mark_exhausted(self, key_str: str):
-        """Marque une clé comme épuisée (EXHAUSTED) en BDD."""
-        from core.models import SessionLocal, ApiKey
-        db = SessionLocal()
-        try:
-            key_obj = db.query(ApiKey).filter(
-                ApiKey.api_key == key_str,
-                ApiKey.service_name == self.service_name
-            ).first()
-            if key_obj:
-                key_obj.status = "EXHAUSTED"
-                db.commit()
-        except Exception as e:
-            db.rollback()
-        finally:
-            db.close()
-            
+        """Retourne la prochaine clé disponible du service (attend son créneau, sans accès BDD)."""
+        return self.pool.get_key()
+
+    def mark_exhausted(self, key_str: str, retry_after: float = None):
+        """Met une clé en pause (EXHAUSTED jusqu'à cooldown_until), écrite en différé."""
+        self.pool.mark_exhausted(key_str, retry_after)
+
+    def mark_invalid(self, key_str: str, status_code: int = None):
+        """Clé refusée (401 / 403) : INVALID, sans réactivation automatique."""
+        self.pool.mark_invalid(key_str, status_code)
+
+    def report_success(self, key_str: str):
+        self.pool.report_success(key_str)
+
+    def report_quota(self, key_str: str, remaining: int):
+        self.pool.report_quota(key_str, remaining)
+
     def reset(self):
         """Réinitialise l'état de toutes les clés de ce service à ACTIVE."""
         from core.models import SessionLocal, ApiKey
+        from core.key_pool import key_usage_writer
+        key_usage_writer.flush()  # un EXHAUSTED en attente ne doit pas écraser la réinitialisation
         db = SessionLocal()
         try:
-            db.query(ApiKey).filter(ApiKey.service_name == self.service_name).update({"status": "ACTIVE"})
+            db.query(ApiKey).filter(ApiKey.service_name == self.service_name).update(
+                {"status": "ACTIVE", "cooldown_until": None, "error_count": 0}
+            )
             db.commit()
         except Exception:
             db.rollback()
         finally:
             db.close()
+        self.pool.invalidate()
 
 
 # --- Initialisation des KeyManagers ---
@@ -138,6 +126,13 @@ serpapi_keys = KeyManager("SERPAPI")
 scrapingbee_keys = KeyManager("SCRAPINGBEE")
 firecrawl_keys = KeyManager("FIRECRAWL")
 
+KEY_MANAGERS = {manager.service_name: manager for manager in (gemini_keys, serpapi_keys, scrapingbee_keys, firecrawl_keys)}
+
+
+def get_key_manager(service_name: str) -> KeyManager:
+    """KeyManager partagé d'un service (créé au besoin pour les services hors liste)."""
+    return KEY_MANAGERS.setdefault(service_name.upper(), KeyManager(service_name))
+
 
 SUPABASE_DATABASE_URL = get_env_variable("SUPABASE_DATABASE_URL", required=False)
 
@@ -146,3 +141,102 @@ if SUPABASE_DATABASE_URL:
 else:
     DB_PATH = DATA_DIR / "staff_vision.db"
     DATABASE_URL = f"sqlite:///{DB_PATH}"
+
+# --- Scheduler cron (core/scheduler_worker.py) ---
+SCHEDULER_TIMEZONE = os.getenv("SCHEDULER_TIMEZONE", "Europe/Paris")
+SCHEDULER_MISFIRE_GRACE_S = int(os.getenv("SCHEDULER_MISFIRE_GRACE_S", "3600"))
+SCHEDULER_JITTER_S = int(os.getenv("SCHEDULER_JITTER_S", "30"))
+SCHEDULER_REFRESH_S = int(os.getenv("SCHEDULER_REFRESH_S", "300"))
+SCHEDULER_MARKET_FETCH_CRON = os.getenv("SCHEDULER_MARKET_FETCH_CRON", "0 */6 * * *")
+SCHEDULER_COLLISION_CRON = os.getenv("SCHEDULER_COLLISION_CRON", "30 */6 * * *")
+
+# --- Budgets de ressources par hôte, partagés entre exécuteurs (core/resource_budget.py) ---
+BUDGET_BROWSER_SLOTS = int(os.getenv("BUDGET_BROWSER_SLOTS", "4"))
+BUDGET_HTTP_SLOTS = int(os.getenv("BUDGET_HTTP_SLOTS", "16"))
+BUDGET_LLM_SLOTS = int(os.getenv("BUDGET_LLM_SLOTS", "4"))
+ADMISSION_MAX_CPU_PERCENT = float(os.getenv("ADMISSION_MAX_CPU_PERCENT", "90"))
+ADMISSION_MAX_MEM_PERCENT = float(os.getenv("ADMISSION_MAX_MEM_PERCENT", "90"))
+ADMISSION_MAX_RSS_MB = float(os.getenv("ADMISSION_MAX_RSS_MB", "0"))  # 0 = pas de plafond
+
+# --- Pool d'exécuteurs (core/supervisor.py) ---
+SUPERVISOR_PROCESSES = int(os.getenv("SUPERVISOR_PROCESSES", str(os.cpu_count() or 1)))  # défaut : un exécuteur par cœur
+
+# --- Parsing IA en flux (core/pipeline.py) ---
+PARSE_CONCURRENCY = int(os.getenv("PARSE_CONCURRENCY", "4"))  # appels LLM simultanés par flux
+PARSE_BATCH_SIZE = int(os.getenv("PARSE_BATCH_SIZE", "50"))   # éléments validés / persistés par transaction
+
+# --- Cache des réponses LLM (core/llm_cache.py) ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_H = float(os.getenv("LLM_CACHE_TTL_H", "168"))  # 7 jours
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+
+# --- Client Gemini partagé (core/llm_client.py) ---
+LLM_RPM_PER_KEY = int(os.getenv("LLM_RPM_PER_KEY", "15"))      # 0 = pas d'espacement
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))     # erreurs transitoires (timeout, 5xx)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))              # éléments par prompt multi-éléments
+LLM_BATCH_MAX_CHARS = int(os.getenv("LLM_BATCH_MAX_CHARS", "60000"))  # taille max d'un prompt multi-éléments
+
+# --- Réduction HTML / texte avant prompt (core/text_reducer.py) ---
+REDUCER_CHARS_PER_TOKEN = int(os.getenv("REDUCER_CHARS_PER_TOKEN", "4"))  # estimation tokens = caractères / 4
+
+# --- Découpage des captures en tuiles pour la vision (core/flyer_tiler.py) ---
+TILE_HEIGHT = int(os.getenv("TILE_HEIGHT", "2000"))        # hauteur d'une tuile (px, après mise à largeur)
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "250"))       # chevauchement : un produit coupé reste entier sur une tuile
+TILE_MAX_WIDTH = int(os.getenv("TILE_MAX_WIDTH", "1600"))  # largeur max envoyée au modèle
+
+# --- Backend LLM (core/llm_backend.py) ---
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")  # gemini | record | fake | http
+LLM_FAKE_URL = os.getenv("LLM_FAKE_URL", "http://127.0.0.1:8765")  # serveur python -m core.fake_llm
+
+# --- Instrumentation des appels LLM (core/llm_metrics.py) ---
+LLM_PRICE_INPUT_PER_MTOK = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.075"))   # USD / 1M tokens (gemini-1.5-flash)
+LLM_PRICE_OUTPUT_PER_MTOK = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.30"))
+LLM_METRICS_FLUSH_SIZE = int(os.getenv("LLM_METRICS_FLUSH_SIZE", "50"))  # lignes par insertion groupée
+LLM_METRICS_FLUSH_S = float(os.getenv("LLM_METRICS_FLUSH_S", "10"))      # vidage périodique du buffer
+
+# --- Pool / ordonnanceur de clés API en mémoire (core/key_pool.py) ---
+KEY_POOL_TTL_S = float(os.getenv("KEY_POOL_TTL_S", "30"))      # rechargement des clés depuis la BDD
+KEY_POOL_FLUSH_S = float(os.getenv("KEY_POOL_FLUSH_S", "5"))   # écriture différée de last_used / status
+KEY_COOLDOWN_S = float(os.getenv("KEY_COOLDOWN_S", "60"))           # première pause après un 429 (doublée ensuite)
+KEY_COOLDOWN_MAX_S = float(os.getenv("KEY_COOLDOWN_MAX_S", "21600"))  # pause maximale (6 h)
+KEY_MAX_WAIT_S = float(os.getenv("KEY_MAX_WAIT_S", "10"))           # attente max d'une clé en pause avant AllKeysExhaustedError
+KEY_RPM_PER_SERVICE = {                                              # espacement par clé (req/min), 0 = aucun
+    "GEMINI": LLM_RPM_PER_KEY,
+    "SERPAPI": int(os.getenv("KEY_RPM_SERPAPI", "0")),
+    "SCRAPINGBEE": int(os.getenv("KEY_RPM_SCRAPINGBEE", "0")),
+    "FIRECRAWL": int(os.getenv("KEY_RPM_FIRECRAWL", "0")),
+}
+KEY_QUOTA_RESET_H = {                                                # période de quota par service (h) : quota_remaining
+    "GEMINI": float(os.getenv("KEY_QUOTA_RESET_H_GEMINI", "24")),    # revient à quota_limit à chaque échéance, 0 = jamais
+    "SERPAPI": float(os.getenv("KEY_QUOTA_RESET_H_SERPAPI", "720")),
+    "SCRAPINGBEE": float(os.getenv("KEY_QUOTA_RESET_H_SCRAPINGBEE", "720")),
+    "FIRECRAWL": float(os.getenv("KEY_QUOTA_RESET_H_FIRECRAWL", "720")),
+}
+
+# --- Market Fetcher concurrent (core/market_fetcher.py) ---
+MARKET_FETCH_CONCURRENCY = int(os.getenv("MARKET_FETCH_CONCURRENCY", "8"))   # requêtes SerpAPI en vol
+MARKET_FETCH_RPS = float(os.getenv("MARKET_FETCH_RPS", "5"))                 # requêtes / seconde (0 = pas de limite)
+MARKET_FETCH_WRITE_BATCH = int(os.getenv("MARKET_FETCH_WRITE_BATCH", "200")) # EAN écrits par transaction
+
+# --- Cache des cotations marché (core/market_cache.py) ---
+MARKET_CACHE_ENABLED = os.getenv("MARKET_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+MARKET_CACHE_DEFAULT_TTL_H = float(os.getenv("MARKET_CACHE_DEFAULT_TTL_H", "12"))
+MARKET_CACHE_TTL_H = {                                                    # durée de validité par source
+    "serpapi_shopping": float(os.getenv("MARKET_CACHE_TTL_SERPAPI_H", "12")),
+    "amazon_fr": float(os.getenv("MARKET_CACHE_TTL_AMAZON_H", "12")),
+    "google_shopping": float(os.getenv("MARKET_CACHE_TTL_GOOGLE_SHOPPING_H", "12")),
+}
+MARKET_CACHE_NEGATIVE_TTL_H = float(os.getenv("MARKET_CACHE_NEGATIVE_TTL_H", "6"))  # "aucun résultat" mémorisé
+MARKET_CACHE_COUNTER_FLUSH_S = float(os.getenv("MARKET_CACHE_COUNTER_FLUSH_S", "10"))  # écriture différée des compteurs
+
+# --- Planification des rafraîchissements marché (core/refresh_planner.py) ---
+MARKET_REFRESH_BUDGET = int(os.getenv("MARKET_REFRESH_BUDGET", "300"))           # EAN déjà cotés re-relevés par run
+REFRESH_MIN_AGE_H = float(os.getenv("REFRESH_MIN_AGE_H", "12"))                  # pas de re-cotation SerpAPI avant
+REFRESH_PROBE_MIN_AGE_H = float(os.getenv("REFRESH_PROBE_MIN_AGE_H", "24"))      # pas de nouvelle sonde avant
+REFRESH_HORIZON_H = float(os.getenv("REFRESH_HORIZON_H", "72"))                  # horizon de changement à volatilité par défaut
+REFRESH_DEFAULT_VOLATILITY = float(os.getenv("REFRESH_DEFAULT_VOLATILITY", "0.05"))  # coefficient de variation supposé
+REFRESH_VOLATILITY_WINDOW_D = int(os.getenv("REFRESH_VOLATILITY_WINDOW_D", "30"))    # historique PriceHistory utilisé
+REFRESH_PROMO_WINDOW_H = float(os.getenv("REFRESH_PROMO_WINDOW_H", "72"))        # fin de promo proche = relevé urgent
+REFRESH_UNPRICED_MARGIN = float(os.getenv("REFRESH_UNPRICED_MARGIN", "0.15"))    # marge supposée sans collision
+REFRESH_MIN_STAKE = float(os.getenv("REFRESH_MIN_STAKE", "1"))                   # enjeu plancher (€)
@@ -0,0 +1,145 @@
+"""
+MODULE 15 — Cron Schedule (Calcul des prochaines exécutions)
+Traduit `frequence_cron` (AgentConfig / MissionConfig) en déclencheur APScheduler.
+Formats acceptés :
+  - "manual" (jamais planifié)
+  - alias : "hourly", "daily", "weekly", "monthly" (+ variantes "@daily"...)
+  - expression cron 5 champs : "0 6 * * *", "0 */6 * * *", "0 6 * * 1"
+Le jour de semaine suit la convention crontab (0/7 = dimanche), et non celle
+d'APScheduler (0 = lundi) : le champ est développé en liste explicite de noms de
+jours avant parsing (pas "*/2", "1-5/2" ni "0-2" interprétés à la mode APScheduler).
+Quand jour-du-mois et jour-de-semaine sont tous deux restreints, crontab déclenche si
+l'UN OU l'AUTRE correspond ("0 6 1 * 1" = le 1er du mois et chaque lundi) : on combine
+alors deux CronTrigger dans un OrTrigger (APScheduler, lui, exigerait les deux).
+
+Usage:
+    from core.cron_schedule import next_fire_time
+    nxt = next_fire_time("0 6 * * *")   # datetime aware, ou None si manual/invalide
+"""
+import re
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.combining import OrTrigger
+from apscheduler.triggers.cron import CronTrigger
+
+from core.config import SCHEDULER_TIMEZONE
+
+logger = logging.getLogger("cron_schedule")
+
+MANUAL = "manual"
+
+CRON_ALIASES = {
+    "hourly": "0 * * * *",
+    "daily": "0 6 * * *",
+    "weekly": "0 6 * * 1",
+    "monthly": "0 6 1 * *",
+}
+
+_DOW_NAMES = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+_DOW_PART = re.compile(r"^(\*|\w+)(?:-(\w+))?(?:/(\d+))?$")
+
+
+def _dow_number(token: str) -> int:
+    if token.isdigit() and int(token) <= 7:
+        return int(token)
+    if token[:3] in _DOW_NAMES:
+        return _DOW_NAMES.index(token[:3])
+    raise ValueError(f"jour de semaine inconnu '{token}'")
+
+
+def _crontab_dow(field: str) -> str:
+    """
+    Développe le champ jour-de-semaine crontab (0 = 7 = dimanche) en noms APScheduler :
+    pas et plages calculés côté crontab, plage "5-1" qui enjambe le dimanche acceptée.
+
+    >>> _crontab_dow("*/2")
+    'sun,tue,thu,sat'
+    >>> _crontab_dow("1-5/2")
+    'mon,wed,fri'
+    >>> _crontab_dow("0-2")
+    'sun,mon,tue'
+    >>> _crontab_dow("7")
+    'sun'
+    >>> _crontab_dow("5/2")
+    'sun,fri'
+    >>> _crontab_dow("fri-mon")
+    'sun,mon,fri,sat'
+    >>> _crontab_dow("*")
+    '*'
+    """
+    days = set()
+    for part in field.split(","):
+        match = _DOW_PART.match(part)
+        if not match:
+            raise ValueError(f"jour de semaine invalide '{part}'")
+        start, end, step = match.groups()
+        first = 0 if start == "*" else _dow_number(start)
+        if start == "*" or (step and not end):
+            last = 7  # "*/n" et "a/n" : jusqu'à la fin de la semaine
+        else:
+            last = _dow_number(end) if end else first
+            if last < first:
+                last += 7  # "fri-mon" : la plage enjambe le dimanche
+        days.update(day % 7 for day in range(first, last + 1, int(step or 1)))
+    if len(days) == 7:
+        return "*"
+    return ",".join(_DOW_NAMES[day] for day in sorted(days))
+
+
+@lru_cache(maxsize=256)
+def parse_schedule(expr: Optional[str]) -> Optional[BaseTrigger]:
+    """
+    Retourne le déclencheur de l'expression, ou None si manual / invalide.
+    Jour-du-mois et jour-de-semaine restreints ensemble : OU crontab.
+
+    >>> after = datetime(2024, 1, 1, 7, tzinfo=timezone.utc)   # lundi 1er janvier
+    >>> next_fire_time("0 6 15 * 5", after).strftime("%a %d")   # vendredi 5 avant le 15
+    'Fri 05'
+    >>> next_fire_time("0 6 3 * 5", after).strftime("%a %d")    # mercredi 3 avant vendredi
+    'Wed 03'
+    """
+    expr = (expr or "").strip().lower()
+    if not expr or expr == MANUAL:
+        return None
+    expr = CRON_ALIASES.get(expr.lstrip("@"), expr)
+
+    fields = expr.split()
+    if len(fields) != 5:
+        logger.warning(f"Expression cron invalide (5 champs attendus): '{expr}'")
+        return None
+    minute, hour, day, month, dow = fields
+    try:
+        # Comme crontab, un champ commençant par "*" ("*/2") compte comme non restreint
+        restricted = not day.startswith("*") and not dow.startswith("*")
+        dow = _crontab_dow(dow)
+        if restricted and dow != "*":
+            return OrTrigger([
+                CronTrigger(minute=minute, hour=hour, day=day, month=month, timezone=SCHEDULER_TIMEZONE),
+                CronTrigger(minute=minute, hour=hour, month=month, day_of_week=dow, timezone=SCHEDULER_TIMEZONE),
+            ])
+        return CronTrigger(
+            minute=minute, hour=hour, day=day, month=month,
+            day_of_week=dow, timezone=SCHEDULER_TIMEZONE,
+        )
+    except ValueError as e:
+        logger.warning(f"Expression cron invalide '{expr}': {e}")
+        return None
+
+
+def next_fire_time(expr: Optional[str], after: datetime = None) -> Optional[datetime]:
+    """
+    Prochaine exécution strictement après `after` (défaut: maintenant).
+    Un `after` naïf est interprété en UTC (convention des colonnes last_run).
+    """
+    trigger = parse_schedule(expr)
+    if trigger is None:
+        return None
+    after = after or datetime.now(timezone.utc)
+    if after.tzinfo is None:
+        after = after.replace(tzinfo=timezone.utc)
+    # get_next_fire_time renvoie un instant >= now : on décale d'une seconde pour exclure `after`
+    return trigger.get_next_fire_time(None, after + timedelta(seconds=1))
@@ -0,0 +1,176 @@
+"""
+MODULE 29 — Extraction Profiles (Extraction déclarative CSS / XPath avant le LLM)
+Les cartes produit des enseignes ont un balisage stable : un profil déclaratif
+(`MissionConfig.extraction_params.extraction_profile`) décrit où lire le nom, le
+prix, le prix barré, le badge promo, l'EAN... L'AI Parser l'évalue avec lxml sur le
+HTML capturé et produit directement des éléments CatalogueItem, en quelques
+millisecondes et sans appel API. Gemini n'est sollicité que si la couverture du
+profil (cartes complètes / cartes trouvées) est sous `min_coverage`.
+
+Profil = nom d'un profil intégré (PROFILES) ou dict :
+    {
+      "card": "div.product-card",             # CSS, ou XPath s'il commence par "/", "./" ou "("
+      "name": "h3.title",
+      "price": ".price-final",
+      "strike_price": ".price-old",
+      "promo": ".badge",
+      "ean": "@data-ean",                       # "sélecteur@attribut", ou "@attribut" de la carte
+      "brand": ".brand", "image": "img@src",
+      "min_coverage": 0.8
+    }
+Les sélecteurs CSS nécessitent le paquet optionnel cssselect ; les sélecteurs XPath
+(et le profil intégré "schema_org") fonctionnent sans.
+
+Usage:
+    from core.extraction_profiles import extract_with_profile
+    items, coverage = extract_with_profile(html, "schema_org", source_url, enseigne="Carrefour")
+"""
+import re
+import logging
+from functools import lru_cache
+from typing import Union
+
+import lxml.html
+from lxml import etree
+
+from core.extraction_schemas import parse_price
+
+try:
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    CSSSelector = None  # Profils limités aux sélecteurs XPath
+
+logger = logging.getLogger("extraction_profiles")
+
+DEFAULT_MIN_COVERAGE = 0.8
+FIELDS = ("name", "price", "strike_price", "promo", "ean", "brand", "image")
+
+# Profils intégrés : balisage microdata schema.org (Product / Offer), commun à de nombreux sites
+PROFILES = {
+    "schema_org": {
+        "card": "//*[@itemtype and contains(@itemtype, 'schema.org/Product')]",
+        "name": ".//*[@itemprop='name'][not(ancestor::*[@itemprop='brand'])]",
+        "price": ".//*[@itemprop='price']/@content | .//*[@itemprop='price']",
+        "strike_price": ".//*[contains(@class, 'old') or contains(@class, 'strike') or self::del or self::s]",
+        "promo": ".//*[contains(@class, 'promo') or contains(@class, 'badge')]",
+        "ean": ".//*[@itemprop='gtin13']/@content | .//*[@itemprop='gtin13'] | .//*[@itemprop='gtin']/@content",
+        "brand": ".//*[@itemprop='brand']//*[@itemprop='name'] | .//*[@itemprop='brand']",
+        "image": ".//*[@itemprop='image']/@src | .//*[@itemprop='image']/@content",
+    },
+}
+
+# "sélecteur@attribut" (hors XPath natif ".../@attribut" et prédicats [@...])
+ATTR_SUFFIX_RE = re.compile(r"^(.*?[^/\[(\s@]|)@([\w:-]+)$")
+EAN_RE = re.compile(r"\b(\d{13}|\d{8})\b")
+PROMO_PATTERNS = (
+    (re.compile(r"2\s*(?:e|ème|eme)\b", re.IGNORECASE), "2EME_GRATUIT"),
+    (re.compile(r"\d+\s*(?:achetés?|pour)\s*\d+", re.IGNORECASE), "X_POUR_Y"),
+    (re.compile(r"\blot\b", re.IGNORECASE), "LOT"),
+    (re.compile(r"cagnott|cashback|crédité|fidélité", re.IGNORECASE), "CASHBACK"),
+    (re.compile(r"-?\s*\d+\s*%"), "POURCENTAGE"),
+    (re.compile(r"€|remise|immédiate", re.IGNORECASE), "REMISE_IMMEDIATE"),
+)
+
+
+def resolve_profile(profile: Union[str, dict, None]) -> dict:
+    """Profil intégré (par nom) ou dict fourni ; {} si absent ou inconnu."""
+    if not profile:
+        return {}
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            logger.warning(f"  Profil d'extraction '{profile}' inconnu. Disponibles: {list(PROFILES)}")
+            return {}
+        return PROFILES[profile]
+    return profile
+
+
+@lru_cache(maxsize=512)
+def _compile(selector: str):
+    """Sélecteur compilé (XPath ou CSS) et attribut éventuel à lire."""
+    attr = None
+    suffix = ATTR_SUFFIX_RE.match(selector.strip())
+    if suffix:
+        selector, attr = suffix.groups()
+    selector = selector.strip()
+    if not selector:
+        return None, attr  # "@attribut" : attribut de la carte elle-même
+    if selector.startswith(("/", "./", ".//", "(")):
+        return etree.XPath(selector), attr
+    if CSSSelector is None:
+        raise RuntimeError(f"Sélecteur CSS '{selector}' : le paquet cssselect n'est pas installé (utilisez XPath).")
+    return CSSSelector(selector), attr
+
+
+def _first_text(node, selector: str):
+    if not selector:
+        return None
+    compiled, attr = _compile(selector)
+    matches = compiled(node) if compiled is not None else [node]
+    for match in matches:
+        if isinstance(match, str):  # résultat XPath d'attribut / texte
+            value = match
+        elif attr:
+            value = match.get(attr)
+        else:
+            value = " ".join(match.itertext())
+        value = re.sub(r"\s+", " ", value or "").strip()
+        if value:
+            return value
+    return None
+
+
+def _promo_type(badge: str):
+    for pattern, promo_type in PROMO_PATTERNS:
+        if badge and pattern.search(badge):
+            return promo_type
+    return None
+
+
+def _price(value):
+    price = parse_price(value) if value else None
+    return price if isinstance(price, float) and price > 0 else None
+
+
+def extract_with_profile(html: str, profile: Union[str, dict], source_url: str = None,
+                         enseigne: str = None) -> tuple[list[dict], float]:
+    """
+    Éléments catalogue (dicts prêts pour validate_batch) extraits par le profil, et couverture :
+    part des cartes trouvées ayant au moins un nom et un prix (0.0 si aucune carte).
+    """
+    spec = resolve_profile(profile)
+    if not spec.get("card") or not html:
+        return [], 0.0
+    try:
+        root = lxml.html.fromstring(html)
+        compiled, _ = _compile(spec["card"])
+        cards = [card for card in compiled(root) if not isinstance(card, str)]
+        rows = [{field: _first_text(card, spec.get(field)) for field in FIELDS} for card in cards]
+    except (etree.ParserError, etree.XPathError, ValueError, RuntimeError) as e:
+        logger.warning(f"  Profil d'extraction inapplicable ({source_url}): {e}")
+        return [], 0.0
+    if not cards:
+        return [], 0.0
+
+    items = []
+    for values in rows:
+        prix = _price(values["price"])
+        if not values["name"] or prix is None:
+            continue
+        ean = EAN_RE.search(values["ean"] or "")
+        prix_barre = _price(values["strike_price"])
+        items.append({
+            "ean": ean.group(1) if ean else None,
+            "nom_produit": values["name"],
+            "marque": values["brand"],
+            "prix_public": prix,
+            "prix_initial_barre": prix_barre if prix_barre and prix_barre > prix else None,
+            "promo_directe_type": _promo_type(values["promo"]),
+            "enseigne": enseigne,
+            "source_url": source_url,
+            "image_url": values["image"],
+        })
+    return items, len(items) / len(cards)
+
+
+def min_coverage(profile: Union[str, dict]) -> float:
+    return float(resolve_profile(profile).get("min_coverage", DEFAULT_MIN_COVERAGE))
@@ -9,16 +9,69 @@ NOUVEAU V3 :
   - prix_initial_barre & promo_directe_type
   - Instructions SEO : chercher GTIN dans application/ld+json
 
+Validation par lots : un TypeAdapter(list[...]) compilé une fois par template valide
+tout le lot en un seul appel pydantic-core ; un élément en erreur est isolé (seul lui
+est revalidé pour le message) et le reste du lot est conservé. L'essentiel du débit vient des
+contraintes de CatalogueItem (motif EAN, Literal des types de promo, bornes de prix) vérifiées
+par pydantic-core ; seules les valeurs à nettoyer repassent par un validateur Python.
+Mode `lax_prices` : les prix en chaîne ("24,99 €", "1 299,00€", "1.299 €") sont convertis
+en nombres avant validation.
+
 Usage:
     from core.extraction_schemas import CatalogueItem, RegleItem, get_schema_for_template
     schema_class = get_schema_for_template("catalogue")
     item = schema_class.model_validate(raw_dict)
+    valid, errors = validate_batch("catalogue", raw_list, lax_prices=True)
 """
-from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import Optional, List
+import re
+from functools import lru_cache
+from pydantic import (
+    BaseModel, Field, field_validator, TypeAdapter, ValidationError, BeforeValidator,
+    AfterValidator, Strict, StringConstraints, WithJsonSchema, create_model,
+)
+from typing import Any, Optional, List, Annotated, Literal, Union
 from datetime import datetime
 
 
+PROMO_DIRECTE_TYPES = frozenset({
+    "REMISE_IMMEDIATE", "LOT", "2EME_GRATUIT",
+    "X_POUR_Y", "POURCENTAGE", "CASHBACK",
+})
+TYPES_LEVIER = frozenset({"COUPON", "ODR", "FIDELITE", "REMISE_IMMEDIATE", "MULTI_ACHAT", "CASHBACK"})
+EAN_PATTERN = r"^(?:\d{8}|\d{13})$"
+MAX_PRIX_PUBLIC = 50000
+
+
+def _clean_ean(v: str) -> Optional[str]:
+    """EAN nettoyé (espaces, tirets) ou None s'il n'a pas 8 / 13 chiffres."""
+    cleaned = v.strip().replace(" ", "").replace("-", "")
+    if not cleaned.isdigit() or len(cleaned) not in (8, 13):
+        return None
+    return cleaned
+
+
+def _normalize_promo_type(v: str) -> Optional[str]:
+    upper = v.upper().strip()
+    return upper if upper in PROMO_DIRECTE_TYPES else None
+
+
+def _normalized(fast, fallback) -> Any:
+    """
+    Chemin rapide : une valeur déjà propre est acceptée par pydantic-core (motif / Literal)
+    sans appel Python ; seules les valeurs à nettoyer passent par le validateur de repli.
+    Le JSON Schema injecté dans les prompts reste "string ou null".
+    """
+    return Annotated[
+        Union[fast, None, Annotated[str, AfterValidator(fallback)]],
+        Field(union_mode="left_to_right"),
+        WithJsonSchema({"anyOf": [{"type": "string"}, {"type": "null"}]}),
+    ]
+
+
+EanField = _normalized(Annotated[str, StringConstraints(pattern=EAN_PATTERN)], _clean_ean)
+PromoTypeField = _normalized(Literal[tuple(sorted(PROMO_DIRECTE_TYPES))], _normalize_promo_type)
+
+
 class CatalogueItem(BaseModel):
     """
     Schema strict pour l'extraction de fiches produits en catalogue.
@@ -29,7 +82,7 @@ class CatalogueItem(BaseModel):
     2. Si absent du JSON-LD, chercher dans le texte visible (code-barres, fiche technique).
     3. Si introuvable, mettre ean = null (le EAN Hunter le résoudra).
     """
-    ean: Optional[str] = Field(
+    ean: EanField = Field(
         None,
         description=(
             "Code EAN/GTIN-13 du produit. "
@@ -41,13 +94,13 @@ class CatalogueItem(BaseModel):
     marque: Optional[str] = Field(None, description="Marque du produit")
     categorie: Optional[str] = Field(None, description="Catégorie (ex: Hygiène, Alimentaire)")
 
-    prix_public: float = Field(..., gt=0, description="Prix public TTC affiché (prix final en rayon)")
+    prix_public: float = Field(..., gt=0, le=MAX_PRIX_PUBLIC, description="Prix public TTC affiché (prix final en rayon)")
     prix_initial_barre: Optional[float] = Field(
         None, ge=0,
         description="Prix initial barré (l'ancien prix avant promo). Si pas de prix barré, null.",
     )
     prix_brut: Optional[float] = Field(None, ge=0, description="Prix brut avant remise immédiate magasin")
-    promo_directe_type: Optional[str] = Field(
+    promo_directe_type: PromoTypeField = Field(
         None,
         description=(
             "Type de promotion directe affichée : "
@@ -64,37 +117,6 @@ class CatalogueItem(BaseModel):
     image_url: Optional[str] = Field(None, description="URL de l'image produit")
     date_fin_promo: Optional[str] = Field(None, description="Date fin promo (format YYYY-MM-DD)")
 
-    @field_validator("ean")
-    @classmethod
-    def validate_ean(cls, v: Optional[str]) -> Optional[str]:
-        if v is None or v.strip() == "":
-            return None
-        cleaned = v.strip().replace(" ", "").replace("-", "")
-        if not cleaned.isdigit():
-            return None
-        if len(cleaned) not in (8, 13):
-            return None
-        return cleaned
-
-    @field_validator("prix_public")
-    @classmethod
-    def validate_prix(cls, v: float) -> float:
-        if v > 50000:
-            raise ValueError(f"Prix suspect (>50000\u20ac): {v}")
-        return round(v, 2)
-
-    @field_validator("promo_directe_type")
-    @classmethod
-    def validate_promo_type(cls, v: Optional[str]) -> Optional[str]:
-        if v is None:
-            return None
-        allowed = {
-            "REMISE_IMMEDIATE", "LOT", "2EME_GRATUIT",
-            "X_POUR_Y", "POURCENTAGE", "CASHBACK",
-        }
-        upper = v.upper().strip()
-        return upper if upper in allowed else None
-
     @property
     def needs_ean_hunting(self) -> bool:
         """True si l'EAN est manquant et doit \u00eatre r\u00e9solu."""
@@ -135,10 +157,9 @@ class RegleItem(BaseModel):
     @field_validator("type_levier")
     @classmethod
     def validate_type(cls, v: str) -> str:
-        allowed = {"COUPON", "ODR", "FIDELITE", "REMISE_IMMEDIATE", "MULTI_ACHAT", "CASHBACK"}
         upper = v.upper().strip()
-        if upper not in allowed:
-            raise ValueError(f"type_levier '{v}' invalide. Valide: {allowed}")
+        if upper not in TYPES_LEVIER:
+            raise ValueError(f"type_levier '{v}' invalide. Valide: {set(TYPES_LEVIER)}")
         return upper
 
 
@@ -176,17 +197,125 @@ def validate_extraction(template_type: str, raw_data: dict) -> BaseModel:
     return schema_class.model_validate(raw_data)
 
 
-def validate_batch(template_type: str, raw_list: list[dict]) -> tuple[list[BaseModel], list[dict]]:
+PRICE_CLEAN_RE = re.compile(r"[^\d,.\-]")
+EURO_CENTS_RE = re.compile(r"(?<=\d)\s*€\s*(?=\d{2}\b)")   # "24€99" -> "24.99"
+THOUSANDS_DOT_RE = re.compile(r"-?[1-9]\d{0,2}(?:\.\d{3})+")
+
+
+def parse_price(value):
+    """
+    Prix affiché -> float ; valeur inchangée si illisible. Un point suivi d'exactement trois
+    chiffres sépare les milliers, sauf après un 0 (prix au kg / sous l'euro).
+
+    >>> parse_price("24,99 €"), parse_price("1 299,00€"), parse_price("24€99")
+    (24.99, 1299.0, 24.99)
+    >>> parse_price("1.299 €")
+    1299.0
+    >>> parse_price("0.999")
+    0.999
+    >>> parse_price("illisible")
+    'illisible'
+    """
+    if not isinstance(value, str):
+        return value
+    text = EURO_CENTS_RE.sub(".", value.strip()) if "€" in value else value
+    text = PRICE_CLEAN_RE.sub("", text)
+    if "," in text and "." in text:
+        # Le dernier séparateur est la décimale, l'autre sépare les milliers
+        decimal = "," if text.rfind(",") > text.rfind(".") else "."
+        text = text.replace("." if decimal == "," else ",", "")
+    elif THOUSANDS_DOT_RE.fullmatch(text):
+        text = text.replace(".", "")
+    text = text.replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return value
+
+
+def _price_fields(schema_class: type[BaseModel]) -> tuple[str, ...]:
+    """Champs numériques (float) du schéma : cibles de la conversion des prix."""
+    return tuple(
+        name for name, field in schema_class.model_fields.items()
+        if field.annotation in (float, Optional[float])
+    )
+
+
+def _format_errors(errors: list[dict]) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'item'}: {err['msg']}" for err in errors
+    )[:300]
+
+
+def _coerce_prices(fields: tuple[str, ...], item):
+    if not isinstance(item, dict) or not any(isinstance(item.get(f), str) for f in fields):
+        return item
+    return {**item, **{f: parse_price(item[f]) for f in fields if isinstance(item.get(f), str)}}
+
+
+@lru_cache(maxsize=None)
+def _lax_schema(schema_class: type[BaseModel]) -> type[BaseModel]:
+    """
+    Sous-classe de schema_class dont les prix acceptent aussi une chaîne : un nombre reste dans
+    pydantic-core (branche stricte), seule une chaîne ("24,99 €") passe par parse_price.
+    """
+    overrides = {}
+    for name in _price_fields(schema_class):
+        field = schema_class.model_fields[name]
+        price = Annotated[
+            Union[
+                Annotated[float, Strict(), *field.metadata],
+                Annotated[float, *field.metadata, BeforeValidator(parse_price)],
+            ],
+            Field(union_mode="left_to_right"),
+        ]
+        overrides[name] = (
+            price if field.annotation is float else Optional[price],
+            Field(... if field.is_required() else field.default, description=field.description),
+        )
+    return create_model(schema_class.__name__, __base__=schema_class, __module__=schema_class.__module__, **overrides)
+
+
+def _item_type(template_type: str, lax_prices: bool):
+    schema_class = get_schema_for_template(template_type)
+    return _lax_schema(schema_class) if lax_prices else schema_class
+
+
+@lru_cache(maxsize=None)
+def get_item_adapter(template_type: str, lax_prices: bool = False) -> TypeAdapter:
+    return TypeAdapter(_item_type(template_type, lax_prices))
+
+
+@lru_cache(maxsize=None)
+def get_batch_adapter(template_type: str, lax_prices: bool = False) -> TypeAdapter:
+    """
+    TypeAdapter compilé une fois par (template, mode). Chaque élément est validé contre le
+    schéma puis, en cas d'échec, repris tel quel (union gauche-droite avec Any) : un élément
+    invalide n'interrompt pas la validation du lot.
+    """
+    isolated = Annotated[Union[_item_type(template_type, lax_prices), Any], Field(union_mode="left_to_right")]
+    return TypeAdapter(list[isolated])
+
+
+def validate_batch(template_type: str, raw_list: list[dict],
+                   lax_prices: bool = False) -> tuple[list[BaseModel], list[dict]]:
     """
     Valide un batch de dicts. Retourne (valides, erreurs).
     Les erreurs contiennent l'index et le message d'erreur.
     """
     schema_class = get_schema_for_template(template_type)
-    valid = []
-    errors = []
-    for i, item in enumerate(raw_list):
+    results = get_batch_adapter(template_type, lax_prices).validate_python(raw_list)
+    valid, errors = [], []
+    for i, result in enumerate(results):
+        if isinstance(result, schema_class):
+            valid.append(result)
+            continue
+        # Rejet : seul l'élément fautif est revalidé (prix déjà convertis, schéma strict), pour le message
+        item = _coerce_prices(_price_fields(schema_class), raw_list[i]) if lax_prices else raw_list[i]
         try:
-            valid.append(schema_class.model_validate(item))
-        except Exception as e:
-            errors.append({"index": i, "data": item, "error": str(e)[:300]})
+            get_item_adapter(template_type).validate_python(item)
+            error = "élément rejeté"
+        except ValidationError as e:
+            error = _format_errors(e.errors(include_url=False, include_input=False))
+        errors.append({"index": i, "data": raw_list[i], "error": error})
     return valid, errors
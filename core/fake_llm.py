@@ -0,0 +1,260 @@
+"""
+MODULE 26 — Fake LLM (Doublure locale de Gemini pour tests et bancs de charge)
+Permet d'exercer Scout, Logic Miner, Market Probe, Pivot EAN, Vision Analyzer et
+l'AI Parser sans clé Gemini :
+  - rejeu : une réponse enregistrée (backend "record", data/llm_recordings/<clé>.json)
+    est renvoyée telle quelle pour la même requête
+  - synthèse : sinon, un JSON conforme au prompt reconnu (CatalogueItem / RegleItem de
+    l'AI Parser, prompts vision, AST juridique, lots EAN / marché avec leurs "id"),
+    déterministe pour une même requête
+  - injection : latence (moyenne + gigue), taux de 429 et taux de réponses invalides
+    (JSON tronqué ou entouré de texte)
+Utilisable dans le process (backend "fake") ou comme serveur HTTP (backend "http").
+
+Usage:
+    python -m core.fake_llm --port 8765 --latency-ms 800 --rate-429 0.05 --malformed 0.02
+    # puis LLM_BACKEND=http LLM_FAKE_URL=http://127.0.0.1:8765
+
+    fake = FakeLlm(latency_ms=0)
+    status, text = fake.respond(key, prompt)
+"""
+import re
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from pathlib import Path
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from core.config import DATA_DIR
+
+logger = logging.getLogger("fake_llm")
+
+LLM_RECORDINGS_DIR = DATA_DIR / "llm_recordings"
+
+BATCH_ID_RE = re.compile(r"=== PRODUIT id=(\w+) ===")
+ENSEIGNE_RE = re.compile(r"Enseigne probable : (.+)")
+URL_RE = re.compile(r"URL source : (\S+)")
+
+BRANDS = ["Oral-B", "Pampers", "Nivea", "L'Oréal", "Gillette", "Philips", "Lavazza", "Ariel", "Lego", "Samsung"]
+PRODUCTS = ["Brosse à dents iO 5", "Couches Baby-Dry T4", "Crème Soft 300ml", "Shampooing Elseve 250ml",
+            "Rasoir Fusion5 ProGlide", "Tondeuse OneBlade", "Café Qualità Oro 1kg", "Lessive Pods x40",
+            "Coffret Classic 10698", "Écouteurs Galaxy Buds"]
+PROMO_TYPES = ["REMISE_IMMEDIATE", "LOT", "2EME_GRATUIT", "POURCENTAGE", None]
+LEVER_TYPES = ["COUPON", "ODR", "FIDELITE", "REMISE_IMMEDIATE", "MULTI_ACHAT", "CASHBACK"]
+
+
+def _ean13(rng: random.Random) -> str:
+    digits = [3] + [rng.randint(0, 9) for _ in range(11)]
+    checksum = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return "".join(map(str, digits + [checksum]))
+
+
+def _id(value: str):
+    return int(value) if value.isdigit() else value
+
+
+def _catalogue_items(rng: random.Random, prompt: str) -> list[dict]:
+    enseigne = ENSEIGNE_RE.search(prompt)
+    source_url = URL_RE.search(prompt)
+    items = []
+    for _ in range(rng.randint(3, 12)):
+        prix_barre = round(rng.uniform(2, 150), 2)
+        prix = round(prix_barre * rng.uniform(0.5, 0.95), 2)
+        items.append({
+            "ean": _ean13(rng) if rng.random() < 0.6 else None,
+            "nom_produit": rng.choice(PRODUCTS),
+            "marque": rng.choice(BRANDS),
+            "categorie": rng.choice(["Hygiène", "Alimentaire", "Bébé", "High-Tech"]),
+            "prix_public": prix,
+            "prix_initial_barre": prix_barre,
+            "promo_directe_type": rng.choice(PROMO_TYPES),
+            "remise_immediate": round(prix_barre - prix, 2),
+            "enseigne": enseigne.group(1).strip() if enseigne else "Inconnue",
+            "source_url": source_url.group(1) if source_url else None,
+            "date_fin_promo": (date.today() + timedelta(days=rng.randint(1, 21))).isoformat(),
+        })
+    return items
+
+
+def _regle_items(rng: random.Random, prompt: str) -> list[dict]:
+    enseigne = ENSEIGNE_RE.search(prompt)
+    return [{
+        "type_levier": rng.choice(LEVER_TYPES),
+        "description": f"Offre fictive {i + 1} sur la marque",
+        "valeur_absolue": round(rng.uniform(0, 10), 2),
+        "valeur_pourcentage": float(rng.choice([0, 10, 20, 30])),
+        "enseigne_cible": enseigne.group(1).strip() if enseigne else "Inconnue",
+        "marque_cible": rng.choice(BRANDS),
+        "conditions": [{"champ": "montant_min", "operateur": ">=", "valeur": str(rng.randint(10, 60))}],
+        "confidence": round(rng.uniform(0.5, 1.0), 2),
+    } for i in range(rng.randint(1, 5))]
+
+
+def _vision_items(rng: random.Random) -> list[dict]:
+    items = []
+    for _ in range(rng.randint(3, 12)):
+        base = round(rng.uniform(2, 150), 2)
+        final = round(base * rng.uniform(0.5, 0.95), 2)
+        items.append({
+            "brand": rng.choice(BRANDS), "product_name": rng.choice(PRODUCTS),
+            "ean": _ean13(rng) if rng.random() < 0.3 else None,
+            "base_price": base, "discount_type": "MONTANT", "discount_value": round(base - final, 2),
+            "discount_description": f"-{round(base - final, 2)}€", "loyalty_benefit": None,
+            "odr_mentioned": rng.random() < 0.2, "odr_available": False,
+            "final_displayed_price": final, "final_net_price": final,
+            "confidence_score": rng.randint(60, 98), "reliability_score": rng.randint(60, 98),
+        })
+    return items
+
+
+def _legal_rules(rng: random.Random) -> dict:
+    return {
+        "enseigne": "Inconnue",
+        "type_programme": "CGV_PROMO",
+        "rules": [{
+            "rule_id": f"R{i + 1}",
+            "description_fr": "Règle fictive de cumul",
+            "ast": {"operator": "AND", "conditions": [
+                {"type": rng.choice(["CUMUL_AUTORISE", "CUMUL_INTERDIT", "REQUIERT_CARTE"]),
+                 "value": "true", "details": ""}
+            ]},
+        } for i in range(rng.randint(1, 4))],
+        "global_flags": {},
+    }
+
+
+def synthesize(key: str, prompt: str) -> str:
+    """JSON conforme au prompt reconnu, déterministe pour une même clé."""
+    rng = random.Random(key)
+    ids = BATCH_ID_RE.findall(prompt)
+    if ids and "ean_found" in prompt:
+        data = [{"id": _id(i), "ean_found": _ean13(rng) if rng.random() < 0.8 else None,
+                 "confidence": rng.randint(50, 98), "source_hint": "fake"} for i in ids]
+    elif ids and "buy_box_price" in prompt:
+        data = [{"id": _id(i), "product_found": rng.random() < 0.85,
+                 "asin": "B0" + "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(8)),
+                 "buy_box_price": round(rng.uniform(5, 200), 2), "seller_count": rng.randint(1, 30),
+                 "bsr_estimate": rng.randint(100, 200000), "fba_available": rng.random() < 0.6,
+                 "category": "Hygiène", "confidence": rng.randint(50, 95)} for i in ids]
+    elif "type_programme" in prompt:
+        data = _legal_rules(rng)
+    elif '"type_levier"' in prompt:
+        data = _regle_items(rng, prompt)
+    elif '"nom_produit"' in prompt:
+        data = _catalogue_items(rng, prompt)
+    elif "product_name" in prompt:
+        data = _vision_items(rng)
+    else:
+        data = {}
+    return json.dumps(data, ensure_ascii=False)
+
+
+class FakeLlm:
+    """Rejeu des enregistrements, synthèse sinon, avec défaillances injectées."""
+
+    def __init__(self, recordings_dir: Path = LLM_RECORDINGS_DIR, latency_ms: float = 0,
+                 jitter_ms: float = 0, rate_429: float = 0.0, malformed_rate: float = 0.0, seed: int = None):
+        self.recordings_dir = Path(recordings_dir)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "replayed": 0, "synthesized": 0, "throttled": 0, "malformed": 0}
+
+    def _recorded(self, key: str):
+        path = self.recordings_dir / f"{key}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))["response"]
+
+    def _draw(self) -> tuple[float, float, float]:
+        with self._lock:
+            return self._rng.gauss(0, 1), self._rng.random(), self._rng.random()
+
+    def respond(self, key: str, prompt: str) -> tuple[int, str]:
+        """Retourne (code HTTP, texte). 429 = quota simulé."""
+        noise, throttle, malformed = self._draw()
+        self.stats["requests"] += 1
+        delay_ms = max(0.0, self.latency_ms + noise * self.jitter_ms)
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        if throttle < self.rate_429:
+            self.stats["throttled"] += 1
+            return 429, "Resource has been exhausted (e.g. check quota)."
+
+        text = self._recorded(key)
+        if text is not None:
+            self.stats["replayed"] += 1
+        else:
+            self.stats["synthesized"] += 1
+            text = synthesize(key, prompt)
+        if malformed < self.malformed_rate:
+            self.stats["malformed"] += 1
+            text = text[: len(text) // 2] if len(text) > 2 else "Voici le JSON demandé : " + text
+        return 200, text
+
+
+def make_handler(fake: FakeLlm):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, fake.stats)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/generate":
+                self._send(404, {"error": "not found"})
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            status, text = fake.respond(payload.get("key", ""), payload.get("prompt", ""))
+            self._send(status, {"text": text} if status == 200 else {"error": text})
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt % args)
+
+    return Handler
+
+
+def serve(fake: FakeLlm, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Démarre le serveur dans un thread et le retourne (server.shutdown() pour l'arrêter)."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cli = argparse.ArgumentParser(description="Doublure locale de Gemini (rejeu + synthèse).")
+    cli.add_argument("--host", default="127.0.0.1")
+    cli.add_argument("--port", type=int, default=8765)
+    cli.add_argument("--recordings", default=str(LLM_RECORDINGS_DIR))
+    cli.add_argument("--latency-ms", type=float, default=800)
+    cli.add_argument("--jitter-ms", type=float, default=200)
+    cli.add_argument("--rate-429", type=float, default=0.0)
+    cli.add_argument("--malformed", type=float, default=0.0)
+    cli.add_argument("--seed", type=int, default=None)
+    args = cli.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeLlm(
+        args.recordings, args.latency_ms, args.jitter_ms, args.rate_429, args.malformed, args.seed
+    )))
+    logger.info(f"Fake LLM à l'écoute sur http://{args.host}:{args.port} (POST /generate, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,208 @@
+"""
+MODULE 24 — Flyer Tiler (Découpage des captures en tuiles pour la vision)
+Une capture full-page de catalogue peut dépasser 10 000 px de haut : envoyée d'un bloc,
+le modèle la sous-échantillonne (petits caractères illisibles) et l'appel est lent.
+Le tiler découpe la capture en bandes horizontales qui se chevauchent (TILE_HEIGHT,
+TILE_OVERLAP), les analyse en parallèle via le client LLM partagé et rend chaque
+produit dès qu'il est lu : un produit à cheval sur deux tuiles voisines (même nom /
+marque, prix égal ou absent d'un côté) n'est rendu qu'une fois, le doublon complétant
+les champs manquants de la version déjà rendue.
+
+Usage:
+    from core.flyer_tiler import iter_tiled, iter_tiled_sync, analyze_tiled
+    async for product in iter_tiled(img, VISION_EXTRACTION_PROMPT, namespace="scout"):
+        ...
+    for product in iter_tiled_sync(img, prompt, namespace="ai_parser"):   # depuis un thread
+        ...
+    products = await analyze_tiled(img, prompt)                           # liste complète
+"""
+import re
+import queue
+import asyncio
+import logging
+import contextvars
+import unicodedata
+from typing import AsyncIterator, Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from core.config import TILE_HEIGHT, TILE_OVERLAP, TILE_MAX_WIDTH, BUDGET_LLM_SLOTS
+from core.llm_client import llm_client, DEFAULT_MODEL
+
+logger = logging.getLogger("flyer_tiler")
+
+# Champs équivalents selon le schéma du prompt (Scout / Vision Analyzer / AI Parser)
+NAME_FIELDS = ("product_name", "nom_produit")
+BRAND_FIELDS = ("brand", "marque")
+PRICE_FIELDS = ("final_displayed_price", "final_net_price", "prix_public", "base_price")
+
+
+def split_tiles(img: Image.Image, tile_height: int = TILE_HEIGHT, overlap: int = TILE_OVERLAP,
+                max_width: int = TILE_MAX_WIDTH) -> list[Image.Image]:
+    """Bandes horizontales de `tile_height` px (après mise à largeur max) se chevauchant de `overlap` px."""
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if img.width > max_width:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+    # Une capture à peine plus haute qu'une tuile n'est pas découpée
+    if img.height <= tile_height * 1.25:
+        return [img]
+    step = max(1, tile_height - overlap)
+    # La dernière tuile est calée sur le bas de la capture (pleine hauteur, chevauchement plus large)
+    tops = list(range(0, img.height - tile_height, step)) + [img.height - tile_height]
+    return [img.crop((0, top, img.width, top + tile_height)) for top in tops]
+
+
+def _first(item: dict, fields: tuple):
+    for field in fields:
+        if item.get(field) not in (None, ""):
+            return item[field]
+    return None
+
+
+def _norm(value) -> str:
+    text = unicodedata.normalize("NFKD", str(value or "").lower()).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def _price(item: dict):
+    value = _first(item, PRICE_FIELDS)
+    try:
+        return round(float(str(value).replace(",", ".").replace("€", "").strip()), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+class TileMerger:
+    """
+    Dédoublonnage au fil de l'eau : un produit n'est comparé qu'aux produits déjà gardés des
+    tuiles voisines (i - 1, i + 1), seules à partager une bande de chevauchement. Deux produits
+    homonymes éloignés dans le prospectus restent distincts.
+    """
+
+    def __init__(self):
+        self._index: dict[tuple, list[tuple[int, dict]]] = {}   # (nom, marque) -> [(tuile, produit gardé)]
+        self.seen = 0
+        self.kept = 0
+
+    def add(self, tile: int, item) -> bool:
+        """True si `item` est nouveau (à rendre) ; sinon il complète le doublon déjà rendu."""
+        if not isinstance(item, dict):
+            return False
+        self.seen += 1
+        name = _norm(_first(item, NAME_FIELDS))
+        if name:
+            key = (name, _norm(_first(item, BRAND_FIELDS)))
+            price = _price(item)
+            duplicate = next(
+                (kept for kept_tile, kept in self._index.get(key, [])
+                 if abs(kept_tile - tile) == 1 and (price is None or _price(kept) in (None, price))),
+                None,
+            )
+            if duplicate is not None:
+                for field, value in item.items():  # complète la version déjà gardée
+                    if duplicate.get(field) in (None, "") and value not in (None, ""):
+                        duplicate[field] = value
+                self._index[key].append((tile, duplicate))  # vu aussi dans cette tuile
+                return False
+            self._index.setdefault(key, []).append((tile, item))
+        self.kept += 1
+        return True
+
+
+def merge_products(tile_results: list[list[dict]]) -> list[dict]:
+    """Fusionne les listes par tuile (dans l'ordre des tuiles) en dédoublonnant les chevauchements."""
+    merger = TileMerger()
+    return [item for tile, products in enumerate(tile_results) for item in products if merger.add(tile, item)]
+
+
+def _log_merge(tiles: int, failed: int, merger: TileMerger):
+    if failed and failed == tiles:
+        raise RuntimeError(f"Aucune des {tiles} tuiles n'a pu être analysée.")
+    if tiles > 1:
+        logger.info(f"  Vision: {tiles} tuiles, {merger.seen} produits bruts -> {merger.kept} après fusion.")
+
+
+async def iter_tiled(img: Image.Image, prompt: str, namespace: str = "default",
+                     model_name: str = DEFAULT_MODEL) -> AsyncIterator[dict]:
+    """
+    Tuiles analysées en parallèle (client LLM partagé, réponses lues en flux) ; chaque produit
+    est rendu dès que son objet JSON est complet, sauf s'il double un produit déjà rendu.
+    """
+    tiles = split_tiles(img)
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    failed = 0
+
+    async def read(index: int, tile: Image.Image):
+        nonlocal failed
+        try:
+            async for item in llm_client.stream_items([prompt, tile], namespace=namespace, model_name=model_name):
+                queue.put_nowait((index, item))
+        except Exception as e:
+            failed += 1
+            logger.warning(f"  Tuile {index + 1}/{len(tiles)} ignorée: {e}")
+        finally:
+            queue.put_nowait(done)
+
+    readers = [asyncio.create_task(read(i, tile)) for i, tile in enumerate(tiles)]
+    merger = TileMerger()
+    try:
+        pending = len(readers)
+        while pending:
+            entry = await queue.get()
+            if entry is done:
+                pending -= 1
+            elif merger.add(*entry):
+                yield entry[1]
+    finally:
+        for reader in readers:
+            reader.cancel()
+    _log_merge(len(tiles), failed, merger)
+
+
+async def analyze_tiled(img: Image.Image, prompt: str, namespace: str = "default",
+                        model_name: str = DEFAULT_MODEL) -> list[dict]:
+    """Liste fusionnée des produits de toutes les tuiles (voir iter_tiled)."""
+    return [item async for item in iter_tiled(img, prompt, namespace, model_name)]
+
+
+def iter_tiled_sync(img: Image.Image, prompt: str, namespace: str = "default",
+                    model_name: str = DEFAULT_MODEL) -> Iterator[dict]:
+    """Variante bloquante de iter_tiled : tuiles lues dans un pool de threads, produits rendus au fil de l'eau."""
+    tiles = split_tiles(img)
+    results: queue.Queue = queue.Queue()
+    done = object()
+    failed = 0
+
+    def read(index: int, tile: Image.Image):
+        nonlocal failed
+        try:
+            for item in llm_client.stream_items_sync([prompt, tile], namespace=namespace, model_name=model_name):
+                results.put((index, item))
+        except Exception as e:
+            failed += 1
+            logger.warning(f"  Tuile {index + 1}/{len(tiles)} ignorée: {e}")
+        finally:
+            results.put(done)
+
+    merger = TileMerger()
+    with ThreadPoolExecutor(max_workers=min(len(tiles), BUDGET_LLM_SLOTS)) as pool:
+        # Contexte copié par tuile : les appels restent attribués à l'agent / la mission appelante
+        for i, tile in enumerate(tiles):
+            pool.submit(contextvars.copy_context().run, read, i, tile)
+        pending = len(tiles)
+        while pending:
+            entry = results.get()
+            if entry is done:
+                pending -= 1
+            elif merger.add(*entry):
+                yield entry[1]
+    _log_merge(len(tiles), failed, merger)
+
+
+def analyze_tiled_sync(img: Image.Image, prompt: str, namespace: str = "default",
+                       model_name: str = DEFAULT_MODEL) -> list[dict]:
+    """Liste fusionnée des produits de toutes les tuiles (voir iter_tiled_sync)."""
+    return list(iter_tiled_sync(img, prompt, namespace, model_name))
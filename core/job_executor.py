@@ -0,0 +1,218 @@
+"""
+MODULE 16 — Job Executor (Runtime durable au-dessus de la JobQueue)
+Toute exécution lourde passe par la file : runs d'Agents et de Missions, Collision,
+Market Fetch. Un exécuteur réclame les jobs par priorité (leases + heartbeat),
+les exécute via le handler enregistré pour leur task_type et applique le cycle de vie :
+  - succès  -> DONE
+  - échec   -> PENDING avec backoff exponentiel, puis FAILED (dead-letter)
+Chaque task_type dispose de son propre quota de slots : une Mission Vision de
+10 minutes ne peut pas occuper les slots d'un Market Fetch ou d'une Collision.
+Un redémarrage ne perd rien : les jobs RUNNING dont le bail expire sont repris.
+Sur Postgres, l'exécuteur écoute le canal NOTIFY de la file et se réveille dès qu'un
+job est enfilé (les étapes du pipeline s'enchaînent sans attendre la scrutation).
+
+Usage:
+    from core.job_executor import register_handler, JobExecutor
+
+    @register_handler("MY_TASK")
+    async def my_task(job: dict):
+        ...   # lever une exception = échec (retry)
+
+    await JobExecutor("node-1").run_forever()
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import os
+import math
+import time
+import select
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable
+
+from core.job_queue import lease_jobs, keep_alive, complete_job, fail_job, DEFAULT_LEASE_S, NOTIFY_CHANNEL
+from core.models import engine
+from core.resource_budget import resource_budget
+
+logger = logging.getLogger("job_executor")
+
+TASK_AGENT_RUN = "AGENT_RUN"
+TASK_MISSION_RUN = "MISSION_RUN"
+TASK_COLLISION_RUN = "COLLISION_RUN"
+TASK_MARKET_FETCH = "MARKET_FETCH"
+TASK_SCOUT = "SCOUT"  # Bouton "Start" de la Minion Factory (alias d'AGENT_RUN)
+
+# Priorité par défaut (plus bas = plus tôt) : les jobs courts passent devant les extractions
+TASK_PRIORITY = {
+    TASK_MARKET_FETCH: 8,
+    TASK_COLLISION_RUN: 8,
+    TASK_AGENT_RUN: 10,
+    TASK_MISSION_RUN: 10,
+}
+
+# Slots simultanés par task_type pour un exécuteur
+DEFAULT_TASK_SLOTS = {
+    TASK_AGENT_RUN: 2,
+    TASK_SCOUT: 1,
+    TASK_MISSION_RUN: 2,
+    TASK_COLLISION_RUN: 1,
+    TASK_MARKET_FETCH: 1,
+}
+
+JobHandler = Callable[[dict], Awaitable[None]]
+HANDLERS: dict[str, JobHandler] = {}
+
+
+def register_handler(task_type: str, slots: int = 1):
+    """Décorateur : associe un handler async(job: dict) à un task_type (`slots` par défaut par exécuteur)."""
+    def decorator(func: JobHandler) -> JobHandler:
+        HANDLERS[task_type] = func
+        DEFAULT_TASK_SLOTS.setdefault(task_type, slots)
+        return func
+    return decorator
+
+
+@register_handler(TASK_COLLISION_RUN)
+async def _run_collision(job: dict):
+    from engine.collision_engine import CollisionEngine
+    min_roi = job["payload"].get("min_roi_percent", 15.0)
+    result = await asyncio.to_thread(CollisionEngine(min_roi_percent=min_roi).run_collision)
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+
+
+@register_handler(TASK_MARKET_FETCH)
+async def _run_market_fetch(job: dict):
+    from core.market_fetcher import MarketFetcher
+    from core.config import MARKET_REFRESH_BUDGET
+    refresh_budget = job["payload"].get("refresh_budget", MARKET_REFRESH_BUDGET)
+    await MarketFetcher().run_batch_async(refresh_budget=refresh_budget)
+
+
+class JobExecutor:
+    """Boucle de consommation de la JobQueue pour un nœud (process) donné."""
+
+    def __init__(self, worker_id: str, slots: dict[str, int] = None,
+                 poll_s: float = 2.0, lease_s: int = DEFAULT_LEASE_S,
+                 stats_queue=None, stats_interval_s: float = 30.0, pool_size: int = 1):
+        self.worker_id = worker_id
+        self.stats_queue = stats_queue  # multiprocessing.Queue du superviseur (optionnel)
+        self.stats_interval_s = stats_interval_s
+        # Pool de `pool_size` process sur l'hôte : chaque exécuteur prend sa part des slots (au moins 1)
+        self.slots = {
+            task_type: max(1, math.ceil(limit / max(1, pool_size)))
+            for task_type, limit in (DEFAULT_TASK_SLOTS if slots is None else slots).items()
+        }
+        self.poll_s = poll_s
+        self.lease_s = lease_s
+        self.running: dict[str, set[asyncio.Task]] = {t: set() for t in self.slots}
+        self.stats: dict[str, dict] = {}
+        self._wakeup: asyncio.Event = None
+
+    def _record(self, task_type: str, ok: bool, duration_s: float):
+        entry = self.stats.setdefault(task_type, {"done": 0, "failed": 0, "total_s": 0.0})
+        entry["done" if ok else "failed"] += 1
+        entry["total_s"] += duration_s
+
+    async def _execute(self, job: dict):
+        task_type = job["task_type"]
+        handler = HANDLERS.get(task_type)
+        heartbeat_task = asyncio.create_task(keep_alive(job["id"], self.worker_id, self.lease_s))
+        started = time.time()
+        try:
+            if handler is None:
+                raise RuntimeError(f"Aucun handler enregistré pour '{task_type}'.")
+            await handler(job)
+            await asyncio.to_thread(complete_job, job["id"], self.worker_id)
+            self._record(task_type, True, time.time() - started)
+            logger.info(f"  [{self.worker_id}] Job {job['id']} {task_type} OK ({time.time() - started:.1f}s)")
+        except Exception as e:
+            status = await asyncio.to_thread(fail_job, job["id"], self.worker_id, str(e))
+            self._record(task_type, False, time.time() - started)
+            logger.error(f"  [{self.worker_id}] Job {job['id']} {task_type} en échec -> {status}: {e}")
+        finally:
+            heartbeat_task.cancel()
+
+    def _free_slots(self) -> dict[str, int]:
+        return {
+            task_type: limit - len(self.running[task_type])
+            for task_type, limit in self.slots.items()
+            if task_type in HANDLERS and limit - len(self.running[task_type]) > 0
+        }
+
+    async def poll_once(self) -> int:
+        """Réclame des jobs pour chaque task_type ayant des slots libres. Retourne le nombre lancé."""
+        launched = 0
+        for task_type, free in self._free_slots().items():
+            jobs = await asyncio.to_thread(
+                lease_jobs, self.worker_id, [task_type], free, self.lease_s
+            )
+            for job in jobs:
+                task = asyncio.create_task(self._execute(job))
+                self.running[task_type].add(task)
+                task.add_done_callback(self.running[task_type].discard)
+                launched += 1
+        return launched
+
+    def stats_snapshot(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "pid": os.getpid(),
+            "at": time.time(),
+            "running": {t: len(tasks) for t, tasks in self.running.items() if tasks},
+            "tasks": {t: dict(v) for t, v in self.stats.items()},
+            "budget": resource_budget.snapshot(),
+        }
+
+    async def _publish_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval_s)
+            try:
+                self.stats_queue.put_nowait(self.stats_snapshot())
+            except Exception as e:
+                logger.debug(f"Publication des stats impossible: {e}")
+
+    def _listen_notifications(self, loop: asyncio.AbstractEventLoop):
+        """Thread LISTEN Postgres : réveille la boucle à chaque job enfilé."""
+        while True:
+            try:
+                conn = engine.raw_connection()
+                dbapi_conn = conn.driver_connection
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while True:
+                    if select.select([dbapi_conn], [], [], 60) == ([], [], []):
+                        continue
+                    dbapi_conn.poll()
+                    if dbapi_conn.notifies:
+                        dbapi_conn.notifies.clear()
+                        loop.call_soon_threadsafe(self._wakeup.set)
+            except Exception as e:
+                logger.warning(f"LISTEN {NOTIFY_CHANNEL} interrompu ({e}), reconnexion dans 10s.")
+                time.sleep(10)
+
+    async def _idle(self, seconds: float):
+        """Attend `seconds` ou un NOTIFY de la file, au premier des deux."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def run_forever(self):
+        logger.info(f"Exécuteur {self.worker_id} démarré (slots={self.slots}).")
+        self._wakeup = asyncio.Event()
+        if engine.dialect.name == "postgresql":
+            threading.Thread(
+                target=self._listen_notifications, args=(asyncio.get_running_loop(),), daemon=True
+            ).start()
+        if self.stats_queue is not None:
+            self._stats_task = asyncio.create_task(self._publish_stats())
+        while True:
+            launched = await self.poll_once()
+            # File active : on re-scrute vite ; file vide : intervalle normal (ou NOTIFY)
+            await self._idle(0.2 if launched else self.poll_s)
@@ -0,0 +1,352 @@
+"""
+MODULE 12 — Job Queue (Leases sur la table JobQueue)
+Primitives de file de travail partagée entre plusieurs process / machines :
+  - Postgres : SELECT ... FOR UPDATE SKIP LOCKED (aucun verrou bloquant entre workers)
+  - SQLite   : compare-and-set sur le statut (les écritures SQLite sont sérialisées)
+Chaque job réclamé porte un bail (lease_expires_at) prolongé par heartbeat.
+Un bail expiré (worker mort) compte comme un échec : retry_count incrémenté, backoff
+de `fail_job`, FAILED au-delà de max_retries (un job qui tue son worker ne boucle pas).
+Priorité : plus la valeur est BASSE, plus le job passe tôt (5 = manuel, 10 = défaut).
+Dead-letter : un job qui épuise max_retries reste FAILED jusqu'à `requeue_failed`.
+Sur Postgres, chaque enqueue émet un NOTIFY (canal `staff_jobs`, délivré au commit)
+qui réveille immédiatement les exécuteurs en LISTEN au lieu d'attendre leur scrutation.
+
+Usage:
+    from core.job_queue import enqueue, lease_jobs, heartbeat, complete_job, fail_job
+    jobs = lease_jobs("node-1", task_types=["MISSION_URL"], limit=4)
+    for job in jobs:
+        ...
+        complete_job(job["id"], "node-1")
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, text
+from core.models import SessionLocal, JobQueue, engine
+
+logger = logging.getLogger("job_queue")
+
+DEFAULT_LEASE_S = 300
+DEFAULT_BACKOFF_S = 30
+OPEN_STATUSES = ("PENDING", "RUNNING")
+NOTIFY_CHANNEL = "staff_jobs"
+
+
+def _claimable_filter(now: datetime):
+    """Jobs PENDING échus (les baux expirés sont d'abord repassés PENDING / FAILED par `_expire_leases`)."""
+    return and_(JobQueue.status == "PENDING", JobQueue.next_retry_at <= now)
+
+
+def _record_failure(job: JobQueue, error: str, backoff_s: int, now: datetime):
+    """
+    Incrémente retry_count : PENDING avec backoff exponentiel (worker libéré), ou FAILED si
+    max_retries est dépassé (le dernier worker reste noté pour le diagnostic).
+    """
+    job.retry_count = (job.retry_count or 0) + 1
+    job.error_message = (error or "")[:2000]
+    job.lease_expires_at = None
+    if job.retry_count > (job.max_retries or 0):
+        job.status = "FAILED"
+    else:
+        delay = backoff_s * (2 ** (job.retry_count - 1))
+        job.status = "PENDING"
+        job.worker_id = None
+        job.next_retry_at = now + timedelta(seconds=delay)
+
+
+def _failure_values(job: JobQueue) -> dict:
+    """Colonnes écrites par le compare-and-set d'un échec (après `_record_failure`)."""
+    return {
+        "status": job.status, "retry_count": job.retry_count, "error_message": job.error_message,
+        "worker_id": job.worker_id, "lease_expires_at": None, "next_retry_at": job.next_retry_at,
+    }
+
+
+def _expire_leases(db, now: datetime, task_types: list[str] = None, backoff_s: int = DEFAULT_BACKOFF_S) -> int:
+    """
+    Jobs RUNNING dont le bail a expiré (worker disparu) : comptés comme un échec.
+    Compare-and-set sur (statut, worker, bail) : un seul worker enregistre l'expiration.
+    """
+    query = db.query(JobQueue).filter(
+        JobQueue.status == "RUNNING", JobQueue.lease_expires_at != None, JobQueue.lease_expires_at < now,
+    )
+    if task_types:
+        query = query.filter(JobQueue.task_type.in_(task_types))
+    expired = 0
+    for job in query.all():
+        previous = (job.worker_id, job.lease_expires_at)
+        _record_failure(job, f"Bail expiré (worker {previous[0]} disparu)", backoff_s, now)
+        updated = db.query(JobQueue).filter(
+            JobQueue.id == job.id, JobQueue.status == "RUNNING",
+            JobQueue.worker_id == previous[0], JobQueue.lease_expires_at == previous[1],
+        ).update(_failure_values(job), synchronize_session=False)
+        job_id, status = job.id, job.status
+        db.expire(job)
+        if updated == 1:
+            expired += 1
+            logger.warning(f"  Job {job_id}: bail expiré ({previous[0]}), tentative comptée -> {status}.")
+    db.commit()
+    return expired
+
+
+def _job_to_dict(job: JobQueue) -> dict:
+    return {
+        "id": job.id,
+        "task_type": job.task_type,
+        "target_id": job.target_id,
+        "payload": job.payload or {},
+        "priority": job.priority,
+        "retry_count": job.retry_count or 0,
+        "max_retries": job.max_retries,
+    }
+
+
+def enqueue(task_type: str, target_id: str = None, payload: dict = None,
+            priority: int = 10, max_retries: int = 3, db=None, unique: bool = False) -> int:
+    """
+    Ajoute un job PENDING. Si `db` est fourni, le commit est laissé à l'appelant.
+    `unique=True` : retourne l'id du job ouvert existant pour (task_type, target_id) au lieu d'en créer un.
+    """
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        if unique:
+            existing = db.query(JobQueue.id).filter(
+                JobQueue.task_type == task_type,
+                JobQueue.target_id == target_id,
+                JobQueue.status.in_(OPEN_STATUSES),
+            ).first()
+            if existing:
+                return existing.id
+
+        job = JobQueue(
+            task_type=task_type, target_id=target_id, payload=payload or {},
+            status="PENDING", priority=priority, max_retries=max_retries,
+            next_retry_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.flush()
+        job_id = job.id
+        if engine.dialect.name == "postgresql":
+            db.execute(text("SELECT pg_notify(:channel, :task_type)"),
+                       {"channel": NOTIFY_CHANNEL, "task_type": task_type})
+        if own_session:
+            db.commit()
+        return job_id
+    except Exception:
+        if own_session:
+            db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def lease_jobs(worker_id: str, task_types: list[str] = None, limit: int = 1,
+               lease_s: int = DEFAULT_LEASE_S) -> list[dict]:
+    """Réclame jusqu'à `limit` jobs par ordre de priorité puis d'ancienneté."""
+    db = SessionLocal()
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_s)
+    claimed = []
+    try:
+        _expire_leases(db, now, task_types)
+        query = db.query(JobQueue).filter(_claimable_filter(now))
+        if task_types:
+            query = query.filter(JobQueue.task_type.in_(task_types))
+        query = query.order_by(JobQueue.priority.asc(), JobQueue.id.asc())
+
+        if engine.dialect.name == "postgresql":
+            for job in query.with_for_update(skip_locked=True).limit(limit).all():
+                job.status = "RUNNING"
+                job.worker_id = worker_id
+                job.lease_expires_at = lease_until
+                job.started_at = now
+                claimed.append(_job_to_dict(job))
+            db.commit()
+            return claimed
+
+        # SQLite : sur-sélection puis compare-and-set ligne par ligne
+        candidates = [row.id for row in query.with_entities(JobQueue.id).limit(limit * 3).all()]
+        for job_id in candidates:
+            if len(claimed) >= limit:
+                break
+            updated = db.query(JobQueue).filter(
+                JobQueue.id == job_id, _claimable_filter(now)
+            ).update({
+                "status": "RUNNING",
+                "worker_id": worker_id,
+                "lease_expires_at": lease_until,
+                "started_at": now,
+            }, synchronize_session=False)
+            db.commit()
+            if updated == 1:
+                job = db.query(JobQueue).filter(JobQueue.id == job_id).first()
+                claimed.append(_job_to_dict(job))
+        return claimed
+    except Exception as e:
+        logger.error(f"Lease JobQueue échoué ({worker_id}): {e}")
+        db.rollback()
+        return claimed
+    finally:
+        db.close()
+
+
+def heartbeat(job_id: int, worker_id: str, lease_s: int = DEFAULT_LEASE_S) -> bool:
+    """Prolonge le bail. Retourne False si le job a été repris par un autre worker."""
+    db = SessionLocal()
+    try:
+        updated = db.query(JobQueue).filter(
+            JobQueue.id == job_id,
+            JobQueue.worker_id == worker_id,
+            JobQueue.status == "RUNNING",
+        ).update({
+            "lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_s),
+        }, synchronize_session=False)
+        db.commit()
+        return updated == 1
+    except Exception as e:
+        logger.warning(f"Heartbeat job {job_id} échoué: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+async def keep_alive(job_id: int, worker_id: str, lease_s: int = DEFAULT_LEASE_S):
+    """Heartbeat périodique à lancer en tâche de fond pendant l'exécution d'un job."""
+    while True:
+        await asyncio.sleep(lease_s / 3)
+        if not await asyncio.to_thread(heartbeat, job_id, worker_id, lease_s):
+            logger.warning(f"  Job {job_id}: bail perdu (repris par un autre worker ?).")
+            return
+
+
+def complete_job(job_id: int, worker_id: str) -> bool:
+    """Marque le job DONE (compare-and-set : uniquement si ce worker détient encore le bail)."""
+    db = SessionLocal()
+    try:
+        updated = db.query(JobQueue).filter(
+            JobQueue.id == job_id, JobQueue.worker_id == worker_id, JobQueue.status == "RUNNING",
+        ).update({
+            "status": "DONE",
+            "lease_expires_at": None,
+            "error_message": None,
+        }, synchronize_session=False)
+        db.commit()
+        return updated == 1
+    except Exception as e:
+        logger.error(f"Complétion job {job_id} échouée: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+def fail_job(job_id: int, worker_id: str, error: str, backoff_s: int = DEFAULT_BACKOFF_S) -> str:
+    """
+    Enregistre un échec. Le job repasse PENDING avec un backoff exponentiel
+    (backoff_s * 2^(retry_count-1)) tant que max_retries n'est pas atteint, sinon FAILED.
+    Compare-and-set sur (id, worker, RUNNING) : un worker dont le bail a expiré (job repris
+    ou déjà compté) n'écrit rien. Retourne le nouveau statut, ou "LOST".
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(JobQueue).filter(
+            JobQueue.id == job_id, JobQueue.worker_id == worker_id, JobQueue.status == "RUNNING",
+        ).first()
+        if not job:
+            return "LOST"
+
+        _record_failure(job, error, backoff_s, datetime.utcnow())
+        values = _failure_values(job)
+        db.expire(job)
+        updated = db.query(JobQueue).filter(
+            JobQueue.id == job_id, JobQueue.worker_id == worker_id, JobQueue.status == "RUNNING",
+        ).update(values, synchronize_session=False)
+        db.commit()
+        return values["status"] if updated == 1 else "LOST"
+    except Exception as e:
+        logger.error(f"Échec job {job_id} non enregistré: {e}")
+        db.rollback()
+        return "UNKNOWN"
+    finally:
+        db.close()
+
+
+def requeue_failed(job_id: int = None, task_type: str = None) -> int:
+    """Sort des jobs de la dead-letter (FAILED -> PENDING, compteur remis à zéro)."""
+    db = SessionLocal()
+    try:
+        query = db.query(JobQueue).filter(JobQueue.status == "FAILED")
+        if job_id is not None:
+            query = query.filter(JobQueue.id == job_id)
+        if task_type:
+            query = query.filter(JobQueue.task_type == task_type)
+        updated = query.update({
+            "status": "PENDING",
+            "retry_count": 0,
+            "worker_id": None,
+            "next_retry_at": datetime.utcnow(),
+        }, synchronize_session=False)
+        db.commit()
+        return updated
+    except Exception as e:
+        logger.error(f"Requeue dead-letter échoué: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+def queue_stats(window_h: int = 24) -> dict:
+    """
+    Profondeur et latence de la file, par task_type :
+      pending / running / failed (dead-letter), oldest_pending_s,
+      avg_wait_s (création -> prise en charge) et avg_run_s sur les jobs DONE de la fenêtre.
+    """
+    db = SessionLocal()
+    now = datetime.utcnow()
+    stats: dict[str, dict] = {}
+    try:
+        for task_type, status, count, oldest in db.query(
+            JobQueue.task_type, JobQueue.status, func.count(JobQueue.id), func.min(JobQueue.created_at)
+        ).group_by(JobQueue.task_type, JobQueue.status).all():
+            entry = stats.setdefault(task_type, {
+                "pending": 0, "running": 0, "failed": 0, "done": 0,
+                "oldest_pending_s": 0.0, "avg_wait_s": None, "avg_run_s": None,
+            })
+            key = (status or "").lower()
+            if key in entry:
+                entry[key] = count
+            if status == "PENDING" and oldest:
+                entry["oldest_pending_s"] = (now - oldest).total_seconds()
+
+        recent = db.query(JobQueue.task_type, JobQueue.created_at, JobQueue.started_at, JobQueue.updated_at).filter(
+            JobQueue.status == "DONE",
+            JobQueue.started_at != None,
+            JobQueue.updated_at >= now - timedelta(hours=window_h),
+        ).all()
+        samples: dict[str, list[tuple[float, float]]] = {}
+        for task_type, created_at, started_at, updated_at in recent:
+            samples.setdefault(task_type, []).append((
+                (started_at - created_at).total_seconds(),
+                (updated_at - started_at).total_seconds(),
+            ))
+        for task_type, values in samples.items():
+            entry = stats.get(task_type)
+            if entry:
+                entry["avg_wait_s"] = sum(w for w, _ in values) / len(values)
+                entry["avg_run_s"] = sum(r for _, r in values) / len(values)
+        return stats
+    except Exception as e:
+        logger.error(f"Statistiques JobQueue indisponibles: {e}")
+        return stats
+    finally:
+        db.close()
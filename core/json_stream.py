@@ -0,0 +1,120 @@
+"""
+MODULE 28 — JSON Stream (Parsing incrémental des listes JSON produites par le LLM)
+Les réponses Scout / vision / AI Parser d'un catalogue dense listent plus de 100
+objets. Le parseur lit la réponse morceau par morceau (génération en flux) et rend
+chaque objet du tableau de premier niveau dès que son accolade fermante arrive :
+  - texte ou balises ```json avant le premier "[" / "{" ignorés
+  - chaînes et échappements suivis (une accolade dans un nom de produit ne compte pas)
+  - listes imbriquées ([[{...}], [{...}]]) : leurs objets sont rendus, seul le "]" du
+    tableau racine termine la lecture ; une valeur non-objet de la liste est ignorée
+  - réponse tronquée : les objets complets déjà lus sont conservés, seul l'objet
+    en cours est perdu ; un objet invalide isolé est écarté sans perdre les autres
+  - une réponse objet unique (au lieu d'une liste) est rendue comme un seul élément
+
+Usage:
+    from core.json_stream import JsonArrayStream, parse_items
+    stream = JsonArrayStream()
+    for chunk in chunks:
+        for obj in stream.feed(chunk):
+            handle(obj)
+    items = parse_items(raw_text)      # récupère les objets complets d'un texte tronqué
+"""
+import json
+import logging
+
+logger = logging.getLogger("json_stream")
+
+
+class JsonArrayStream:
+    """Automate incrémental : rend les objets de premier niveau au fil des morceaux reçus."""
+
+    def __init__(self):
+        self._chunks: list[str] = []   # réponse complète reçue (jointe pour le cache, voir `text`)
+        self.items = 0
+        self.invalid = 0
+        self._buf = ""          # texte non consommé : objet en cours (ou rien entre deux objets)
+        self._pos = 0           # position de lecture dans _buf
+        self._root = None       # "[" ou "{" une fois le début du JSON trouvé
+        self._arrays = 0        # tableaux ouverts hors objet (le tableau racine compris)
+        self._depth = 0         # profondeur dans l'objet en cours
+        self._start = None      # début de l'objet en cours dans _buf
+        self._in_string = False
+        self._escape = False
+        self.closed = False     # tableau (ou objet racine) refermé
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> list:
+        """Ajoute un morceau de réponse ; retourne les objets refermés dans ce morceau."""
+        if chunk:
+            self._chunks.append(chunk)
+        ready = []
+        text = self._buf + (chunk or "")
+        while self._pos < len(text) and not self.closed:
+            char = text[self._pos]
+            if self._root is None:
+                if char in "[{":
+                    self._root = char
+                    if char == "{":  # objet unique : il est lui-même l'élément
+                        self._start, self._depth = self._pos, 1
+                    else:
+                        self._arrays = 1
+                self._pos += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif self._start is not None:
+                if char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._emit(text[self._start:self._pos + 1], ready)
+                        self._start = None
+                        if self._root == "{":
+                            self.closed = True
+            elif char == "{":
+                self._start, self._depth = self._pos, 1
+            elif char == "[":
+                self._arrays += 1  # liste imbriquée : ses objets sont rendus, son "]" ne ferme pas la racine
+            elif char == "]":
+                self._arrays -= 1
+                if self._arrays == 0:
+                    self.closed = True
+            self._pos += 1
+        # Seul l'objet en cours est gardé : pas de recopie du tampon complet à chaque morceau
+        keep = self._start if self._start is not None else self._pos
+        self._buf, self._pos = text[keep:], self._pos - keep
+        if self._start is not None:
+            self._start = 0
+        return ready
+
+    def _emit(self, raw: str, ready: list):
+        try:
+            ready.append(json.loads(raw))
+            self.items += 1
+        except ValueError:
+            self.invalid += 1
+
+    @property
+    def truncated(self) -> bool:
+        """Vrai si la réponse s'arrête avant la fin du tableau (ou sans JSON du tout)."""
+        return not self.closed
+
+
+def parse_items(text: str) -> list:
+    """Liste des objets complets d'une réponse (tronquée ou non)."""
+    stream = JsonArrayStream()
+    items = stream.feed(text)
+    if stream.truncated and text and text.strip():
+        logger.warning(f"  Réponse JSON tronquée : {len(items)} objet(s) récupéré(s).")
+    return items
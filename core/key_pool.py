@@ -0,0 +1,365 @@
+"""
+MODULE 30 — Key Pool (Ordonnanceur de clés API en mémoire, écritures différées)
+Point unique de distribution des clés GEMINI / SERPAPI / SCRAPINGBEE / FIRECRAWL
+(KeyManager, et CredentialManager qui s'appuie dessus). Les clés d'un service sont
+chargées en mémoire et rechargées au plus toutes les KEY_POOL_TTL_S secondes.
+  - get_key : clé au créneau libre le plus proche, sans I/O (microsecondes) ; à égalité
+    la clé au quota restant le plus élevé, puis la moins servie (répartition uniforme)
+  - limitation proactive : espacement par clé (KEY_RPM_PER_SERVICE, req/min) et quota
+    restant connu (quota_remaining) ; une clé à 0 est écartée avant de renvoyer un 429
+  - quota : chaque service décrémente quota_remaining en relatif (quota_remaining - n),
+    sans écraser les décomptes des autres process ni une édition dans Paramètres ; une
+    clé avec quota_limit repart à quota_limit toutes les KEY_QUOTA_RESET_H heures
+    (UPDATE conditionnel au rechargement, appliqué une seule fois entre process)
+  - 429 : pause de la clé (Retry-After, sinon KEY_COOLDOWN_S doublé à chaque refus
+    consécutif, borné par KEY_COOLDOWN_MAX_S) puis réactivation automatique ; si toutes
+    les clés sont en pause, attente de la première libérée si elle l'est sous KEY_MAX_WAIT_S
+  - 401 / 403 (clé révoquée ou invalide) : statut INVALID, jamais réactivée
+    automatiquement (réinitialisation manuelle dans Paramètres)
+  - has_keys : lu depuis le pool, plus de COUNT par URL
+  - last_used / status / cooldown / quota : mis en file et écrits par lots (UPDATE
+    executemany) par un thread de fond toutes les KEY_POOL_FLUSH_S secondes ; une pause
+    réveille le thread immédiatement pour que les autres process la voient au prochain
+    rechargement
+  - cohérence : verrou threading (tâches asyncio, threads), la base reste la référence
+    entre process (rechargement TTL) ; le pool vide les écritures en attente avant de
+    se recharger pour ne pas réactiver une clé qu'il vient de mettre en pause
+
+Usage:
+    from core.config import serpapi_keys          # KeyManager -> KeyPool
+    key = serpapi_keys.get_key()                  # AllKeysExhaustedError si aucune clé disponible
+    serpapi_keys.mark_exhausted(key, retry_after=60)   # 429 : pause, réactivée ensuite
+    serpapi_keys.mark_invalid(key, status_code=401)    # clé refusée : écartée jusqu'à réinitialisation
+    serpapi_keys.report_success(key)              # remet le backoff à zéro
+    serpapi_keys.report_quota(key, remaining=420) # quota annoncé par le fournisseur
+    serpapi_keys.pool.snapshot()                  # état des clés pour l'UI
+"""
+import time
+import atexit
+import logging
+import threading
+from typing import Optional
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, case, or_
+
+from core.config import (
+    AllKeysExhaustedError, KEY_POOL_TTL_S, KEY_POOL_FLUSH_S,
+    KEY_RPM_PER_SERVICE, KEY_COOLDOWN_S, KEY_COOLDOWN_MAX_S, KEY_MAX_WAIT_S, KEY_QUOTA_RESET_H,
+)
+
+logger = logging.getLogger("key_pool")
+
+STATUS_INVALID = "INVALID"     # 401 / 403 : pas de réactivation automatique
+
+
+def retry_after_s(headers) -> Optional[float]:
+    """Durée de l'en-tête Retry-After (secondes ou date HTTP), None si absent ou illisible."""
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class KeyUsageWriter:
+    """File des mises à jour ApiKey (last_used, status, quota consommé) vidée par lots dans un thread de fond."""
+
+    def __init__(self, flush_s: float = KEY_POOL_FLUSH_S):
+        self.flush_s = flush_s
+        self._pending: dict[int, dict] = {}   # id ApiKey -> colonnes à écrire (coalescées)
+        self._used: dict[int, int] = {}       # id ApiKey -> quota consommé depuis le dernier vidage
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+        self.written = 0
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="key-usage", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            self.flush()
+
+    def queue(self, key_id: int, urgent: bool = False, quota_used: int = 0, **fields):
+        """quota_used : décrément relatif de quota_remaining ; une valeur absolue mise en file l'annule."""
+        with self._lock:
+            if fields:
+                self._pending.setdefault(key_id, {"id": key_id}).update(fields)
+            if "quota_remaining" in fields:
+                self._used.pop(key_id, None)
+            if quota_used:
+                self._used[key_id] = self._used.get(key_id, 0) + quota_used
+            self._ensure_flusher()
+        if urgent:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Écrit les mises à jour en attente en une transaction. Retourne le nombre de clés écrites."""
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+            used, self._used = self._used, {}
+        if not rows and not used:
+            return 0
+        from core.models import SessionLocal, ApiKey
+        table = ApiKey.__table__
+        groups: dict[tuple, list] = {}  # un UPDATE executemany par jeu de colonnes
+        for row in rows:
+            groups.setdefault(tuple(sorted(col for col in row if col != "id")), []).append(row)
+        db = SessionLocal()
+        try:
+            # UPDATE Core (et non bulk_update_mappings) : une clé supprimée entre-temps est ignorée
+            for columns, group in groups.items():
+                stmt = table.update().where(table.c.id == bindparam("b_id")).values(
+                    {col: bindparam(f"b_{col}") for col in columns}
+                )
+                db.execute(stmt, [{f"b_{col}": row[col] for col in ("id", *columns)} for row in group])
+            if used:
+                # Décrément relatif, après les valeurs absolues : les autres process et l'UI restent comptés
+                remaining = table.c.quota_remaining
+                stmt = table.update().where(table.c.id == bindparam("b_id"), remaining != None).values(
+                    quota_remaining=case((remaining > bindparam("b_used"), remaining - bindparam("b_used")), else_=0)
+                )
+                db.execute(stmt, [{"b_id": key_id, "b_used": n} for key_id, n in used.items()])
+            db.commit()
+            written = len({row["id"] for row in rows} | set(used))
+            self.written += written
+            return written
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"  Pool de clés: {len({row['id'] for row in rows} | set(used))} mise(s) à jour perdue(s): {e}")
+            return 0
+        finally:
+            db.close()
+
+
+@dataclass
+class KeyState:
+    """État d'ordonnancement d'une clé (créneau, cooldown, quota)."""
+    key_id: int
+    api_key: str
+    next_slot: float = 0.0            # monotonic : prochain créneau libre (espacement rpm, propre au process)
+    cooldown_until: float = 0.0       # epoch : clé en pause jusqu'à cette date (429 / quota)
+    errors: int = 0                   # 429 consécutifs, pilote le backoff du cooldown
+    remaining: Optional[int] = None   # quota restant connu (None = inconnu)
+    served: int = 0
+    exhausted_in_db: bool = False     # statut EXHAUSTED à repasser ACTIVE au prochain service
+    invalid: bool = False             # 401 / 403 : écartée sans réactivation automatique
+
+    def available(self, now: float) -> bool:
+        return not self.invalid and self.cooldown_until <= now and (self.remaining is None or self.remaining > 0)
+
+
+class KeyPool:
+    """Clés d'un service en mémoire, ordonnancées par créneau, quota et cooldown, rechargées sur TTL."""
+
+    def __init__(self, service_name: str, writer: "KeyUsageWriter" = None, ttl_s: float = KEY_POOL_TTL_S,
+                 rpm_per_key: int = None, cooldown_s: float = KEY_COOLDOWN_S,
+                 max_cooldown_s: float = KEY_COOLDOWN_MAX_S, max_wait_s: float = KEY_MAX_WAIT_S):
+        self.service_name = service_name
+        self.writer = writer or key_usage_writer
+        self.ttl_s = ttl_s
+        self.rpm_per_key = KEY_RPM_PER_SERVICE.get(service_name, 0) if rpm_per_key is None else rpm_per_key
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.max_wait_s = max_wait_s
+        self.quota_reset_h = KEY_QUOTA_RESET_H.get(service_name, 0)
+        self._keys: dict[str, KeyState] = {}  # toutes les clés du service, par valeur
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"served": 0, "refreshes": 0, "throttled_s": 0.0, "cooldowns": 0}
+
+    def _refresh(self):
+        # Écritures en attente d'abord : un EXHAUSTED non écrit serait relu ACTIVE
+        self.writer.flush()
+        from core.models import SessionLocal, ApiKey
+        db = SessionLocal()
+        try:
+            self._reset_quotas(db, ApiKey)
+            rows = db.query(ApiKey).filter(ApiKey.service_name == self.service_name).order_by(ApiKey.id).all()
+        except Exception as e:
+            raise RuntimeError(f"Database error while fetching key for {self.service_name}: {e}")
+        finally:
+            db.close()
+        keys = {}
+        for row in rows:
+            state = self._keys.get(row.api_key) or KeyState(row.id, row.api_key)
+            state.key_id = row.id
+            state.errors = row.error_count or 0
+            state.remaining = row.quota_remaining
+            state.invalid = row.status == STATUS_INVALID
+            state.exhausted_in_db = row.status != "ACTIVE"
+            if state.invalid:
+                state.cooldown_until = float("inf")
+            elif state.exhausted_in_db:
+                # Clé épuisée sans date (ancien statut) : réactivée après le cooldown maximal
+                until = row.cooldown_until or (row.last_used or datetime.utcnow()) + timedelta(seconds=self.max_cooldown_s)
+                state.cooldown_until = until.replace(tzinfo=timezone.utc).timestamp()
+            else:
+                state.cooldown_until = 0.0
+            keys[row.api_key] = state
+        self._keys = keys
+        self._expires_at = time.monotonic() + self.ttl_s
+        self.stats["refreshes"] += 1
+
+    def _reset_quotas(self, db, ApiKey):
+        """Remet quota_remaining à quota_limit pour les clés dont la période est échue (une fois entre process)."""
+        if self.quota_reset_h <= 0:
+            return
+        now = datetime.utcnow()
+        reset = db.query(ApiKey).filter(
+            ApiKey.service_name == self.service_name,
+            ApiKey.quota_limit != None,
+            or_(ApiKey.quota_reset_at == None, ApiKey.quota_reset_at <= now),
+        ).update({
+            ApiKey.quota_remaining: ApiKey.quota_limit,
+            ApiKey.quota_reset_at: now + timedelta(hours=self.quota_reset_h),
+        }, synchronize_session=False)
+        db.commit()
+        if reset:
+            logger.info(f"  Quota de {reset} clé(s) {self.service_name} remis à quota_limit "
+                        f"(prochaine remise dans {self.quota_reset_h:.0f} h).")
+
+    def _ensure_fresh(self):
+        if time.monotonic() >= self._expires_at:
+            self._refresh()
+
+    @property
+    def has_keys(self) -> bool:
+        with self._lock:
+            self._ensure_fresh()
+            return bool(self._keys)
+
+    def _pick(self) -> tuple[KeyState, float]:
+        """Clé au créneau le plus proche (à égalité : plus de quota restant, puis moins servie)."""
+        now, mono = time.time(), time.monotonic()
+        candidates = [state for state in self._keys.values() if state.available(now)]
+        cooldown_wait = 0.0
+        if not candidates:
+            # Aucune clé libre : attente courte si un cooldown se termine bientôt, sinon échec
+            waiting = [state for state in self._keys.values()
+                       if not state.invalid and (state.remaining is None or state.remaining > 0)]
+            soonest = min(waiting, key=lambda state: state.cooldown_until, default=None)
+            if soonest is None or soonest.cooldown_until - now > self.max_wait_s:
+                raise AllKeysExhaustedError(f"API Quota Exceeded (or no keys) for {self.service_name}")
+            candidates, cooldown_wait = [soonest], soonest.cooldown_until - now
+        state = min(candidates, key=lambda state: (
+            max(state.next_slot, mono),
+            -(state.remaining if state.remaining is not None else float("inf")),
+            state.served,
+        ))
+        return state, max(cooldown_wait, state.next_slot - mono, 0.0)
+
+    def acquire(self) -> tuple[str, float]:
+        """Réserve une clé et son créneau ; retourne (clé, attente en s avant de l'utiliser)."""
+        with self._lock:
+            self._ensure_fresh()
+            state, wait_s = self._pick()
+            if self.rpm_per_key > 0:
+                state.next_slot = time.monotonic() + wait_s + 60.0 / self.rpm_per_key
+            state.served += 1
+            fields = {"last_used": datetime.utcnow()}
+            if state.remaining is not None:
+                state.remaining -= 1
+                fields["quota_used"] = 1
+            if state.exhausted_in_db:
+                state.exhausted_in_db = False
+                fields.update(status="ACTIVE", cooldown_until=None)  # réactivation automatique
+            self.stats["served"] += 1
+            self.stats["throttled_s"] += wait_s
+            key, key_id = state.api_key, state.key_id
+        self.writer.queue(key_id, **fields)
+        return key, wait_s
+
+    def get_key(self) -> str:
+        """Prochaine clé disponible ; attend son créneau (limitation proactive avant le 429)."""
+        key, wait_s = self.acquire()
+        if wait_s > 0:
+            time.sleep(wait_s)
+        return key
+
+    def mark_exhausted(self, key: str, retry_after: float = None):
+        """429 / quota : pause de la clé (Retry-After, sinon backoff exponentiel borné), puis réactivation."""
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.errors += 1
+            pause_s = retry_after if retry_after is not None else min(self.cooldown_s * 2 ** (state.errors - 1),
+                                                                      self.max_cooldown_s)
+            state.cooldown_until = time.time() + pause_s
+            state.exhausted_in_db = True
+            self.stats["cooldowns"] += 1
+            key_id, errors = state.key_id, state.errors
+        logger.info(f"  Clé {self.service_name} ...{key[-4:]} en pause {pause_s:.0f}s ({errors} refus consécutif(s)).")
+        self.writer.queue(key_id, urgent=True, status="EXHAUSTED", error_count=errors,
+                          cooldown_until=datetime.utcnow() + timedelta(seconds=pause_s))
+
+    def mark_invalid(self, key: str, status_code: int = None):
+        """401 / 403 : clé révoquée ou invalide, écartée jusqu'à une réinitialisation manuelle."""
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.invalid = True
+            state.cooldown_until = float("inf")
+            key_id = state.key_id
+        logger.warning(f"  Clé {self.service_name} ...{key[-4:]} refusée ({status_code or 'accès'}) : marquée INVALID.")
+        self.writer.queue(key_id, urgent=True, status=STATUS_INVALID, cooldown_until=None)
+
+    def report_success(self, key: str):
+        """Appel abouti : remet à zéro le backoff de la clé."""
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None or not state.errors:
+                return
+            state.errors = 0
+            key_id = state.key_id
+        self.writer.queue(key_id, error_count=0)
+
+    def report_quota(self, key: str, remaining: int):
+        """Quota restant annoncé par le fournisseur (en-tête, API de compte) : la clé est écartée à 0."""
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.remaining = remaining
+            key_id = state.key_id
+        self.writer.queue(key_id, quota_remaining=remaining)
+
+    def snapshot(self) -> list[dict]:
+        """État courant des clés (UI) : statut effectif, pause restante, quota, erreurs."""
+        with self._lock:
+            self._ensure_fresh()
+            now = time.time()
+            return [{
+                "id": state.key_id,
+                "key_preview": f"{state.api_key[:8]}...",
+                "status": "ACTIVE" if state.available(now) else STATUS_INVALID if state.invalid else
+                          "QUOTA" if state.remaining is not None and state.remaining <= 0 else "COOLDOWN",
+                "cooldown_s": 0.0 if state.invalid else max(0.0, state.cooldown_until - now),
+                "errors": state.errors,
+                "remaining": state.remaining,
+                "served": state.served,
+            } for state in self._keys.values()]
+
+    def invalidate(self):
+        """Force le rechargement au prochain appel (clé ajoutée ou réinitialisée)."""
+        with self._lock:
+            self._expires_at = 0.0
+
+
+# --- Instance partagée par process ---
+key_usage_writer = KeyUsageWriter()
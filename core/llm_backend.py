@@ -0,0 +1,219 @@
+"""
+MODULE 25 — LLM Backend (Fournisseurs interchangeables derrière le client LLM)
+Le LlmClient (core/llm_client.py) garde la concurrence, la rotation des clés, les
+retries, le cache et la coalescence ; l'appel lui-même passe par un backend :
+  - "gemini" : SDK google.generativeai (défaut)
+  - "record" : Gemini + enregistrement de chaque réponse dans data/llm_recordings/
+               (clé = empreinte de la requête, identique à celle du cache LLM)
+  - "fake"   : FakeLlm en process (core/fake_llm.py) — rejoue les enregistrements,
+               sinon synthétise un JSON conforme au prompt ; aucune clé Gemini requise
+  - "http"   : serveur FakeLlm local (python -m core.fake_llm) à LLM_FAKE_URL, pour
+               les tests de charge multi-process
+Sélection par LLM_BACKEND. `stream` rend la réponse par morceaux (génération en flux
+Gemini, découpage pour la doublure). Un backend retourne un LlmResult (texte + tokens entrée /
+sortie, comptés par Gemini ou estimés pour les backends locaux) et lève une exception contenant "429" sur quota
+et "timeout" / "503" sur erreur transitoire : le client applique ses règles habituelles.
+
+Usage:
+    from core.llm_backend import make_backend
+    llm_client.backend = make_backend("fake", latency_ms=300, rate_429=0.05)
+"""
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator
+from pathlib import Path
+from dataclasses import dataclass
+
+import requests
+
+from core.config import LLM_BACKEND, LLM_FAKE_URL
+from core.llm_cache import llm_cache
+from core.fake_llm import FakeLlm, LLM_RECORDINGS_DIR
+from core.text_reducer import estimate_tokens
+
+logger = logging.getLogger("llm_backend")
+
+IMAGE_TOKENS = 258  # tokens forfaitaires d'une image en entrée (Gemini)
+
+
+@dataclass
+class LlmResult:
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+def request_key(model_name: str, json_mode: bool, parts: list) -> str:
+    """Empreinte d'une requête (clé du cache LLM et des enregistrements)."""
+    return llm_cache.make_key(f"{model_name}|json={json_mode}", parts)
+
+
+def prompt_text(parts: list) -> str:
+    """Parts texte de la requête (les images sont ignorées)."""
+    return "\n".join(part for part in parts if isinstance(part, str))
+
+
+def estimated_result(parts: list, text: str) -> LlmResult:
+    """LlmResult avec tokens estimés (backends sans comptage natif)."""
+    images = sum(1 for part in parts if not isinstance(part, str))
+    return LlmResult(text, estimate_tokens(prompt_text(parts)) + images * IMAGE_TOKENS, estimate_tokens(text))
+
+
+class LlmBackendError(Exception):
+    """Erreur renvoyée par un backend (le message porte le code HTTP éventuel)."""
+
+
+class LlmBackend(ABC):
+    """Interface : un appel de génération, sans retry ni cache (gérés par le LlmClient)."""
+
+    name = "base"
+    needs_api_key = True
+
+    @abstractmethod
+    def generate(self, parts: list, model_name: str, json_mode: bool, timeout_s: float,
+                 api_key: str = None) -> LlmResult:
+        """Réponse complète ; lève une exception contenant "429" (quota) ou "timeout" / "503" (transitoire)."""
+
+    def stream(self, parts: list, model_name: str, json_mode: bool, timeout_s: float,
+               api_key: str = None) -> Iterator[str]:
+        """Réponse par morceaux (par défaut : la réponse complète en un morceau)."""
+        yield self.generate(parts, model_name, json_mode, timeout_s, api_key).text
+
+
+class GeminiBackend(LlmBackend):
+    """SDK google.generativeai, un GenerativeModel réutilisé par (clé, modèle, mode JSON)."""
+
+    name = "gemini"
+
+    def __init__(self):
+        self._models: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, api_key: str, model_name: str, json_mode: bool):
+        import google.generativeai as genai
+        from google.generativeai import client as genai_client
+
+        key = (api_key, model_name, json_mode)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                genai.configure(api_key=api_key)
+                model = genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config={"response_mime_type": "application/json"} if json_mode else None,
+                )
+                # genai.configure est global : on fige ici le client (donc la clé) du modèle
+                model._client = genai_client.get_default_generative_client()
+                self._models[key] = model
+            return model
+
+    def generate(self, parts, model_name, json_mode, timeout_s, api_key=None) -> LlmResult:
+        response = self._model(api_key, model_name, json_mode).generate_content(
+            parts, request_options={"timeout": timeout_s}
+        )
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return estimated_result(parts, response.text)
+        return LlmResult(response.text, usage.prompt_token_count or 0, usage.candidates_token_count or 0)
+
+    def stream(self, parts, model_name, json_mode, timeout_s, api_key=None) -> Iterator[str]:
+        response = self._model(api_key, model_name, json_mode).generate_content(
+            parts, stream=True, request_options={"timeout": timeout_s}
+        )
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:  # morceau sans texte (métadonnées, fin de génération)
+                continue
+            if text:
+                yield text
+
+
+class RecordingBackend(LlmBackend):
+    """Enregistre les réponses d'un backend réel pour les rejouer ensuite via FakeLlm."""
+
+    name = "record"
+
+    def __init__(self, inner: LlmBackend = None, directory: Path = LLM_RECORDINGS_DIR):
+        self.inner = inner or GeminiBackend()
+        self.needs_api_key = self.inner.needs_api_key
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def generate(self, parts, model_name, json_mode, timeout_s, api_key=None) -> LlmResult:
+        result = self.inner.generate(parts, model_name, json_mode, timeout_s, api_key)
+        key = request_key(model_name, json_mode, parts)
+        record = {"model": model_name, "json_mode": json_mode,
+                  "prompt_head": prompt_text(parts)[:300], "response": result.text}
+        (self.directory / f"{key}.json").write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        return result
+
+
+class FakeBackend(LlmBackend):
+    """FakeLlm dans le process (rejeu + synthèse, latence / 429 / JSON invalide injectables)."""
+
+    name = "fake"
+    needs_api_key = False
+    CHUNK_CHARS = 256  # taille des morceaux simulés en mode flux
+
+    def __init__(self, fake: FakeLlm = None, **options):
+        self.fake = fake or FakeLlm(**options)
+
+    def generate(self, parts, model_name, json_mode, timeout_s, api_key=None) -> LlmResult:
+        status, text = self.fake.respond(request_key(model_name, json_mode, parts), prompt_text(parts))
+        if status != 200:
+            raise LlmBackendError(f"{status} {text}")
+        return estimated_result(parts, text)
+
+    def stream(self, parts, model_name, json_mode, timeout_s, api_key=None) -> Iterator[str]:
+        text = self.generate(parts, model_name, json_mode, timeout_s, api_key).text
+        for start in range(0, len(text), self.CHUNK_CHARS):
+            yield text[start:start + self.CHUNK_CHARS]
+
+
+class HttpBackend(LlmBackend):
+    """Client du serveur FakeLlm local (POST /generate)."""
+
+    name = "http"
+    needs_api_key = False
+
+    def __init__(self, url: str = LLM_FAKE_URL):
+        self.url = url.rstrip("/")
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def generate(self, parts, model_name, json_mode, timeout_s, api_key=None) -> LlmResult:
+        payload = {"key": request_key(model_name, json_mode, parts), "model": model_name,
+                   "json_mode": json_mode, "prompt": prompt_text(parts)}
+        try:
+            response = self._session().post(f"{self.url}/generate", json=payload, timeout=timeout_s)
+        except requests.Timeout as e:
+            raise TimeoutError(f"timeout backend http: {e}") from e
+        if response.status_code != 200:
+            raise LlmBackendError(f"{response.status_code} {response.text[:200]}")
+        return estimated_result(parts, response.json()["text"])
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "record": RecordingBackend,
+    "fake": FakeBackend,
+    "http": HttpBackend,
+}
+
+
+def make_backend(name: str = LLM_BACKEND, **options) -> LlmBackend:
+    """Instancie le backend `name` (options transmises au constructeur)."""
+    if name not in BACKENDS:
+        raise ValueError(f"Backend LLM '{name}' inconnu. Disponibles: {list(BACKENDS)}")
+    backend = BACKENDS[name](**options)
+    if name != "gemini":
+        logger.info(f"Backend LLM: {name}")
+    return backend
@@ -0,0 +1,181 @@
+"""
+MODULE 21 — LLM Cache (Réponses Gemini indexées par empreinte du contenu)
+Un flyer, une page de CGV ou une page de recherche identique à un appel précédent
+ne repasse pas par Gemini : la réponse est relue depuis data/llm_cache.db (SQLite).
+  - clé = sha256(modèle, parts de la requête) : le prompt rendu contient le template,
+    toute modification du template invalide donc naturellement les entrées
+  - TTL (LLM_CACHE_TTL_H) puis éviction LRU au-delà de LLM_CACHE_MAX_ENTRIES
+  - compteurs hits / misses / stores / evictions par namespace (appelant), partagés
+    entre process via la même base
+
+Usage:
+    from core.llm_cache import llm_cache
+    key = llm_cache.make_key("gemini-1.5-flash", [PROMPT, img])
+    raw = llm_cache.get(key, "scout")
+    if raw is None:
+        raw = model.generate_content([PROMPT, img]).text
+        ...                         # parsing JSON réussi
+        llm_cache.put(key, raw, "scout")
+"""
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from core.config import DATA_DIR, LLM_CACHE_ENABLED, LLM_CACHE_TTL_H, LLM_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger("llm_cache")
+
+LLM_CACHE_PATH = DATA_DIR / "llm_cache.db"
+EVICT_EVERY = 100  # passe d'éviction toutes les N écritures
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    namespace TEXT,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, name)
+);
+"""
+
+
+def _part_bytes(part) -> bytes:
+    """Sérialisation stable d'une part de requête (texte, octets ou image PIL)."""
+    if isinstance(part, str):
+        return part.encode("utf-8")
+    if isinstance(part, (bytes, bytearray)):
+        return bytes(part)
+    if hasattr(part, "tobytes") and hasattr(part, "size"):  # PIL.Image
+        return f"{part.mode}:{part.size}".encode() + part.tobytes()
+    return repr(part).encode("utf-8")
+
+
+class LlmCache:
+    """Cache persistant des réponses LLM (une connexion SQLite par thread)."""
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_h: float = LLM_CACHE_TTL_H,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE_ENABLED):
+        self.path = str(path)
+        self.ttl_s = ttl_h * 3600
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model_name: str, parts: list) -> str:
+        digest = hashlib.sha256(model_name.encode("utf-8"))
+        for part in parts:
+            data = _part_bytes(part)
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _count(self, conn: sqlite3.Connection, namespace: str, name: str, n: int = 1):
+        conn.execute(
+            "INSERT INTO counters (namespace, name, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(namespace, name) DO UPDATE SET value = value + excluded.value",
+            (namespace, name, n),
+        )
+
+    def get(self, key: str, namespace: str = "default") -> Optional[str]:
+        """Réponse en cache (non expirée) ou None. Compte un hit ou un miss."""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._conn()
+            now = time.time()
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_s),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._count(conn, namespace, "hits" if row else "misses")
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.warning(f"  Cache LLM indisponible (lecture): {e}")
+            return None
+
+    def put(self, key: str, response: str, namespace: str = "default"):
+        """Mémorise une réponse valide (à appeler après un parsing réussi)."""
+        if not self.enabled or not response:
+            return
+        try:
+            conn = self._conn()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, response, now, now),
+            )
+            self._count(conn, namespace, "stores")
+            with self._lock:
+                self._writes += 1
+                due = self._writes % EVICT_EVERY == 0
+            if due:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"  Cache LLM indisponible (écriture): {e}")
+
+    def evict(self) -> int:
+        """Supprime les entrées expirées puis les moins récemment lues au-delà de max_entries."""
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_s,)
+        ).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        if removed:
+            self._count(conn, "_all", "evictions", removed)
+        return removed
+
+    def stats(self) -> dict:
+        """Compteurs par namespace + taille actuelle du cache."""
+        conn = self._conn()
+        namespaces: dict[str, dict] = {}
+        for namespace, name, value in conn.execute("SELECT namespace, name, value FROM counters"):
+            namespaces.setdefault(namespace, {})[name] = value
+        for entry in namespaces.values():
+            lookups = entry.get("hits", 0) + entry.get("misses", 0)
+            entry["hit_rate"] = round(entry.get("hits", 0) / lookups, 3) if lookups else None
+        return {
+            "entries": conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            "max_entries": self.max_entries,
+            "ttl_h": self.ttl_s / 3600,
+            "namespaces": namespaces,
+        }
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM responses")
+        conn.execute("DELETE FROM counters")
+
+
+# --- Instance partagée par process ---
+llm_cache = LlmCache()
@@ -0,0 +1,392 @@
+"""
+MODULE 22 — LLM Client (Client Gemini partagé, async et concurrent)
+Point d'entrée unique des appels Gemini de tous les agents et du parser :
+  - concurrence bornée par le slot "llm" du ResourceBudget (process entier)
+  - appels synchrones du SDK exécutés hors de la boucle asyncio (thread)
+  - appel délégué à un backend interchangeable (core/llm_backend.py, LLM_BACKEND) :
+    Gemini par défaut, doublure locale core/fake_llm.py pour les tests et bancs de charge
+  - clés GEMINI servies par l'ordonnanceur du KeyManager (core/key_pool.py) : espacement
+    par clé (LLM_RPM_PER_KEY), pause sur 429 / quota puis réactivation automatique ;
+    timeout par requête et retries avec backoff sur erreurs transitoires, le tout sous une
+    échéance globale (LLM_TIMEOUT_S × LLM_MAX_ATTEMPTS) appliquée dans le thread d'appel :
+    le slot "llm" est tenu jusqu'au retour effectif du thread
+  - chaque appel réel est instrumenté (latence, tokens, coût, retries, clé) via le
+    buffer de core/llm_metrics.py
+  - cache de réponses (core/llm_cache.py) et coalescence : deux requêtes identiques
+    simultanées partagent le même appel en vol ; l'annulation de l'appelant leader ne
+    se propage pas aux autres : son appel va à son terme et leur sert la réponse
+  - génération en flux (stream_items) : chaque objet de la liste JSON est rendu dès
+    qu'il est complet, et les objets d'une réponse tronquée sont récupérés
+  - prompts multi-éléments (generate_batch) : K éléments par requête, réponse en liste
+    JSON indexée par "id", lots en échec coupés en deux et relancés
+
+Usage:
+    from core.llm_client import llm_client
+    raw = await llm_client.generate([PROMPT, img], namespace="scout")   # JSON nettoyé
+    raw = llm_client.generate_sync([prompt], namespace="ai_parser")     # depuis un thread
+    by_id = await llm_client.generate_batch(items, render=build_prompt, namespace="ean_pivot")
+    async for product in llm_client.stream_items([PROMPT, img], namespace="scout"):
+        ...
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Iterator, AsyncIterator
+from concurrent.futures import Future
+
+from core.config import (
+    gemini_keys, AllKeysExhaustedError,
+    LLM_TIMEOUT_S, LLM_MAX_ATTEMPTS, LLM_BATCH_SIZE, LLM_BATCH_MAX_CHARS,
+)
+from core.llm_cache import llm_cache
+from core.llm_backend import LlmBackend, make_backend, request_key, estimated_result
+from core.json_stream import JsonArrayStream, parse_items
+from core.llm_metrics import llm_metrics
+from core.resource_budget import resource_budget
+
+logger = logging.getLogger("llm_client")
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+TRANSIENT_MARKERS = ("timeout", "deadline", "500", "502", "503", "504", "unavailable", "internal")
+
+
+class _LeaderCancelled(Exception):
+    """Le leader d'un appel coalescé a été annulé : un des suiveurs reprend l'appel."""
+
+
+def _is_quota_error(error: Exception) -> bool:
+    return "429" in str(error) or "quota" in str(error).lower()
+
+
+def _is_transient_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return isinstance(error, TimeoutError) or any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def clean_response(text: str) -> str:
+    """Retire les balises ```json éventuelles autour de la réponse."""
+    raw = (text or "").strip()
+    if raw.startswith("```json"):
+        raw = raw[7:].strip()
+    elif raw.startswith("```"):
+        raw = raw[3:].strip()
+    if raw.endswith("```"):
+        raw = raw[:-3].strip()
+    return raw
+
+
+class LlmClient:
+    """Client Gemini partagé par process (utilisable depuis la boucle asyncio ou un thread)."""
+
+    def __init__(self, timeout_s: float = LLM_TIMEOUT_S, max_attempts: int = LLM_MAX_ATTEMPTS,
+                 backend: LlmBackend = None):
+        self.backend = backend or make_backend()
+        self.timeout_s = timeout_s
+        self.max_attempts = max(1, max_attempts)
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "retries": 0, "coalesced": 0, "cache_hits": 0}
+
+    def _on_failure(self, error: Exception, api_key: str, attempt: int, deadline: float) -> int:
+        """Rotation de clé ou retry (retourne le nouveau compteur d'essais), sinon relance l'erreur."""
+        quota = _is_quota_error(error)
+        if quota and api_key:
+            logger.warning("  LLM: clé Gemini refusée (quota). Pause de la clé et rotation...")
+            gemini_keys.mark_exhausted(api_key)
+            return attempt
+        attempt += 1
+        if (_is_transient_error(error) or quota) and attempt < self.max_attempts:
+            self.stats["retries"] += 1
+            logger.warning(f"  LLM: erreur transitoire ({error}), nouvel essai {attempt + 1}/{self.max_attempts}.")
+            time.sleep(max(0.0, min(2 ** attempt, deadline - time.monotonic())))
+            return attempt
+        self.stats["errors"] += 1
+        raise error
+
+    def _next_key(self):
+        # AllKeysExhaustedError remonte à l'appelant ; les backends locaux n'ont pas de clé.
+        # get_key attend le créneau de la clé (espacement LLM_RPM_PER_KEY).
+        return gemini_keys.get_key() if self.backend.needs_api_key else None
+
+    def _record_failure(self, error: Exception, namespace: str, model_name: str, started: float,
+                        retries: int, api_key: str):
+        llm_metrics.record(namespace, model_name, 0, 0, (time.perf_counter() - started) * 1000,
+                           retries=retries, api_key=api_key,
+                           status="QUOTA" if _is_quota_error(error) else "ERROR", error=str(error))
+
+    def _deadline(self) -> float:
+        """Échéance (monotonic) d'un appel, retries et rotations de clés compris."""
+        return time.monotonic() + self.timeout_s * self.max_attempts
+
+    def _remaining_s(self, deadline: float, retries: int) -> float:
+        """Délai restant pour le prochain essai ; TimeoutError une fois l'échéance passée."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.stats["errors"] += 1
+            raise TimeoutError(f"timeout LLM: échéance de {self.timeout_s * self.max_attempts:.0f}s "
+                               f"dépassée après {retries} essai(s)")
+        return min(self.timeout_s, remaining)
+
+    def _call(self, parts: list, model_name: str, json_mode: bool, namespace: str = "default") -> str:
+        """Appel bloquant avec rotation des clés et retries sous échéance (le slot "llm" est pris par l'appelant)."""
+        attempt = retries = 0
+        deadline = self._deadline()
+        while True:
+            timeout_s = self._remaining_s(deadline, retries)
+            api_key = self._next_key()
+            started = time.perf_counter()
+            try:
+                self.stats["calls"] += 1
+                result = self.backend.generate(parts, model_name, json_mode, timeout_s, api_key=api_key)
+                llm_metrics.record(namespace, model_name, result.input_tokens, result.output_tokens,
+                                   (time.perf_counter() - started) * 1000, retries=retries, api_key=api_key)
+                if api_key:
+                    gemini_keys.report_success(api_key)
+                return clean_response(result.text)
+            except Exception as e:
+                self._record_failure(e, namespace, model_name, started, retries, api_key)
+                retries += 1
+                attempt = self._on_failure(e, api_key, attempt, deadline)
+
+    def _stream_call(self, parts: list, model_name: str, namespace: str) -> Iterator[str]:
+        """Génération en flux ; retry possible tant qu'aucun morceau n'a été rendu."""
+        attempt = retries = 0
+        deadline = self._deadline()
+        while True:
+            timeout_s = self._remaining_s(deadline, retries)
+            api_key = self._next_key()
+            started = time.perf_counter()
+            received = []
+            try:
+                self.stats["calls"] += 1
+                for chunk in self.backend.stream(parts, model_name, True, timeout_s, api_key=api_key):
+                    received.append(chunk)
+                    yield chunk
+                usage = estimated_result(parts, "".join(received))
+                llm_metrics.record(namespace, model_name, usage.input_tokens, usage.output_tokens,
+                                   (time.perf_counter() - started) * 1000, retries=retries, api_key=api_key)
+                if api_key:
+                    gemini_keys.report_success(api_key)
+                return
+            except Exception as e:
+                self._record_failure(e, namespace, model_name, started, retries, api_key)
+                if received:
+                    # Flux coupé en cours de route : les objets déjà rendus sont conservés
+                    self.stats["errors"] += 1
+                    logger.warning(f"  LLM: flux {namespace} interrompu après {len(received)} morceau(x): {e}")
+                    return
+                retries += 1
+                attempt = self._on_failure(e, api_key, attempt, deadline)
+
+    def _lookup(self, cache_key: str, namespace: str, use_cache: bool):
+        """Retourne (réponse en cache, future, leader) : le leader exécute l'appel et résout la future partagée."""
+        if use_cache:
+            cached = llm_cache.get(cache_key, namespace)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return cached, None, False
+        with self._lock:
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return None, future, False
+            future = Future()
+            self._inflight[cache_key] = future
+            return None, future, True
+
+    def _finish(self, cache_key: str, future: Future, namespace: str, use_cache: bool, json_mode: bool,
+                result: str = None, error: Exception = None):
+        with self._lock:
+            self._inflight.pop(cache_key, None)
+        if error is not None:
+            future.set_exception(error)
+            return
+        if use_cache and result:
+            try:
+                if json_mode:
+                    json.loads(result)
+                llm_cache.put(cache_key, result, namespace)
+            except ValueError:
+                pass  # JSON invalide : jamais mis en cache
+        future.set_result(result)
+
+    async def generate(self, parts: list, namespace: str = "default", model_name: str = DEFAULT_MODEL,
+                       json_mode: bool = True, use_cache: bool = True) -> str:
+        """Génère (ou relit / partage) la réponse sans bloquer la boucle asyncio."""
+        cache_key = request_key(model_name, json_mode, parts)
+        while True:
+            cached, future, leader = self._lookup(cache_key, namespace, use_cache)
+            if cached is not None:
+                return cached
+            if leader:
+                break
+            try:
+                # shield : l'annulation d'un suiveur ne doit pas annuler l'appel partagé
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                continue  # leader annulé : nouvelle recherche, un suiveur devient leader
+        # shield : l'annulation du leader n'interrompt ni le thread ni son slot ; l'appel va à son
+        # terme et résout la future des suiveurs
+        call = asyncio.ensure_future(self._lead(cache_key, future, parts, namespace, model_name, json_mode, use_cache))
+        call.add_done_callback(lambda task: task.cancelled() or task.exception())  # erreur lue par les suiveurs
+        return await asyncio.shield(call)
+
+    async def _lead(self, cache_key: str, future: Future, parts: list, namespace: str, model_name: str,
+                    json_mode: bool, use_cache: bool) -> str:
+        """Appel du leader : le slot "llm" est tenu jusqu'au retour du thread (échéance dans _call)."""
+        try:
+            async with resource_budget.slot("llm"):
+                result = await asyncio.to_thread(self._call, parts, model_name, json_mode, namespace)
+        except Exception as e:
+            self._finish(cache_key, future, namespace, use_cache, json_mode, error=e)
+            raise
+        except BaseException:
+            # Boucle arrêtée avant l'appel : les suiveurs reprennent l'appel
+            self._finish(cache_key, future, namespace, use_cache, json_mode, error=_LeaderCancelled())
+            raise
+        self._finish(cache_key, future, namespace, use_cache, json_mode, result=result)
+        return result
+
+    def generate_sync(self, parts: list, namespace: str = "default", model_name: str = DEFAULT_MODEL,
+                      json_mode: bool = True, use_cache: bool = True) -> str:
+        """Variante bloquante pour le code synchrone (threads, scripts)."""
+        cache_key = request_key(model_name, json_mode, parts)
+        while True:
+            cached, future, leader = self._lookup(cache_key, namespace, use_cache)
+            if cached is not None:
+                return cached
+            if leader:
+                break
+            try:
+                return future.result()
+            except _LeaderCancelled:
+                continue
+        try:
+            with resource_budget.sync_slot("llm"):
+                result = self._call(parts, model_name, json_mode, namespace)
+        except Exception as e:
+            self._finish(cache_key, future, namespace, use_cache, json_mode, error=e)
+            raise
+        except BaseException:
+            self._finish(cache_key, future, namespace, use_cache, json_mode, error=_LeaderCancelled())
+            raise
+        self._finish(cache_key, future, namespace, use_cache, json_mode, result=result)
+        return result
+
+    def stream_items_sync(self, parts: list, namespace: str = "default", model_name: str = DEFAULT_MODEL,
+                          use_cache: bool = True) -> Iterator:
+        """Objets de la liste JSON de réponse, rendus dès qu'ils sont complets (réponse tronquée incluse)."""
+        cache_key = request_key(model_name, True, parts)
+        if use_cache:
+            cached = llm_cache.get(cache_key, namespace)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                yield from parse_items(cached)
+                return
+        parser = JsonArrayStream()
+        with resource_budget.sync_slot("llm"):
+            for chunk in self._stream_call(parts, model_name, namespace):
+                yield from parser.feed(chunk)
+        if parser.truncated:
+            logger.warning(f"  LLM: réponse {namespace} tronquée, {parser.items} objet(s) récupéré(s).")
+        elif use_cache and not parser.invalid:
+            llm_cache.put(cache_key, clean_response(parser.text), namespace)
+
+    async def stream_items(self, parts: list, namespace: str = "default", model_name: str = DEFAULT_MODEL,
+                           use_cache: bool = True) -> AsyncIterator:
+        """Variante asyncio de stream_items_sync (le flux est lu dans un thread)."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for item in self.stream_items_sync(parts, namespace, model_name, use_cache):
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        reader = asyncio.ensure_future(asyncio.to_thread(pump))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            await reader
+
+    @staticmethod
+    def _chunk(items: list[dict], render: Callable[[list[dict]], str], batch_size: int,
+               max_chars: int) -> list[list[dict]]:
+        """Lots d'au plus `batch_size` éléments dont le prompt rendu reste sous `max_chars`."""
+        overhead = len(render([]))
+        chunks, current, size = [], [], overhead
+        for item in items:
+            item_size = len(render([item])) - overhead
+            if current and (len(current) >= batch_size or size + item_size > max_chars):
+                chunks.append(current)
+                current, size = [], overhead
+            current.append(item)
+            size += item_size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def _run_chunk(self, chunk: list[dict], render, namespace: str, model_name: str, results: dict):
+        try:
+            raw = await self.generate([render(chunk)], namespace=namespace, model_name=model_name)
+            data = parse_items(raw)  # réponse tronquée : les objets complets sont gardés, le reste relancé
+        except AllKeysExhaustedError:
+            results.update({str(item["id"]): None for item in chunk})
+            return
+        except Exception as e:
+            logger.warning(f"  LLM batch {namespace} ({len(chunk)} élément(s)) en échec: {e}")
+            data = []
+        if isinstance(data, dict):
+            data = [data]
+        answers = {str(obj.get("id")): obj for obj in data if isinstance(obj, dict)}
+
+        missing = []
+        for item in chunk:
+            answer = answers.get(str(item["id"]))
+            if answer is None:
+                missing.append(item)
+            else:
+                results[str(item["id"])] = answer
+        if not missing:
+            return
+        if len(chunk) == 1:
+            results[str(chunk[0]["id"])] = None
+        elif len(missing) == len(chunk):
+            # Lot entièrement raté (JSON invalide, contexte trop long...) : on coupe en deux
+            half = len(chunk) // 2
+            await asyncio.gather(
+                self._run_chunk(chunk[:half], render, namespace, model_name, results),
+                self._run_chunk(chunk[half:], render, namespace, model_name, results),
+            )
+        else:
+            await self._run_chunk(missing, render, namespace, model_name, results)
+
+    async def generate_batch(self, items: list[dict], render: Callable[[list[dict]], str],
+                             namespace: str = "default", model_name: str = DEFAULT_MODEL,
+                             batch_size: int = LLM_BATCH_SIZE, max_chars: int = LLM_BATCH_MAX_CHARS) -> dict:
+        """
+        Prompt multi-éléments. Chaque item porte une clé "id" ; `render(lot)` construit le prompt
+        d'un lot et la réponse attendue est une liste JSON d'objets reprenant ces "id".
+        Retourne {id (str): objet réponse, ou None si l'élément n'a pas pu être extrait}.
+        """
+        results: dict[str, dict] = {}
+        chunks = self._chunk(items, render, max(1, batch_size), max_chars)
+        await asyncio.gather(*(self._run_chunk(c, render, namespace, model_name, results) for c in chunks))
+        return results
+
+
+# --- Instance partagée par process ---
+llm_client = LlmClient()
@@ -0,0 +1,177 @@
+"""
+MODULE 27 — LLM Metrics (Instrumentation par appel : latence, tokens, coût)
+Chaque appel réel au backend LLM (hors cache / coalescence) est enregistré dans
+llm_call_logs : namespace (template de prompt), agent et mission (contexte de
+l'appelant), modèle, tokens entrée / sortie, latence, retries, suffixe de la clé,
+statut et coût estimé (LLM_PRICE_INPUT_PER_MTOK / LLM_PRICE_OUTPUT_PER_MTOK).
+L'écriture est bufferisée : `record` ne fait qu'ajouter à une liste en mémoire, un
+thread vide le buffer par insertion groupée (LLM_METRICS_FLUSH_SIZE lignes ou
+LLM_METRICS_FLUSH_S secondes), et le reste est vidé à la sortie du process.
+
+Usage:
+    from core.llm_metrics import llm_metrics, call_context
+    with call_context(agent="Scout Carrefour", mission_id=5):
+        raw = await llm_client.generate([...], namespace="scout")   # appel instrumenté
+    summary = llm_metrics.summary(since_h=24)          # p50 / p95 / tokens / coût par namespace
+    per_mission = llm_metrics.cost_by_mission(since_h=24 * 7)
+"""
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from core.config import (
+    LLM_PRICE_INPUT_PER_MTOK, LLM_PRICE_OUTPUT_PER_MTOK, LLM_METRICS_FLUSH_SIZE, LLM_METRICS_FLUSH_S,
+)
+from core.models import SessionLocal, LlmCallLog
+
+logger = logging.getLogger("llm_metrics")
+
+_call_context: contextvars.ContextVar[dict] = contextvars.ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def call_context(**fields):
+    """Attribue les appels LLM du bloc (agent, mission_id...) ; suit asyncio.to_thread et les tâches."""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_context() -> dict:
+    return _call_context.get()
+
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    return ((input_tokens or 0) * LLM_PRICE_INPUT_PER_MTOK + (output_tokens or 0) * LLM_PRICE_OUTPUT_PER_MTOK) / 1e6
+
+
+def _percentile(values: list[float], pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class LlmMetrics:
+    """Buffer des appels LLM vidé par lots dans llm_call_logs."""
+
+    def __init__(self, flush_size: int = LLM_METRICS_FLUSH_SIZE, flush_s: float = LLM_METRICS_FLUSH_S):
+        self.flush_size = max(1, flush_size)
+        self.flush_s = flush_s
+        self._buffer: list[dict] = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._wake = threading.Event()
+        self.dropped = 0
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="llm-metrics", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            self.flush()
+
+    def record(self, namespace: str, model_name: str, input_tokens: int, output_tokens: int,
+               latency_ms: float, retries: int = 0, api_key: str = None, status: str = "OK",
+               error: str = None):
+        """Ajoute un appel au buffer (aucune I/O sur le chemin de l'appel)."""
+        context = current_context()
+        row = {
+            "namespace": namespace,
+            "agent": context.get("agent"),
+            "mission_id": context.get("mission_id"),
+            "model_name": model_name,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "latency_ms": round(latency_ms, 1),
+            "retries": retries,
+            "key_suffix": api_key[-4:] if api_key else None,
+            "status": status,
+            "error": (error or "")[:300] or None,
+            "cost_usd": estimate_cost(input_tokens, output_tokens),
+            "timestamp": datetime.utcnow(),
+        }
+        with self._lock:
+            self._buffer.append(row)
+            due = len(self._buffer) >= self.flush_size
+            self._ensure_flusher()
+        if due:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Insère le buffer en une transaction. Retourne le nombre de lignes écrites."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(LlmCallLog, rows)
+            db.commit()
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            self.dropped += len(rows)
+            logger.warning(f"  Métriques LLM: {len(rows)} ligne(s) perdue(s): {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _rows(self, since_h: float) -> list:
+        self.flush()
+        db = SessionLocal()
+        try:
+            return db.query(LlmCallLog).filter(
+                LlmCallLog.timestamp >= datetime.utcnow() - timedelta(hours=since_h)
+            ).all()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _aggregate(rows: list) -> dict:
+        latencies = [r.latency_ms for r in rows if r.status == "OK" and r.latency_ms is not None]
+        return {
+            "calls": len(rows),
+            "errors": sum(1 for r in rows if r.status != "OK"),
+            "retries": sum(r.retries or 0 for r in rows),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "input_tokens": sum(r.input_tokens or 0 for r in rows),
+            "output_tokens": sum(r.output_tokens or 0 for r in rows),
+            "cost_usd": round(sum(r.cost_usd or 0 for r in rows), 4),
+        }
+
+    def summary(self, since_h: float = 24) -> dict:
+        """Agrégats globaux et par namespace (template de prompt) sur la fenêtre."""
+        rows = self._rows(since_h)
+        groups: dict[str, list] = {}
+        for row in rows:
+            groups.setdefault(row.namespace or "default", []).append(row)
+        return {
+            "total": self._aggregate(rows),
+            "namespaces": {ns: self._aggregate(group) for ns, group in sorted(groups.items())},
+        }
+
+    def cost_by_mission(self, since_h: float = 24 * 7) -> list[dict]:
+        """Coût et volume par mission (les appels hors mission sont regroupés sous None)."""
+        groups: dict = {}
+        for row in self._rows(since_h):
+            groups.setdefault(row.mission_id, []).append(row)
+        return sorted(
+            ({"mission_id": mission_id, **self._aggregate(group)} for mission_id, group in groups.items()),
+            key=lambda entry: entry["cost_usd"], reverse=True,
+        )
+
+
+# --- Instance partagée par process ---
+llm_metrics = LlmMetrics()
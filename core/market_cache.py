@@ -0,0 +1,259 @@
+"""
+MODULE 31 — Market Cache (Cotations marché partagées, TTL par source)
+Les trois chemins qui cherchent un prix de revente (MarketFetcher via SerpAPI,
+MarketProbeAgent via Amazon.fr / Google Shopping, reliability_engine) relisent ici
+les réponses récentes au lieu de repayer la même recherche :
+  - clé = source + EAN réel, sinon requête normalisée (minuscules, sans accents ni
+    ponctuation) : "Nintendo Switch OLED" et "nintendo  switch-oled" partagent l'entrée
+  - TTL par source (MARKET_CACHE_TTL_H) ; une recherche sans résultat est aussi
+    mémorisée (cache négatif, MARKET_CACHE_NEGATIVE_TTL_H) pour ne pas être relancée
+  - stockage SQLite (data/market_cache.db) partagé entre process, compteurs hits /
+    négatifs / misses par source, âge des cotations exposé à l'UI (fraîcheur)
+  - compteurs tenus en mémoire et écrits par lots toutes les MARKET_CACHE_COUNTER_FLUSH_S
+    secondes par un thread de fond : une lecture (hit) ne prend aucun verrou d'écriture
+  - appels synchrones (SQLite) : depuis la boucle asyncio, passer par asyncio.to_thread
+
+Usage:
+    from core.market_cache import market_cache, SOURCE_SERPAPI
+    quote = market_cache.get(SOURCE_SERPAPI, ean="3017620422003", query="Nutella 1kg")
+    if quote is None:
+        results = call_serpapi(...)
+        market_cache.put(SOURCE_SERPAPI, {"shopping_results": results} if results else None, ean=..., query=...)
+    elif quote.found:
+        results = quote.payload["shopping_results"]      # quote.age_s : âge de la cotation
+    ages = market_cache.ages(SOURCE_SERPAPI, ["3017620422003"])   # {ean: âge en s}
+"""
+import re
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+
+from core.config import (
+    DATA_DIR, MARKET_CACHE_ENABLED, MARKET_CACHE_TTL_H, MARKET_CACHE_DEFAULT_TTL_H, MARKET_CACHE_NEGATIVE_TTL_H,
+    MARKET_CACHE_COUNTER_FLUSH_S,
+)
+
+logger = logging.getLogger("market_cache")
+
+MARKET_CACHE_PATH = DATA_DIR / "market_cache.db"
+EVICT_EVERY = 200  # passe d'éviction toutes les N écritures
+
+SOURCE_SERPAPI = "serpapi_shopping"
+SOURCE_AMAZON = "amazon_fr"
+SOURCE_GOOGLE_SHOPPING = "google_shopping"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    payload TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_quotes_source_fetched ON quotes (source, fetched_at);
+CREATE TABLE IF NOT EXISTS counters (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, name)
+);
+"""
+
+
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def subject(ean: str = None, query: str = None) -> str:
+    """EAN réel en priorité (les GEN-... sont des identifiants internes), sinon requête normalisée."""
+    if ean and not ean.startswith("GEN-"):
+        return f"ean:{ean}"
+    return f"q:{normalize_query(query)}"
+
+
+@dataclass
+class MarketQuote:
+    payload: Optional[dict]   # None = recherche sans résultat (cache négatif)
+    fetched_at: float
+
+    @property
+    def found(self) -> bool:
+        return self.payload is not None
+
+    @property
+    def age_s(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class MarketCache:
+    """Cache persistant des cotations marché (une connexion SQLite par thread)."""
+
+    def __init__(self, path=MARKET_CACHE_PATH, ttl_h: dict = None, negative_ttl_h: float = MARKET_CACHE_NEGATIVE_TTL_H,
+                 enabled: bool = MARKET_CACHE_ENABLED, counter_flush_s: float = MARKET_CACHE_COUNTER_FLUSH_S):
+        self.path = str(path)
+        self.ttl_h = dict(MARKET_CACHE_TTL_H if ttl_h is None else ttl_h)
+        self.negative_ttl_s = negative_ttl_h * 3600
+        self.enabled = enabled
+        self.counter_flush_s = counter_flush_s
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, str], int] = {}  # (source, nom) -> incrément en attente d'écriture
+        self._flusher = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def ttl_s(self, source: str) -> float:
+        return self.ttl_h.get(source, MARKET_CACHE_DEFAULT_TTL_H) * 3600
+
+    def _count(self, source: str, name: str, n: int = 1):
+        with self._lock:
+            self._counters[(source, name)] = self._counters.get((source, name), 0) + n
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="market-cache-counters", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush_counters)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.counter_flush_s)
+            self.flush_counters()
+
+    def flush_counters(self) -> int:
+        """Écrit les compteurs en attente en une transaction. Retourne le nombre de compteurs écrits."""
+        with self._lock:
+            pending, self._counters = self._counters, {}
+        if not pending:
+            return 0
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT INTO counters (source, name, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(source, name) DO UPDATE SET value = value + excluded.value",
+                    [(source, name, n) for (source, name), n in pending.items()],
+                )
+            return len(pending)
+        except sqlite3.Error as e:
+            logger.warning(f"  Cache marché: {len(pending)} compteur(s) perdu(s): {e}")
+            return 0
+
+    def get(self, source: str, ean: str = None, query: str = None) -> Optional[MarketQuote]:
+        """Cotation encore valide (positive ou négative) ou None. Compte un hit, un hit négatif ou un miss."""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT payload, fetched_at FROM quotes WHERE key = ?", (f"{source}|{subject(ean, query)}",)
+            ).fetchone()
+            quote = None
+            if row:
+                payload, fetched_at = row
+                ttl_s = self.ttl_s(source) if payload is not None else self.negative_ttl_s
+                if time.time() - fetched_at <= ttl_s:
+                    quote = MarketQuote(json.loads(payload) if payload is not None else None, fetched_at)
+            self._count(source, "misses" if quote is None else "hits" if quote.found else "negative_hits")
+            return quote
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"  Cache marché indisponible (lecture): {e}")
+            return None
+
+    def put(self, source: str, payload: Optional[dict], ean: str = None, query: str = None):
+        """Mémorise une réponse ; payload vide / None = aucun résultat (entrée négative)."""
+        if not self.enabled:
+            return
+        key_subject = subject(ean, query)
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO quotes (key, source, subject, payload, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (f"{source}|{key_subject}", source, key_subject,
+                 json.dumps(payload, ensure_ascii=False) if payload else None, time.time()),
+            )
+            self._count(source, "stores" if payload else "negative_stores")
+            with self._lock:
+                self._writes += 1
+                due = self._writes % EVICT_EVERY == 0
+            if due:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"  Cache marché indisponible (écriture): {e}")
+
+    def evict(self) -> int:
+        """Supprime les cotations expirées (TTL de leur source, ou TTL négatif)."""
+        conn = self._conn()
+        now = time.time()
+        removed = conn.execute(
+            "DELETE FROM quotes WHERE payload IS NULL AND fetched_at < ?", (now - self.negative_ttl_s,)
+        ).rowcount
+        for source in [row[0] for row in conn.execute("SELECT DISTINCT source FROM quotes")]:
+            removed += conn.execute(
+                "DELETE FROM quotes WHERE source = ? AND fetched_at < ?", (source, now - self.ttl_s(source))
+            ).rowcount
+        return removed
+
+    def ages(self, source: str, eans: list[str]) -> dict[str, float]:
+        """Âge (s) de la dernière cotation positive par EAN, même expirée (affichage de fraîcheur)."""
+        if not eans:
+            return {}
+        conn = self._conn()
+        now, ages = time.time(), {}
+        for i in range(0, len(eans), 500):
+            chunk = [f"ean:{ean}" for ean in eans[i:i + 500]]
+            for key_subject, fetched_at in conn.execute(
+                f"SELECT subject, fetched_at FROM quotes WHERE source = ? AND payload IS NOT NULL "
+                f"AND subject IN ({','.join('?' * len(chunk))})", (source, *chunk),
+            ):
+                ages[key_subject[4:]] = now - fetched_at
+        return ages
+
+    def stats(self) -> dict:
+        """Par source : entrées (dont négatives), âge médian / max, compteurs et taux de hit."""
+        self.flush_counters()
+        conn = self._conn()
+        now = time.time()
+        sources: dict[str, dict] = {}
+        for source, payload_null, fetched_at in conn.execute(
+            "SELECT source, payload IS NULL, fetched_at FROM quotes ORDER BY source, fetched_at DESC"
+        ):
+            entry = sources.setdefault(source, {"entries": 0, "negatives": 0, "ages_h": []})
+            entry["entries"] += 1
+            entry["negatives"] += payload_null
+            entry["ages_h"].append((now - fetched_at) / 3600)
+        for source, name, value in conn.execute("SELECT source, name, value FROM counters"):
+            sources.setdefault(source, {"entries": 0, "negatives": 0, "ages_h": []})[name] = value
+        for source, entry in sources.items():
+            ages = entry.pop("ages_h")
+            entry["median_age_h"] = round(ages[len(ages) // 2], 1) if ages else None
+            entry["max_age_h"] = round(ages[-1], 1) if ages else None
+            entry["ttl_h"] = self.ttl_s(source) / 3600
+            lookups = entry.get("hits", 0) + entry.get("negative_hits", 0) + entry.get("misses", 0)
+            entry["hit_rate"] = round((lookups - entry.get("misses", 0)) / lookups, 3) if lookups else None
+        return {"negative_ttl_h": self.negative_ttl_s / 3600, "sources": sources}
+
+    def clear(self):
+        with self._lock:
+            self._counters = {}
+        conn = self._conn()
+        conn.execute("DELETE FROM quotes")
+        conn.execute("DELETE FROM counters")
+
+
+# --- Instance partagée par process ---
+market_cache = MarketCache()
@@ -2,6 +2,22 @@
 MODULE 10 — Market Fetcher (Bot Phase 2)
 Interroge les prix de revente du marché pour les offres validées (qa_status='VALIDATED').
 Utilise la rotation multi-clés SerpAPI (Google Shopping).
+Le batch est concurrent : les offres sont regroupées par EAN (une requête SerpAPI par
+EAN, quel que soit le nombre d'offres), les requêtes partent via httpx.AsyncClient
+(MARKET_FETCH_CONCURRENCY en vol, MARKET_FETCH_RPS requêtes/s, slot "http" du
+ResourceBudget), et prix_revente_marche / PriceHistory sont écrits par lots de
+MARKET_FETCH_WRITE_BATCH EAN (une transaction par lot, quota dépensé conservé).
+Les réponses SerpAPI passent par le cache marché partagé (core/market_cache.py) :
+un EAN déjà cherché dans la fenêtre TTL (ou sans résultat récent) ne coûte aucune requête.
+L'ordre et la sélection des EAN viennent du Refresh Planner (core/refresh_planner.py) :
+les EAN de plus forte valeur attendue passent en premier, et les EAN déjà cotés mais
+périmés sont re-cotés dans la limite de MARKET_REFRESH_BUDGET par run.
+
+Usage:
+    from core.market_fetcher import MarketFetcher
+    updated = MarketFetcher().run_batch()                # depuis du code synchrone
+    updated = await MarketFetcher().run_batch_async()    # depuis la boucle asyncio
+    results = MarketFetcher().search_shopping(None, "Nintendo Switch OLED")   # requête libre, via le cache
 """
 import sys
 from pathlib import Path
@@ -9,23 +25,58 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import logging
 import time
+import asyncio
 import requests
+import httpx
 import re
+from datetime import datetime
 from typing import Optional
+from sqlalchemy import bindparam
 
-from core.models import SessionLocal, OffreRetail, ProduitReference
-from core.config import serpapi_keys, AllKeysExhaustedError
+from core.models import SessionLocal, OffreRetail, PriceHistory
+from core.config import (
+    serpapi_keys, AllKeysExhaustedError,
+    MARKET_FETCH_CONCURRENCY, MARKET_FETCH_RPS, MARKET_FETCH_WRITE_BATCH, MARKET_REFRESH_BUDGET,
+)
+from core.key_pool import retry_after_s
+from core.market_cache import market_cache, SOURCE_SERPAPI
+from core.pipeline import emit, EVENT_MARKET_UPDATED
+from core.refresh_planner import RefreshPlanner, SCOPE_FETCHER
+from core.resource_budget import resource_budget
 
 logger = logging.getLogger("market_fetcher")
 
+SERPAPI_URL = "https://serpapi.com/search.json"
+SHOPPING_FIELDS = ("title", "price", "extracted_price", "source")  # champs conservés dans le cache marché
+
+
+class _RateLimiter:
+    """Espacement global des requêtes d'une boucle asyncio (requêtes / seconde, 0 = aucun)."""
+
+    def __init__(self, rate_per_s: float):
+        self.interval = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
 
 class MarketFetcher:
     """Bot automatisé pour chercher le prix de revente marché (prix minimum)."""
 
     PRICE_PATTERN = re.compile(r"([0-9]+[.,][0-9]+)")
 
-    def __init__(self):
-        pass
+    def __init__(self, concurrency: int = MARKET_FETCH_CONCURRENCY, rate_per_s: float = MARKET_FETCH_RPS,
+                 write_batch: int = MARKET_FETCH_WRITE_BATCH):
+        self.concurrency = max(1, concurrency)
+        self.rate_per_s = rate_per_s
+        self.write_batch = max(1, write_batch)
 
     def _extract_price(self, price_str: str) -> Optional[float]:
         """Extrait un prix float depuis une string (ex: '24,99 €')."""
@@ -45,14 +96,58 @@ class MarketFetcher:
                 return None
         return None
 
-    def fetch_market_price(self, ean: str, product_name: str) -> Optional[float]:
-        """Utilise SerpAPI (Google Shopping) pour trouver le prix le plus bas."""
+    def _lowest_price(self, results: list) -> Optional[float]:
+        """Prix le plus bas des résultats Google Shopping (prix absurdes ignorés)."""
+        prices = []
+        for result in results:
+            price_val = result.get("price") or result.get("extracted_price")
+            if price_val:
+                p = self._extract_price(price_val)
+                if p and p > 0.1:  # Ignorer les prix absurdes
+                    prices.append(p)
+        return min(prices) if prices else None
+
+    @staticmethod
+    def _params(ean: Optional[str], product_name: str, api_key: str) -> dict:
+        return {
+            "engine": "google_shopping",
+            "q": f"{ean or ''} {product_name or ''}".strip(),
+            "gl": "fr",
+            "hl": "fr",
+            "api_key": api_key,
+            "num": 10,
+        }
+
+    @staticmethod
+    def _store(ean: Optional[str], product_name: str, data: dict) -> list:
+        """Résultats Shopping réduits aux champs utiles, mémorisés (liste vide = cache négatif)."""
+        results = [
+            {field: result.get(field) for field in SHOPPING_FIELDS}
+            for result in data.get("shopping_results", [])
+        ]
+        market_cache.put(SOURCE_SERPAPI, {"shopping_results": results} if results else None,
+                         ean=ean, query=product_name)
+        return results
+
+    @staticmethod
+    def _cached(ean: Optional[str], product_name: str) -> Optional[list]:
+        quote = market_cache.get(SOURCE_SERPAPI, ean=ean, query=product_name)
+        if quote is None:
+            return None
+        return quote.payload["shopping_results"] if quote.found else []
+
+    def search_shopping(self, ean: Optional[str], product_name: str) -> Optional[list]:
+        """
+        Résultats Google Shopping (SerpAPI) pour un EAN ou une requête, via le cache marché.
+        Retourne [] si la recherche n'a rien donné, None si elle a échoué (réseau, pas de clé).
+        """
+        cached = self._cached(ean, product_name)
+        if cached is not None:
+            return cached
         if not serpapi_keys.has_keys:
             logger.warning("MarketFetcher: Pas de clé SerpAPI configurée.")
             return None
 
-        query = f"{ean} {product_name}"
-        
         while True:
             try:
                 current_key = serpapi_keys.get_key()
@@ -60,95 +155,153 @@ class MarketFetcher:
                 raise AllKeysExhaustedError("API Quota Exceeded for SerpAPI (Market Fetcher)")
 
             try:
-                resp = requests.get(
-                    "https://serpapi.com/search.json",
-                    params={
-                        "engine": "google_shopping",
-                        "q": query,
-                        "gl": "fr",
-                        "hl": "fr",
-                        "api_key": current_key,
-                        "num": 10,
-                    },
-                    timeout=15,
-                )
+                resp = requests.get(SERPAPI_URL, params=self._params(ean, product_name, current_key), timeout=15)
 
                 if resp.status_code in (401, 403, 429):
-                    logger.warning(f"  MarketFetcher SerpAPI: Clé épuisée ({resp.status_code}). Rotation...")
-                    serpapi_keys.mark_exhausted(current_key)
+                    logger.warning(f"  MarketFetcher SerpAPI: Clé refusée ({resp.status_code}). Rotation...")
+                    if resp.status_code == 429:
+                        serpapi_keys.mark_exhausted(current_key, retry_after_s(resp.headers))
+                    else:  # 401 / 403 : clé révoquée, pas de réactivation automatique
+                        serpapi_keys.mark_invalid(current_key, resp.status_code)
                     continue
+                serpapi_keys.report_success(current_key)
 
                 if resp.status_code != 200:
                     return None
+                return self._store(ean, product_name, resp.json())
 
-                data = resp.json()
-                prices = []
-
-                # Analyser les résultats Shopping
-                for result in data.get("shopping_results", []):
-                    price_val = result.get("price") or result.get("extracted_price")
-                    if price_val:
-                        p = self._extract_price(price_val)
-                        if p and p > 0.1:  # Ignorer les prix absurdes
-                            prices.append(p)
-
-                # Chercher le prix le plus bas trouvé sur un panel
-                if prices:
-                    lowest = min(prices)
-                    logger.info(f"  MarketFetcher: Plus bas prix trouvé pour {ean} -> {lowest} €")
-                    return lowest
-                    
-                # Pas de prix trouvé
-                break
-
-            except requests.RequestException as e:
+            except (requests.RequestException, ValueError) as e:
                 logger.warning(f"  MarketFetcher SerpAPI erreur réseau: {e}")
                 return None
 
-        logger.info(f"  MarketFetcher: Aucun prix trouvé pour {ean}")
-        return None
+    def fetch_market_price(self, ean: str, product_name: str) -> Optional[float]:
+        """Utilise SerpAPI (Google Shopping) pour trouver le prix le plus bas."""
+        lowest = self._lowest_price(self.search_shopping(ean, product_name) or [])
+        if lowest is not None:
+            logger.info(f"  MarketFetcher: Plus bas prix trouvé pour {ean} -> {lowest} €")
+        else:
+            logger.info(f"  MarketFetcher: Aucun prix trouvé pour {ean}")
+        return lowest
 
-    def run_batch(self):
-        """Trouve toutes les offres VALIDATED sans prix_revente_marche et les met à jour."""
+    async def _fetch_async(self, client: httpx.AsyncClient, limiter: _RateLimiter,
+                           ean: str, product_name: str) -> Optional[float]:
+        """Version asynchrone de fetch_market_price (même cache et rotation de clés, sans bloquer la boucle)."""
+        cached = await asyncio.to_thread(self._cached, ean, product_name)
+        if cached is not None:
+            return self._lowest_price(cached)
+        while True:
+            try:
+                current_key, wait_s = serpapi_keys.pool.acquire()
+            except AllKeysExhaustedError:
+                raise AllKeysExhaustedError("API Quota Exceeded for SerpAPI (Market Fetcher)")
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+            await limiter.wait()
+            try:
+                async with resource_budget.slot("http"):
+                    resp = await client.get(SERPAPI_URL, params=self._params(ean, product_name, current_key))
+            except httpx.HTTPError as e:
+                logger.warning(f"  MarketFetcher SerpAPI erreur réseau ({ean}): {e}")
+                return None
+
+            if resp.status_code in (401, 403, 429):
+                logger.warning(f"  MarketFetcher SerpAPI: Clé refusée ({resp.status_code}). Rotation...")
+                if resp.status_code == 429:
+                    serpapi_keys.mark_exhausted(current_key, retry_after_s(resp.headers))
+                else:  # 401 / 403 : clé révoquée, pas de réactivation automatique
+                    serpapi_keys.mark_invalid(current_key, resp.status_code)
+                continue
+            serpapi_keys.report_success(current_key)
+            if resp.status_code != 200:
+                return None
+            try:
+                return self._lowest_price(await asyncio.to_thread(self._store, ean, product_name, resp.json()))
+            except ValueError:
+                return None
+
+    def _load_targets(self, db, limit: int = None,
+                      refresh_budget: int = MARKET_REFRESH_BUDGET) -> tuple[dict[str, list[int]], dict[str, str]]:
+        """
+        EAN à relever par valeur attendue décroissante (core/refresh_planner.py) : toutes les offres
+        VALIDATED sans prix, plus les `refresh_budget` EAN déjà cotés les plus rentables à re-coter.
+        Retourne les offres VALIDATED de chaque EAN (toutes reçoivent le nouveau prix) et son nom.
+        """
+        plan = RefreshPlanner().plan(SCOPE_FETCHER, budget=refresh_budget, db=db)
+        if limit:
+            plan = plan[:limit]
+        by_ean = {candidate.ean: candidate.offre_ids for candidate in plan}
+        names = {candidate.ean: candidate.nom for candidate in plan}
+        return by_ean, names
+
+    def _write(self, db, prices: dict[str, float], by_ean: dict[str, list[int]]) -> int:
+        """Écrit un lot de prix (offres + historique + événement) en une transaction. Retourne le nb d'offres."""
+        now = datetime.utcnow()
+        offres = [{"b_id": offre_id, "b_prix": price} for ean, price in prices.items() for offre_id in by_ean[ean]]
+        # UPDATE Core executemany : les hybrid properties d'OffreRetail empêchent bulk_update_mappings
+        table = OffreRetail.__table__
+        db.execute(table.update().where(table.c.id == bindparam("b_id")).values(prix_revente_marche=bindparam("b_prix")), offres)
+        db.bulk_insert_mappings(PriceHistory, [
+            {"ean": ean, "prix_revente": price, "fetch_date": now} for ean, price in prices.items()
+        ])
+        # Pipeline : recalcul de collision limité aux EAN re-sondés
+        emit(EVENT_MARKET_UPDATED, {"eans": sorted(prices)}, db=db)
+        db.commit()
+        return len(offres)
+
+    async def run_batch_async(self, limit: int = None, refresh_budget: int = MARKET_REFRESH_BUDGET) -> int:
+        """
+        Met à jour prix_revente_marche des offres VALIDATED sans prix et re-cote les `refresh_budget`
+        EAN périmés de plus forte valeur : une requête par EAN distinct (au plus `limit` EAN), par
+        valeur décroissante, en parallèle sous limite de débit.
+        """
         logger.info("Début du batch Market Fetcher...")
+        if not serpapi_keys.has_keys:
+            logger.warning("MarketFetcher: Pas de clé SerpAPI configurée.")
+            return 0
         db = SessionLocal()
         updated = 0
         try:
-            # Récupérer les offres validées sans prix de revente
-            targets = db.query(OffreRetail).filter(
-                OffreRetail.qa_status == "VALIDATED",
-                OffreRetail.prix_revente_marche == None
-            ).all()
-
-            if not targets:
+            by_ean, names = self._load_targets(db, limit, refresh_budget)
+            if not by_ean:
                 logger.info("Aucune offre VALIDATED nécessitant un scan marché.")
                 return 0
+            offers = sum(len(ids) for ids in by_ean.values())
+            logger.info(f"Market Fetcher: {offers} offres à scanner ({len(by_ean)} EAN distincts).")
 
-            logger.info(f"Market Fetcher: {len(targets)} offres à scanner.")
+            limiter = _RateLimiter(self.rate_per_s)
+            pending: dict[str, float] = {}
+            eans = iter(by_ean)
+            exhausted = False
 
-            for offre in targets:
-                # Obtenir le nom générique
-                prod = db.query(ProduitReference).filter_by(ean=offre.ean).first()
-                nom = prod.nom_genere if prod else ""
-                
-                try:
-                    price = self.fetch_market_price(offre.ean, nom)
+            async def worker(client: httpx.AsyncClient):
+                nonlocal exhausted
+                for ean in eans:  # itérateur partagé : chaque EAN n'est pris qu'une fois
+                    if exhausted:
+                        return
+                    try:
+                        price = await self._fetch_async(client, limiter, ean, names.get(ean) or "")
+                    except AllKeysExhaustedError as e:
+                        logger.error(f"Market Fetcher Fatal Error: {e}")
+                        exhausted = True  # On arrête le batch pour l'instant, on laisse courir
+                        return
                     if price is not None:
-                        offre.prix_revente_marche = price
-                        # NEW Phase 5: Historiser le prix
-                        from core.models import PriceHistory
-                        history_entry = PriceHistory(ean=offre.ean, prix_revente=price)
-                        db.add(history_entry)
-                        
-                        updated += 1
-                        db.commit() # Commit ligne par ligne pour sécuriser le quota
-                except AllKeysExhaustedError as e:
-                    logger.error(f"Market Fetcher Fatal Error: {e}")
-                    # On arrête le batch pour l'instant, on laisse courir
-                    break
-                    
-                time.sleep(1.5) # Anti-ban
-                
+                        pending[ean] = price
+
+            async def writer(tasks: list[asyncio.Task]):
+                # Écriture au fil de l'eau : le quota déjà dépensé est sécurisé par lots
+                nonlocal updated
+                while not all(task.done() for task in tasks) or pending:
+                    if len(pending) >= self.write_batch or (pending and all(task.done() for task in tasks)):
+                        batch = {ean: pending.pop(ean) for ean in list(pending)[:self.write_batch]}
+                        updated += await asyncio.to_thread(self._write, db, batch, by_ean)
+                    else:
+                        await asyncio.sleep(0.2)
+
+            async with httpx.AsyncClient(timeout=15) as client:
+                tasks = [asyncio.create_task(worker(client)) for _ in range(min(self.concurrency, len(by_ean)))]
+                await writer(tasks)
+                await asyncio.gather(*tasks)
+
             logger.info(f"Fin du batch Market Fetcher. {updated} prix mis à jour.")
             return updated
 
@@ -159,6 +312,10 @@ class MarketFetcher:
         finally:
             db.close()
 
+    def run_batch(self, limit: int = None, refresh_budget: int = MARKET_REFRESH_BUDGET) -> int:
+        """Point d'entrée synchrone (script, thread) du batch concurrent."""
+        return asyncio.run(self.run_batch_async(limit, refresh_budget))
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     fetcher = MarketFetcher()
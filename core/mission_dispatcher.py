@@ -0,0 +1,234 @@
+"""
+MODULE 13 — Mission Dispatcher (File d'URLs distribuée)
+Découpe une MissionConfig en items de travail (1 URL = 1 job MISSION_URL dans JobQueue)
+que n'importe quel nombre de nœuds workers se partagent via des leases.
+Une mission passe en mode distribué avec `extraction_params.distributed = true` :
+le scheduler l'éclate alors dans la file au lieu de l'exécuter localement.
+Chaque expansion est un run (payload `run_id`) : la finalisation (statut, événement
+EXTRACTION_DONE) ne compte que les items du run courant, pas ceux des runs précédents.
+
+Usage:
+    # Sur chaque machine / process worker :
+    python core/mission_dispatcher.py --worker-id node-1 --concurrency 2
+
+    # Côté scheduler :
+    from core.mission_dispatcher import expand_mission
+    expand_mission(mission_id=5)
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import os
+import socket
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+from core.models import SessionLocal, MissionConfig, MissionLog, JobQueue
+from core.job_queue import enqueue, lease_jobs, keep_alive, complete_job, fail_job, DEFAULT_LEASE_S, OPEN_STATUSES
+from core.scraper_engine import ScraperEngine
+from core.pipeline import emit, EVENT_EXTRACTION_DONE, ParseStream, parse_mode, PARSE_MODE_STREAM, PARSE_MODE_DEFERRED
+
+logger = logging.getLogger("mission_dispatcher")
+
+TASK_MISSION_URL = "MISSION_URL"
+
+
+def new_run_id() -> str:
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+
+
+def _run_jobs(db, mission: MissionConfig, run_id: str = None) -> list[JobQueue]:
+    """Items MISSION_URL du run `run_id` (à défaut : créés depuis le début du run courant)."""
+    query = db.query(JobQueue).filter(
+        JobQueue.task_type == TASK_MISSION_URL,
+        JobQueue.target_id == str(mission.id),
+    )
+    if mission.last_run:
+        query = query.filter(JobQueue.created_at >= mission.last_run)
+    jobs = query.all()
+    if run_id:
+        jobs = [job for job in jobs if (job.payload or {}).get("run_id") == run_id]
+    return jobs
+
+
+def expand_mission(mission_id: int, priority: int = 10, max_retries: int = 3, run_id: str = None) -> int:
+    """
+    Crée un job MISSION_URL par URL cible, sauf si un job ouvert existe déjà pour cette URL
+    ou si elle a déjà été extraite avec succès dans ce run (relance du même MISSION_RUN).
+    Tant que des items sont ouverts, le run en cours continue (même run_id) ; sinon un
+    nouveau run démarre (`run_id` fourni ou généré, last_run = début du run).
+    Retourne le nombre de jobs créés.
+    """
+    db = SessionLocal()
+    try:
+        mission = db.query(MissionConfig).filter(MissionConfig.id == mission_id).first()
+        if not mission or not mission.target_urls:
+            logger.warning(f"Mission {mission_id} vide ou introuvable. Rien à distribuer.")
+            return 0
+
+        open_jobs = db.query(JobQueue).filter(
+            JobQueue.task_type == TASK_MISSION_URL,
+            JobQueue.target_id == str(mission_id),
+            JobQueue.status.in_(OPEN_STATUSES),
+        ).all()
+        open_urls = {(job.payload or {}).get("url") for job in open_jobs}
+        run_started = datetime.utcnow()
+        if open_jobs:
+            run_id = (open_jobs[0].payload or {}).get("run_id")
+        else:
+            run_id = run_id or new_run_id()
+
+        fresh_urls = {
+            log.url_cible
+            for log in db.query(MissionLog).filter(
+                MissionLog.mission_id == mission_id,
+                MissionLog.statut == "SUCCESS",
+                MissionLog.run_id == run_id,
+            ).all()
+        } if run_id else set()
+
+        created = 0
+        for url in mission.target_urls:
+            if url in open_urls or url in fresh_urls:
+                continue
+            enqueue(
+                TASK_MISSION_URL, target_id=str(mission_id),
+                payload={"mission_id": mission_id, "url": url, "run_id": run_id},
+                priority=priority, max_retries=max_retries, db=db,
+            )
+            log = db.query(MissionLog).filter_by(mission_id=mission_id, url_cible=url).first()
+            if not log:
+                db.add(MissionLog(mission_id=mission_id, url_cible=url, statut="PENDING"))
+            else:
+                log.statut = "PENDING"
+            created += 1
+
+        if created and not open_jobs:
+            mission.last_run = run_started
+        if created or open_urls:
+            mission.status = "RUNNING"
+        db.commit()
+        logger.info(f"Mission {mission_id}: {created} URLs distribuées dans la JobQueue.")
+        return created
+    except Exception as e:
+        logger.error(f"Distribution mission {mission_id} échouée: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+def _finalize_mission_if_done(mission_id: int, run_id: str = None):
+    """
+    Repasse la mission en IDLE (ou ERROR si toutes les URLs du run ont échoué) quand plus
+    aucun item du run `run_id` n'est ouvert.
+    """
+    db = SessionLocal()
+    try:
+        mission = db.query(MissionConfig).filter(MissionConfig.id == mission_id).first()
+        if not mission or mission.status != "RUNNING":
+            return
+        jobs = _run_jobs(db, mission, run_id)
+        if any(job.status in OPEN_STATUSES for job in jobs):
+            return
+
+        failed = [job for job in jobs if job.status == "FAILED"]
+        if mission.last_run:
+            mission.last_run_duration_s = (datetime.utcnow() - mission.last_run).total_seconds()
+        if jobs and len(failed) == len(jobs):
+            mission.status = "ERROR"
+            mission.error_message = (failed[-1].error_message or "Toutes les URLs ont échoué.")[:500]
+        else:
+            mission.status = "IDLE"
+            mission.error_message = None
+            if parse_mode(mission.extraction_params) == PARSE_MODE_DEFERRED:
+                emit(EVENT_EXTRACTION_DONE, {
+                    "mission_id": mission_id,
+                    "urls": [(job.payload or {}).get("url") for job in jobs if job.status == "DONE"],
+                }, db=db)
+        db.commit()
+        logger.info(f"Mission {mission_id} terminée en mode distribué, run {run_id} "
+                    f"({len(failed)}/{len(jobs)} URLs en échec).")
+    except Exception as e:
+        logger.error(f"Finalisation mission {mission_id} échouée: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _load_mission(mission_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(MissionConfig).filter(MissionConfig.id == mission_id).first()
+    finally:
+        db.close()
+
+
+async def process_url_job(job: dict, worker_id: str, lease_s: int = DEFAULT_LEASE_S):
+    """
+    Exécute un item MISSION_URL : extraction d'une seule URL de la mission.
+    Les accès base (JobQueue, mission) passent par asyncio.to_thread : une base lente ou
+    verrouillée ne bloque pas les autres URLs traitées par la boucle.
+    """
+    mission_id = job["payload"].get("mission_id")
+    url = job["payload"].get("url")
+    heartbeat_task = asyncio.create_task(keep_alive(job["id"], worker_id, lease_s))
+    try:
+        engine = ScraperEngine(mission_config_id=mission_id)
+        stream = None
+        mission = await asyncio.to_thread(_load_mission, mission_id)
+        if mission and parse_mode(mission.extraction_params) == PARSE_MODE_STREAM:
+            stream = ParseStream.for_mission(mission).start()
+            engine.page_sink = stream.submit
+        try:
+            result = await engine.run(urls=[url], track_status=False, run_id=job["payload"].get("run_id"))
+        finally:
+            if stream:
+                await stream.close()
+        if result.errors and not result.has_content:
+            status = await asyncio.to_thread(fail_job, job["id"], worker_id, "; ".join(result.errors))
+            logger.warning(f"  [{worker_id}] {url} en échec -> {status}")
+        else:
+            await asyncio.to_thread(complete_job, job["id"], worker_id)
+            logger.info(f"  [{worker_id}] {url} OK ({len(result.pages_html)} pages, {len(result.screenshots)} captures)")
+    except Exception as e:
+        status = await asyncio.to_thread(fail_job, job["id"], worker_id, str(e))
+        logger.error(f"  [{worker_id}] Job {job['id']} a crashé -> {status}: {e}")
+    finally:
+        heartbeat_task.cancel()
+        await asyncio.to_thread(_finalize_mission_if_done, mission_id, job["payload"].get("run_id"))
+
+
+async def url_worker_loop(worker_id: str, concurrency: int = 2, poll_s: float = 5.0,
+                          lease_s: int = DEFAULT_LEASE_S):
+    """Boucle d'un nœud worker : réclame des URLs tant qu'il a des slots libres."""
+    logger.info(f"Worker {worker_id} démarré (concurrence={concurrency}).")
+    running: set[asyncio.Task] = set()
+    while True:
+        free_slots = concurrency - len(running)
+        if free_slots > 0:
+            jobs = await asyncio.to_thread(
+                lease_jobs, worker_id, task_types=[TASK_MISSION_URL], limit=free_slots, lease_s=lease_s
+            )
+            for job in jobs:
+                task = asyncio.create_task(process_url_job(job, worker_id, lease_s))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+        await asyncio.sleep(poll_s)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="STAFF — Nœud worker de la file d'URLs distribuée")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--concurrency", type=int, default=2, help="URLs traitées en parallèle par ce nœud")
+    parser.add_argument("--poll", type=float, default=5.0, help="Intervalle de scrutation de la file (s)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(url_worker_loop(args.worker_id, args.concurrency, args.poll))
+    except KeyboardInterrupt:
+        logger.info("Worker arrêté manuellement.")
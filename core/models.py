@@ -153,6 +153,11 @@ class ApiKey(Base):
     api_key = Column(String, unique=True, nullable=False)
     status = Column(String, default="ACTIVE")
     last_used = Column(DateTime, nullable=True)
+    cooldown_until = Column(DateTime, nullable=True)   # EXHAUSTED réactivée automatiquement après cette date
+    error_count = Column(Integer, default=0)          # 429 consécutifs (backoff du cooldown)
+    quota_remaining = Column(Integer, nullable=True)  # requêtes restantes connues (None = inconnu)
+    quota_limit = Column(Integer, nullable=True)      # quota par période (KEY_QUOTA_RESET_H), None = pas de remise à zéro
+    quota_reset_at = Column(DateTime, nullable=True)  # prochaine remise de quota_remaining à quota_limit
     raw_text_extract = Column(Text, nullable=True)
     confidence = Column(Float, default=0.0)
     updated_at = Column(DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
@@ -285,6 +290,9 @@ class MissionLog(Base):
     url_cible = Column(String, nullable=False)
     statut = Column(String, default="PROCESSING")
     message_erreur = Column(Text, nullable=True)
+    last_page = Column(Integer, default=0)
+    last_page_url = Column(String, nullable=True)
+    run_id = Column(String, nullable=True)  # run (job) qui a écrit le statut / checkpoint
     timestamp = Column(DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
 
     mission = relationship("MissionConfig", backref="logs")
@@ -305,6 +313,8 @@ class JobQueue(Base):
     max_retries = Column(Integer, default=3)
     next_retry_at = Column(DateTime, default=lambda: datetime.utcnow())
     worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.utcnow())
     updated_at = Column(DateTime, default=lambda: datetime.utcnow(), onupdate=lambda: datetime.utcnow())
@@ -318,6 +328,24 @@ class SystemEventLog(Base):
     details = Column(JSON, nullable=True)
     timestamp = Column(DateTime, default=lambda: datetime.utcnow())
 
+class LlmCallLog(Base):
+    """Un appel réel au backend LLM : latence, tokens, coût estimé (core/llm_metrics.py)."""
+    __tablename__ = "llm_call_logs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    namespace = Column(String, index=True)
+    agent = Column(String, nullable=True)
+    mission_id = Column(Integer, nullable=True, index=True)
+    model_name = Column(String)
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    latency_ms = Column(Float)
+    retries = Column(Integer, default=0)
+    key_suffix = Column(String, nullable=True)
+    status = Column(String, default="OK")
+    error = Column(Text, nullable=True)
+    cost_usd = Column(Float, default=0.0)
+    timestamp = Column(DateTime, default=lambda: datetime.utcnow(), index=True)
+
 # Database engine and session factory
 engine = create_engine(DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,83 @@
+"""
+MODULE 14 — Page Artifacts (Checkpoints de pages capturées)
+Chaque page capturée par un Worker (HTML ou screenshot PNG) est écrite sur disque
+sous data/pages/mission_<id>/ pour qu'une mission interrompue puisse reprendre
+sans re-scraper ce qui a déjà été capturé.
+
+Usage:
+    from core.page_artifacts import page_artifacts
+    page_artifacts.save(5, url, 2, html)
+    pages = page_artifacts.load(5, url)      # [(1, html_p1), (2, html_p2)]
+"""
+import os
+import hashlib
+import logging
+import shutil
+from pathlib import Path
+from typing import Union
+
+from core.config import PAGES_DIR
+
+logger = logging.getLogger("page_artifacts")
+
+
+class PageArtifactStore:
+    """Stockage fichier des pages capturées, indexé par (mission, URL, numéro de page)."""
+
+    def __init__(self, base_dir: Path = PAGES_DIR):
+        self.base_dir = Path(base_dir)
+
+    def _mission_dir(self, mission_id: int) -> Path:
+        return self.base_dir / f"mission_{mission_id}"
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+    def save(self, mission_id: int, url: str, page_num: int, content: Union[str, bytes]) -> Path:
+        """Écrit la page (atomique). HTML -> .html, screenshot -> .png."""
+        directory = self._mission_dir(mission_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        ext = "png" if isinstance(content, bytes) else "html"
+        path = directory / f"{self._url_key(url)}_p{page_num:04d}.{ext}"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        if isinstance(content, bytes):
+            tmp.write_bytes(content)
+        else:
+            tmp.write_text(content, encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+    def load(self, mission_id: int, url: str, up_to_page: int = None) -> list[tuple[int, Union[str, bytes]]]:
+        """Retourne les pages stockées pour cette URL, triées par numéro de page."""
+        directory = self._mission_dir(mission_id)
+        if not directory.exists():
+            return []
+        pages = []
+        for path in sorted(directory.glob(f"{self._url_key(url)}_p*.*")):
+            if path.suffix not in (".html", ".png"):
+                continue
+            page_num = int(path.stem.rsplit("_p", 1)[1])
+            if up_to_page is not None and page_num > up_to_page:
+                continue
+            content = path.read_bytes() if path.suffix == ".png" else path.read_text(encoding="utf-8")
+            pages.append((page_num, content))
+        return pages
+
+    def clear(self, mission_id: int, url: str = None):
+        """Supprime les pages d'une URL (ou de toute la mission si url=None)."""
+        directory = self._mission_dir(mission_id)
+        if not directory.exists():
+            return
+        if url is None:
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        for path in directory.glob(f"{self._url_key(url)}_p*.*"):
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"  Suppression artefact {path.name} échouée: {e}")
+
+
+# --- Instance partagée ---
+page_artifacts = PageArtifactStore()
@@ -0,0 +1,300 @@
+"""
+MODULE 19 — Pipeline (Chaînage événementiel Extraction -> Parsing -> EAN -> Collision)
+Chaque étape qui se termine émet un événement ; le graphe STAGE_GRAPH le traduit en
+jobs JobQueue pour les étapes aval, restreints aux offres / EAN réellement impactés.
+La JobQueue sert de table outbox : `emit(..., db=session)` écrit les jobs dans la même
+transaction que les données de l'étape (pas d'événement perdu ni fantôme), et sur
+Postgres le NOTIFY émis au commit réveille aussitôt les exécuteurs en LISTEN.
+
+    EXTRACTION_DONE  -> PIPELINE_PARSE      (pages capturées -> OffreRetail / LevierActif)
+    OFFERS_PARSED    -> PIPELINE_EAN        (résolution des EAN GEN- des offres créées)
+    OFFERS_READY     -> PIPELINE_COLLISION  (collision limitée à ces offres)
+    MARKET_UPDATED   -> PIPELINE_COLLISION  (collision limitée aux EAN re-sondés)
+
+Parsing en flux (`extraction_params.parse_mode = "stream"`, défaut) : les pages sont
+parsées au fil de leur capture par un ParseStream (file asyncio + pool borné d'appels
+LLM), validées et persistées par lots ; le parsing chevauche donc le scraping et
+EXTRACTION_DONE n'est pas émis. Avec "deferred", PIPELINE_PARSE relit les pages
+capturées une fois l'extraction terminée (même ParseStream, alimenté par les artefacts).
+
+Usage:
+    from core.pipeline import emit, EVENT_MARKET_UPDATED
+    emit(EVENT_MARKET_UPDATED, {"eans": ["3600523614455"]}, db=db)
+    db.commit()
+
+    stream = ParseStream(AiParser("catalogue", mission_id=5), mission_id=5).start()
+    engine.page_sink = stream.submit
+    await engine.run()
+    stats = await stream.close()
+"""
+import asyncio
+import logging
+
+from core.config import PARSE_CONCURRENCY, PARSE_BATCH_SIZE
+from core.models import SessionLocal, MissionConfig, AgentConfig, OffreRetail, ProduitReference, LevierActif
+from core.extraction_schemas import validate_batch
+from core.job_queue import enqueue
+from core.job_executor import register_handler
+from core.page_artifacts import page_artifacts
+from core.llm_metrics import call_context
+
+logger = logging.getLogger("pipeline")
+
+EVENT_EXTRACTION_DONE = "EXTRACTION_DONE"
+EVENT_OFFERS_PARSED = "OFFERS_PARSED"
+EVENT_OFFERS_READY = "OFFERS_READY"
+EVENT_MARKET_UPDATED = "MARKET_UPDATED"
+
+TASK_PARSE = "PIPELINE_PARSE"
+TASK_EAN = "PIPELINE_EAN"
+TASK_COLLISION = "PIPELINE_COLLISION"
+
+STAGE_GRAPH = {
+    EVENT_EXTRACTION_DONE: [TASK_PARSE],
+    EVENT_OFFERS_PARSED: [TASK_EAN],
+    EVENT_OFFERS_READY: [TASK_COLLISION],
+    EVENT_MARKET_UPDATED: [TASK_COLLISION],
+}
+
+# Les étapes pipeline passent devant les extractions planifiées
+PIPELINE_PRIORITY = 6
+
+PARSE_MODE_STREAM = "stream"
+PARSE_MODE_DEFERRED = "deferred"
+
+# AgentConfig.type_agent de l'agent utilisé pour l'étape EAN (sinon l'étape est sautée)
+EAN_PIVOT_AGENT_TYPE = "EAN_PIVOT"
+
+
+def emit(event_type: str, payload: dict, db=None) -> list[int]:
+    """
+    Publie un événement : un job par étape aval. Avec `db`, l'écriture rejoint la
+    transaction de l'appelant (commit à sa charge). Retourne les ids des jobs créés.
+    """
+    job_ids = [
+        enqueue(task_type, payload={"event": event_type, **payload},
+                priority=PIPELINE_PRIORITY, max_retries=3, db=db)
+        for task_type in STAGE_GRAPH.get(event_type, [])
+    ]
+    logger.info(f"Événement {event_type} -> {len(job_ids)} job(s) aval.")
+    return job_ids
+
+
+def _affected_offers_for_levers(db, lever_ids: list[int]) -> list[int]:
+    """Offres actives concernées par de nouveaux leviers (enseigne, puis marque / EAN)."""
+    offre_ids = set()
+    for lever in db.query(LevierActif).filter(LevierActif.id.in_(lever_ids)).all():
+        query = db.query(OffreRetail.id).filter(OffreRetail.is_active == True)
+        if lever.enseigne_cible:
+            query = query.filter(OffreRetail.enseigne == lever.enseigne_cible)
+        if lever.ean_cible:
+            query = query.filter(OffreRetail.ean == lever.ean_cible)
+        elif lever.marque_cible:
+            query = query.join(ProduitReference, ProduitReference.ean == OffreRetail.ean).filter(
+                ProduitReference.marque == lever.marque_cible
+            )
+        offre_ids.update(row.id for row in query.all())
+    return sorted(offre_ids)
+
+
+def parse_mode(extraction_params: dict) -> str:
+    """Mode de parsing d'une mission : "stream", "deferred", ou "" si le pipeline est désactivé."""
+    params = extraction_params or {}
+    if not params.get("pipeline", True):
+        return ""
+    return params.get("parse_mode", PARSE_MODE_STREAM)
+
+
+class ParseStream:
+    """
+    Étape de parsing producteur / consommateur.
+    `submit` (callback on_page des Workers, appelé dans la boucle asyncio) enfile chaque
+    page capturée ; `concurrency` consommateurs la parsent via le LLM (dans des threads,
+    sous le slot "llm" du ResourceBudget). La réponse est lue en flux : chaque élément
+    rejoint le lot dès que son objet JSON est complet, sans attendre la fin de la page.
+    Un lot plein (`batch_size`) est validé en un seul validate_batch et persisté dans une
+    seule transaction, avec l'événement aval (OFFERS_PARSED / OFFERS_READY) en outbox.
+    """
+
+    def __init__(self, parser, mission_id: int, concurrency: int = None, batch_size: int = None):
+        self.parser = parser
+        self.mission_id = mission_id
+        self.concurrency = max(1, concurrency or PARSE_CONCURRENCY)
+        self.batch_size = max(1, batch_size or PARSE_BATCH_SIZE)
+        self.queue: asyncio.Queue = None
+        self._consumers: list[asyncio.Task] = []
+        self._flush_lock: asyncio.Lock = None
+        self._pending: list[dict] = []
+        self._flushes: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop = None
+        self.stats = {"pages": 0, "parsed": 0, "failed_pages": 0, "rejected": 0,
+                      "persisted": 0, "failed_batches": 0}
+
+    @classmethod
+    def for_mission(cls, mission: MissionConfig) -> "ParseStream":
+        from core.ai_parser import AiParser
+        params = mission.extraction_params or {}
+        parser = AiParser(mission.output_schema or "catalogue", prompt_override=mission.ai_prompt_override,
+                          mission_id=mission.id, lax_prices=params.get("lax_prices", False),
+                          profile=params.get("extraction_profile"))
+        return cls(parser, mission.id, concurrency=params.get("parse_concurrency"),
+                   batch_size=params.get("parse_batch_size"))
+
+    def start(self) -> "ParseStream":
+        self.queue = asyncio.Queue()
+        self._flush_lock = asyncio.Lock()
+        self._loop = asyncio.get_running_loop()
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        return self
+
+    def submit(self, url: str, page_num: int, page_url: str, content):
+        """Producteur : enfile une page capturée (signature du callback on_page)."""
+        self.stats["pages"] += 1
+        self.queue.put_nowait((url, page_num, content))
+
+    async def _consume(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            url, page_num, content = item
+            try:
+                with call_context(agent=f"ai_parser:{self.parser.template_type}", mission_id=self.mission_id):
+                    await asyncio.to_thread(self._drain_page, content, url)
+            except Exception as e:
+                # Les éléments déjà rendus avant l'erreur restent dans le lot
+                self.stats["failed_pages"] += 1
+                logger.warning(f"  Parsing page {page_num} de {url} échoué: {e}")
+                continue
+            self.stats["parsed"] += 1
+
+    def _drain_page(self, content, url: str):
+        """Thread : transmet chaque élément à la boucle dès que le parser le rend."""
+        for raw in self.parser.iter_page(content, url):
+            self._loop.call_soon_threadsafe(self._add_item, raw, url)
+
+    def _add_item(self, raw: dict, url: str):
+        self._pending.extend(self.parser.prepare([raw], url))
+        if len(self._pending) >= self.batch_size:
+            task = asyncio.create_task(self._flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self):
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            valid, errors = validate_batch(self.parser.template_type, batch, lax_prices=self.parser.lax_prices)
+            self.stats["rejected"] += len(errors)
+            if not valid:
+                return
+            try:
+                self.stats["persisted"] += await asyncio.to_thread(self._write_batch, valid)
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                logger.error(f"  Persistance d'un lot de {len(valid)} élément(s) échouée: {e}")
+
+    def _write_batch(self, items: list) -> int:
+        db = SessionLocal()
+        try:
+            ids = self.parser.persist(items, db)
+            if self.parser.template_type == "regles":
+                offre_ids = _affected_offers_for_levers(db, ids)
+                if offre_ids:
+                    emit(EVENT_OFFERS_READY, {"offre_ids": offre_ids, "mission_id": self.mission_id}, db=db)
+            else:
+                emit(EVENT_OFFERS_PARSED, {"offre_ids": ids, "mission_id": self.mission_id}, db=db)
+            db.commit()
+            return len(ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def close(self) -> dict:
+        """Attend la fin des pages en file, persiste le dernier lot et retourne les stats."""
+        for _ in self._consumers:
+            self.queue.put_nowait(None)
+        await asyncio.gather(*self._consumers)
+        await asyncio.sleep(0)  # éléments transmis par les threads juste avant leur fin
+        await asyncio.gather(*self._flushes)
+        await self._flush()
+        self.stats.update(getattr(self.parser, "stats", {}))
+        logger.info(
+            f"  Parsing mission {self.mission_id}: {self.stats['parsed']}/{self.stats['pages']} page(s), "
+            f"{self.stats['persisted']} élément(s) persisté(s), {self.stats['rejected']} rejeté(s)."
+        )
+        return self.stats
+
+
+@register_handler(TASK_PARSE, slots=2)
+async def _parse_stage(job: dict):
+    """Parse (mode deferred) les pages capturées de la mission via un ParseStream alimenté par les artefacts."""
+    payload = job["payload"]
+    mission_id = payload["mission_id"]
+    db = SessionLocal()
+    try:
+        mission = db.query(MissionConfig).filter(MissionConfig.id == mission_id).first()
+        if not mission:
+            logger.warning(f"  Parsing: mission {mission_id} introuvable.")
+            return
+        stream = ParseStream.for_mission(mission)
+        urls = payload.get("urls") or mission.target_urls or []
+    finally:
+        db.close()
+
+    stream.start()
+    for url in urls:
+        for page_num, content in page_artifacts.load(mission_id, url):
+            stream.submit(url, page_num, url, content)
+    stats = await stream.close()
+    if stats["failed_batches"] or (stats["pages"] and not stats["parsed"]):
+        raise RuntimeError(f"Parsing mission {mission_id} incomplet: {stats}")
+
+
+@register_handler(TASK_EAN)
+async def _ean_stage(job: dict):
+    """Résout les EAN temporaires (GEN-) des offres reçues, puis les transmet à la collision."""
+    offre_ids = job["payload"].get("offre_ids", [])
+    db = SessionLocal()
+    try:
+        gen_eans = sorted({
+            row.ean for row in db.query(OffreRetail.ean).filter(
+                OffreRetail.id.in_(offre_ids), OffreRetail.ean.like("GEN-%")
+            ).all()
+        })
+        pivot = db.query(AgentConfig).filter(
+            AgentConfig.type_agent == EAN_PIVOT_AGENT_TYPE, AgentConfig.is_active == True
+        ).first()
+        pivot_id = pivot.id if pivot else None
+    finally:
+        db.close()
+
+    if gen_eans and pivot_id:
+        from agents.ean_pivot_agent import EanPivotAgent
+        await EanPivotAgent(pivot_id, only_eans=gen_eans).run()
+    elif gen_eans:
+        logger.info(f"  Étape EAN sautée : aucun agent {EAN_PIVOT_AGENT_TYPE} actif ({len(gen_eans)} GEN- en attente).")
+
+    db = SessionLocal()
+    try:
+        emit(EVENT_OFFERS_READY, {"offre_ids": offre_ids}, db=db)
+        db.commit()
+    finally:
+        db.close()
+
+
+@register_handler(TASK_COLLISION)
+async def _collision_stage(job: dict):
+    """Collision restreinte aux offres (ou EAN) impactés par l'événement."""
+    from engine.collision_engine import CollisionEngine
+
+    payload = job["payload"]
+    engine = CollisionEngine(min_roi_percent=payload.get("min_roi_percent", 15.0))
+    result = await asyncio.to_thread(
+        engine.run_collision, offre_ids=payload.get("offre_ids"), eans=payload.get("eans")
+    )
+    if result.get("error"):
+        raise RuntimeError(result["error"])
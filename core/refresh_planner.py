@@ -0,0 +1,209 @@
+"""
+MODULE 32 — Refresh Planner (Rafraîchissements marché priorisés par valeur attendue)
+Le budget SerpAPI (Market Fetcher) et le budget navigateur (Sonde Marché) sont limités :
+chaque EAN reçoit un score de valeur attendue d'un nouveau relevé, et les relevés sont
+lancés par score décroissant (les meilleurs passent avant un épuisement de quota).
+
+    score = enjeu × facteur ROI × probabilité de changement × urgence
+  - enjeu : meilleur profit net (CollisionResult) ; EAN jamais coté : prix public ×
+    REFRESH_UNPRICED_MARGIN ; plancher REFRESH_MIN_STAKE pour ne jamais ignorer un EAN
+  - facteur ROI : 1 + ROI / 100 (plafonné à 3)
+  - probabilité de changement : 1 - exp(-âge / horizon), horizon = REFRESH_HORIZON_H
+    pour une volatilité de REFRESH_DEFAULT_VOLATILITY, plus court si les prix
+    historisés (PriceHistory, REFRESH_VOLATILITY_WINDOW_D jours) varient davantage ;
+    1 si l'EAN n'a jamais été relevé
+  - urgence : promo (date_fin_promo) finissant sous REFRESH_PROMO_WINDOW_H -> jusqu'à ×2 ;
+    toutes les promos de l'EAN terminées -> 0 (relevé inutile)
+
+Usage:
+    from core.refresh_planner import RefreshPlanner
+    plan = RefreshPlanner().plan(scope="fetcher", budget=300)   # offres VALIDATED (SerpAPI)
+    plan = RefreshPlanner().plan(scope="probe", budget=30)      # Sonde Marché (navigateur)
+    for candidate in plan:
+        candidate.ean, candidate.score, candidate.offre_ids
+"""
+import math
+import logging
+import statistics
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+
+from core.models import SessionLocal, OffreRetail, ProduitReference, PriceHistory, CollisionResult, MarketSonde
+from core.market_cache import market_cache, SOURCE_SERPAPI
+from core.config import (
+    REFRESH_MIN_AGE_H, REFRESH_PROBE_MIN_AGE_H, REFRESH_HORIZON_H, REFRESH_VOLATILITY_WINDOW_D,
+    REFRESH_DEFAULT_VOLATILITY, REFRESH_PROMO_WINDOW_H, REFRESH_UNPRICED_MARGIN, REFRESH_MIN_STAKE,
+)
+
+logger = logging.getLogger("refresh_planner")
+
+SCOPE_FETCHER = "fetcher"   # offres VALIDATED, relevé SerpAPI, fraîcheur = PriceHistory / cache marché
+SCOPE_PROBE = "probe"       # produits référencés, Sonde Marché, fraîcheur = dernière MarketSonde
+IN_CHUNK = 500
+MAX_ROI_FACTOR = 3.0
+
+
+@dataclass
+class RefreshCandidate:
+    ean: str
+    nom: str = ""
+    marque: str = ""
+    offre_ids: list[int] = field(default_factory=list)
+    priced: bool = False                       # toutes les offres ont déjà un prix marché
+    profit: Optional[float] = None             # meilleur profit net (CollisionResult)
+    roi_percent: Optional[float] = None
+    prix_public: float = 0.0
+    volatility: Optional[float] = None         # coefficient de variation des prix historisés
+    age_h: Optional[float] = None              # None = jamais relevé
+    promo_hours_left: Optional[float] = None   # fin de promo la plus lointaine encore à venir
+    promo_ended: bool = False
+    score: float = 0.0
+
+
+class RefreshPlanner:
+    """Classe les EAN à rafraîchir par valeur attendue du relevé."""
+
+    def __init__(self, now: datetime = None):
+        self.now = now or datetime.utcnow()
+
+    # --- Chargement (requêtes groupées, une par source de données) ---
+
+    def _offers(self, db, scope: str) -> dict[str, RefreshCandidate]:
+        query = db.query(
+            OffreRetail.id, OffreRetail.ean, OffreRetail.prix_public,
+            OffreRetail.prix_revente_marche, OffreRetail.date_fin_promo,
+        ).filter(OffreRetail.is_active == True, OffreRetail.ean != None)
+        if scope == SCOPE_FETCHER:
+            query = query.filter(OffreRetail.qa_status == "VALIDATED")
+        candidates: dict[str, RefreshCandidate] = {}
+        promo_ends: dict[str, list] = {}
+        for offre_id, ean, prix_public, prix_marche, fin_promo in query:
+            candidate = candidates.setdefault(ean, RefreshCandidate(ean, priced=True))
+            candidate.offre_ids.append(offre_id)
+            candidate.priced = candidate.priced and prix_marche is not None
+            candidate.prix_public = max(candidate.prix_public, prix_public or 0.0)
+            promo_ends.setdefault(ean, []).append(fin_promo)
+        for ean, ends in promo_ends.items():
+            if all(end is not None and end <= self.now for end in ends):
+                candidates[ean].promo_ended = True
+            future = [end for end in ends if end is not None and end > self.now]
+            if future and len(future) == len(ends):
+                candidates[ean].promo_hours_left = (max(future) - self.now).total_seconds() / 3600
+        return candidates
+
+    def _products(self, db, candidates: dict[str, RefreshCandidate], scope: str):
+        if scope == SCOPE_PROBE:
+            # La Sonde couvre tous les produits réels, même sans offre active
+            for ean, nom, marque in db.query(ProduitReference.ean, ProduitReference.nom_genere, ProduitReference.marque).filter(
+                ~ProduitReference.ean.like("GEN-%")
+            ):
+                candidate = candidates.setdefault(ean, RefreshCandidate(ean))
+                candidate.nom, candidate.marque = nom or "", marque or ""
+            for ean in [ean for ean in candidates if ean.startswith("GEN-")]:
+                del candidates[ean]
+            return
+        eans = list(candidates)
+        for i in range(0, len(eans), IN_CHUNK):
+            for ean, nom, marque in db.query(ProduitReference.ean, ProduitReference.nom_genere, ProduitReference.marque).filter(
+                ProduitReference.ean.in_(eans[i:i + IN_CHUNK])
+            ):
+                candidates[ean].nom, candidates[ean].marque = nom or "", marque or ""
+
+    def _collisions(self, db, candidates: dict[str, RefreshCandidate]):
+        for ean, profit, roi in db.query(
+            CollisionResult.ean, func.max(CollisionResult.profit_net_absolu), func.max(CollisionResult.roi_percent)
+        ).group_by(CollisionResult.ean):
+            if ean in candidates:
+                candidates[ean].profit, candidates[ean].roi_percent = profit, roi
+
+    def _volatility(self, db, candidates: dict[str, RefreshCandidate]):
+        since = self.now - timedelta(days=REFRESH_VOLATILITY_WINDOW_D)
+        prices: dict[str, list[float]] = {}
+        for ean, prix in db.query(PriceHistory.ean, PriceHistory.prix_revente).filter(PriceHistory.fetch_date >= since):
+            if ean in candidates and prix:
+                prices.setdefault(ean, []).append(prix)
+        for ean, values in prices.items():
+            if len(values) >= 2:
+                candidates[ean].volatility = statistics.pstdev(values) / statistics.fmean(values)
+
+    def _ages(self, db, candidates: dict[str, RefreshCandidate], scope: str):
+        if scope == SCOPE_PROBE:
+            latest = db.query(MarketSonde.ean, func.max(MarketSonde.timestamp)).group_by(MarketSonde.ean)
+        else:
+            latest = db.query(PriceHistory.ean, func.max(PriceHistory.fetch_date)).group_by(PriceHistory.ean)
+        for ean, last in latest:
+            if ean in candidates and last:
+                candidates[ean].age_h = (self.now - last).total_seconds() / 3600
+        if scope == SCOPE_FETCHER:
+            # Une cotation SerpAPI encore en cache rend le relevé gratuit mais inutile
+            for ean, age_s in market_cache.ages(SOURCE_SERPAPI, list(candidates)).items():
+                age_h = age_s / 3600
+                current = candidates[ean].age_h
+                candidates[ean].age_h = age_h if current is None else min(current, age_h)
+
+    # --- Score ---
+
+    @staticmethod
+    def score(candidate: RefreshCandidate) -> float:
+        if candidate.promo_ended:
+            return 0.0
+        if candidate.profit is not None:
+            stake = max(candidate.profit, 0.0)
+        else:
+            stake = candidate.prix_public * REFRESH_UNPRICED_MARGIN
+        stake = max(stake, REFRESH_MIN_STAKE)
+        roi_factor = min(1.0 + max(candidate.roi_percent or 0.0, 0.0) / 100, MAX_ROI_FACTOR)
+        if candidate.age_h is None:
+            change = 1.0
+        else:
+            volatility = candidate.volatility if candidate.volatility is not None else REFRESH_DEFAULT_VOLATILITY
+            horizon_h = REFRESH_HORIZON_H * REFRESH_DEFAULT_VOLATILITY / max(volatility, 0.01)
+            change = 1.0 - math.exp(-candidate.age_h / horizon_h)
+        urgency = 1.0
+        if candidate.promo_hours_left is not None and candidate.promo_hours_left < REFRESH_PROMO_WINDOW_H:
+            urgency = 2.0 - candidate.promo_hours_left / REFRESH_PROMO_WINDOW_H
+        return stake * roi_factor * change * urgency
+
+    def plan(self, scope: str = SCOPE_FETCHER, budget: int = None, include_unpriced: bool = True,
+             db=None) -> list[RefreshCandidate]:
+        """
+        EAN à rafraîchir, par score décroissant.
+        scope "fetcher" : les EAN dont une offre n'a pas de prix marché (si include_unpriced) sont tous
+        retenus, les EAN déjà cotés depuis plus de REFRESH_MIN_AGE_H se partagent `budget`. scope "probe" : les EAN
+        sans sonde de moins de REFRESH_PROBE_MIN_AGE_H se partagent `budget`.
+        """
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            candidates = self._offers(db, scope)
+            self._products(db, candidates, scope)
+            self._collisions(db, candidates)
+            self._volatility(db, candidates)
+            self._ages(db, candidates, scope)
+        finally:
+            if own_session:
+                db.close()
+
+        min_age_h = REFRESH_PROBE_MIN_AGE_H if scope == SCOPE_PROBE else REFRESH_MIN_AGE_H
+        mandatory, optional = [], []
+        for candidate in candidates.values():
+            candidate.score = self.score(candidate)
+            if candidate.score <= 0:
+                continue
+            if scope == SCOPE_FETCHER and not candidate.priced:
+                if include_unpriced:
+                    mandatory.append(candidate)
+            elif candidate.age_h is None or candidate.age_h >= min_age_h:
+                optional.append(candidate)
+
+        optional.sort(key=lambda c: c.score, reverse=True)
+        if budget is not None:
+            optional = optional[:max(0, budget)]
+        plan = sorted(mandatory + optional, key=lambda c: c.score, reverse=True)
+        logger.info(f"Plan de rafraîchissement ({scope}): {len(plan)} EAN "
+                    f"({len(mandatory)} sans prix, {len(optional)} à re-coter) sur {len(candidates)}.")
+        return plan
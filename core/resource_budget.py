@@ -0,0 +1,212 @@
+"""
+MODULE 17 — Resource Budget (Slots par type de ressource + contrôle d'admission)
+Plafonne ce qu'un process lance en parallèle, quel que soit le nombre de jobs échus :
+  - "browser" : instances Chromium (Caméléon = 1 slot, Vision Sniper = 2 slots à DPR 2)
+  - "http"    : requêtes du Worker Furtif et du Market Fetcher
+  - "llm"     : appels Gemini (synchrones, depuis n'importe quel thread)
+Avant d'ouvrir un navigateur, le contrôleur d'admission attend que le CPU, la RAM
+système et le RSS du process (+ enfants Chromium) repassent sous leurs seuils.
+psutil est optionnel : sans lui, seule la limite de slots s'applique.
+En multi-process (core/supervisor.py), les compteurs sont partagés : les capacités
+restent des plafonds pour l'hôte entier, pas par exécuteur. Chaque process écrit sa
+propre ligne du tableau partagé, remise à zéro par le superviseur s'il meurt.
+
+Usage:
+    from core.resource_budget import resource_budget
+    async with resource_budget.worker_slot("VISION_SNIPER"):
+        ...
+    with resource_budget.sync_slot("llm"):
+        response = model.generate_content(prompt)
+"""
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import psutil
+    # Le premier cpu_percent(None) d'un process renvoie toujours 0.0 : on l'amorce à l'import
+    # pour que la première admission d'un exécuteur fraîchement lancé mesure une vraie charge
+    psutil.cpu_percent(interval=None)
+except ImportError:
+    psutil = None  # Admission basée uniquement sur les slots
+
+from core.config import (
+    BUDGET_BROWSER_SLOTS, BUDGET_HTTP_SLOTS, BUDGET_LLM_SLOTS,
+    ADMISSION_MAX_CPU_PERCENT, ADMISSION_MAX_MEM_PERCENT, ADMISSION_MAX_RSS_MB,
+)
+
+logger = logging.getLogger("resource_budget")
+
+# worker_type -> (ressource, poids)
+WORKER_BUDGETS = {
+    "API_FURTIF": ("http", 1),
+    "HEADLESS_CAMELEON": ("browser", 1),
+    "VISION_SNIPER": ("browser", 2),
+}
+
+POLL_S = 0.25
+ADMISSION_MAX_WAIT_S = 300
+CPU_MIN_SAMPLE_S = 0.2  # fenêtre minimale de mesure CPU (juste après l'amorçage)
+_CPU_PRIMED_AT = time.monotonic()
+
+
+class ResourceBudget:
+    """
+    Compteurs de slots pondérés, partagés par toutes les boucles asyncio et threads du process.
+    L'attente se fait par scrutation courte : le même budget sert au code async et sync.
+    """
+
+    def __init__(self, capacities: dict[str, int] = None):
+        self.capacities = dict(capacities or {
+            "browser": BUDGET_BROWSER_SLOTS,
+            "http": BUDGET_HTTP_SLOTS,
+            "llm": BUDGET_LLM_SLOTS,
+        })
+        self.waiting = {name: 0 for name in self.capacities}
+        self._index = {name: i for i, name in enumerate(self.capacities)}
+        self._counters = [0] * len(self.capacities)  # une ligne par process, ligne self._row pour celui-ci
+        self._rows, self._row = 1, 0
+        self._lock = threading.Lock()
+        self._waiting_lock = threading.Lock()  # attentes : propres au process
+
+    def make_shared(self, ctx, processes: int) -> dict:
+        """Compteurs partagés (une ligne par process exécuteur), à créer par le superviseur."""
+        return {
+            "lock": ctx.Lock(),
+            "counters": ctx.Array("i", processes * len(self.capacities), lock=False),
+            "rows": processes,
+        }
+
+    def attach(self, shared: dict, row: int):
+        """Branche ce process sur les compteurs partagés de l'hôte (appelé au démarrage de l'exécuteur)."""
+        self._lock, self._counters = shared["lock"], shared["counters"]
+        self._rows, self._row = shared["rows"], row
+
+    def release_row(self, shared: dict, row: int):
+        """Rend les slots encore tenus par un process mort (côté superviseur)."""
+        width = len(self.capacities)
+        with shared["lock"]:
+            for i in range(row * width, (row + 1) * width):
+                shared["counters"][i] = 0
+
+    def _used(self, resource: str) -> int:
+        width, index = len(self.capacities), self._index[resource]
+        return sum(self._counters[row * width + index] for row in range(self._rows))
+
+    @property
+    def in_use(self) -> dict[str, int]:
+        with self._lock:
+            return {name: self._used(name) for name in self.capacities}
+
+    def _weight(self, resource: str, weight: int) -> int:
+        # Un poids supérieur à la capacité bloquerait indéfiniment
+        return max(1, min(weight, self.capacities[resource]))
+
+    def try_acquire(self, resource: str, weight: int = 1) -> bool:
+        weight = self._weight(resource, weight)
+        with self._lock:
+            if self._used(resource) + weight > self.capacities[resource]:
+                return False
+            self._counters[self._row * len(self.capacities) + self._index[resource]] += weight
+            return True
+
+    def release(self, resource: str, weight: int = 1):
+        weight = self._weight(resource, weight)
+        with self._lock:
+            slot = self._row * len(self.capacities) + self._index[resource]
+            self._counters[slot] = max(0, self._counters[slot] - weight)
+
+    def _set_waiting(self, resource: str, delta: int):
+        with self._waiting_lock:
+            self.waiting[resource] += delta
+
+    @asynccontextmanager
+    async def slot(self, resource: str, weight: int = 1):
+        if not self.try_acquire(resource, weight):
+            self._set_waiting(resource, 1)
+            try:
+                while not self.try_acquire(resource, weight):
+                    await asyncio.sleep(POLL_S)
+            finally:
+                self._set_waiting(resource, -1)
+        try:
+            yield
+        finally:
+            self.release(resource, weight)
+
+    @contextmanager
+    def sync_slot(self, resource: str, weight: int = 1):
+        if not self.try_acquire(resource, weight):
+            self._set_waiting(resource, 1)
+            try:
+                while not self.try_acquire(resource, weight):
+                    time.sleep(POLL_S)
+            finally:
+                self._set_waiting(resource, -1)
+        try:
+            yield
+        finally:
+            self.release(resource, weight)
+
+    @asynccontextmanager
+    async def worker_slot(self, worker_type: str):
+        """Admission (charge machine) puis slot pondéré du type de Worker."""
+        resource, weight = WORKER_BUDGETS.get(worker_type, ("http", 1))
+        if resource == "browser":
+            await wait_for_host_capacity()
+        async with self.slot(resource, weight):
+            yield
+
+    def snapshot(self) -> dict:
+        """in_use : total de l'hôte (tous exécuteurs) ; waiting : attentes de ce process."""
+        in_use = self.in_use
+        return {
+            name: {"in_use": in_use[name], "capacity": cap, "waiting": self.waiting[name]}
+            for name, cap in self.capacities.items()
+        }
+
+
+def host_overloaded() -> str:
+    """Retourne la raison de surcharge (CPU / RAM / RSS) ou une chaîne vide."""
+    if psutil is None:
+        return ""
+    # Mesure depuis l'appel précédent ; trop peu de recul après l'amorçage -> courte fenêtre bloquante
+    since_prime = time.monotonic() - _CPU_PRIMED_AT
+    cpu = psutil.cpu_percent(interval=None if since_prime >= CPU_MIN_SAMPLE_S else CPU_MIN_SAMPLE_S - since_prime)
+    if cpu > ADMISSION_MAX_CPU_PERCENT:
+        return f"CPU {cpu:.0f}% > {ADMISSION_MAX_CPU_PERCENT:.0f}%"
+    mem = psutil.virtual_memory().percent
+    if mem > ADMISSION_MAX_MEM_PERCENT:
+        return f"RAM {mem:.0f}% > {ADMISSION_MAX_MEM_PERCENT:.0f}%"
+    if ADMISSION_MAX_RSS_MB > 0:
+        proc = psutil.Process()
+        rss = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        rss_mb = rss / (1024 * 1024)
+        if rss_mb > ADMISSION_MAX_RSS_MB:
+            return f"RSS {rss_mb:.0f} MB > {ADMISSION_MAX_RSS_MB:.0f} MB"
+    return ""
+
+
+async def wait_for_host_capacity(max_wait_s: float = ADMISSION_MAX_WAIT_S):
+    """Retarde l'admission tant que la machine est saturée (au plus `max_wait_s`)."""
+    reason = host_overloaded()
+    if not reason:
+        return
+    logger.info(f"  Admission différée: {reason}")
+    deadline = time.time() + max_wait_s
+    while reason and time.time() < deadline:
+        await asyncio.sleep(2.0)
+        reason = host_overloaded()
+    if reason:
+        logger.warning(f"  Admission forcée après {max_wait_s:.0f}s d'attente ({reason}).")
+
+
+# --- Instance partagée par process ---
+resource_budget = ResourceBudget()
@@ -3,37 +3,72 @@ MODULE 3 — Scheduler Worker V3 (Dynamic Polling)
 Ce script tourne en arrière-plan (daemon).
 Il scrute les AgentConfig et MissionConfig dont is_active=True,
 et lance ScraperEngine selon les fréquences définies.
+NEW V5: Planification cron réelle (tas des prochaines échéances, rattrapage borné, jitter).
+NEW V6: Le planning ne lance plus rien lui-même : il enfile des jobs dans la JobQueue,
+consommés par un ou plusieurs exécuteurs (priorités, leases, retries, dead-letter).
 NEW V4: Logging granulaire URL par URL avec la table MissionLog pour éviter les crashs globaux d'une mission en cas d'échec sur une seule URL.
 """
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+import os
 import time
+import heapq
+import random
+import socket
 import asyncio
 import logging
-from datetime import datetime
+import argparse
+from datetime import datetime, timedelta, timezone
 
-from core.models import SessionLocal, AgentConfig, MissionConfig, MissionLog
+from sqlalchemy import func
+
+from core.models import SessionLocal, AgentConfig, MissionConfig, MissionLog, JobQueue
 from core.scraper_engine import ScraperEngine
+from core.mission_dispatcher import expand_mission
+from core.pipeline import emit, EVENT_EXTRACTION_DONE, ParseStream, parse_mode, PARSE_MODE_STREAM, PARSE_MODE_DEFERRED
+from core.cron_schedule import next_fire_time
+from core.config import (
+    SCHEDULER_MISFIRE_GRACE_S, SCHEDULER_JITTER_S, SCHEDULER_REFRESH_S,
+    SCHEDULER_MARKET_FETCH_CRON, SCHEDULER_COLLISION_CRON, SUPERVISOR_PROCESSES,
+)
+from core.job_queue import enqueue, OPEN_STATUSES
+from core.job_executor import (
+    JobExecutor, register_handler, TASK_PRIORITY,
+    TASK_AGENT_RUN, TASK_SCOUT, TASK_MISSION_RUN, TASK_MARKET_FETCH, TASK_COLLISION_RUN,
+)
 
 logger = logging.getLogger("scheduler_worker")
 logging.basicConfig(level=logging.INFO)
 
-async def process_agent(agent_id: int):
+# Tâches système planifiées en plus des Agents / Missions (expression "manual" = désactivée)
+SYSTEM_SCHEDULES = {
+    TASK_MARKET_FETCH: SCHEDULER_MARKET_FETCH_CRON,
+    TASK_COLLISION_RUN: SCHEDULER_COLLISION_CRON,
+}
+
+async def process_agent(agent_id: int) -> bool:
+    """Exécute un Agent. Retourne False si l'extraction n'a rien produit."""
     logger.info(f"Démarrage AgentConfig ID {agent_id}")
     engine = ScraperEngine(agent_config_id=agent_id)
     try:
-        await engine.run()
+        result = await engine.run()
+        return not (result.errors and not result.has_content)
     except Exception as e:
         logger.error(f"  -> Agent {agent_id} a crashé: {e}")
+        return False
 
-async def process_mission(mission_id: int):
+async def process_mission(mission_id: int, retry_failed_only: bool = False, run_id: str = None) -> bool:
     """
     Exécute une Mission complète.
     NOUVEAUTÉ V4 : ScraperEngine gère désormais la table MissionLog via callback.
     Nous veillons ici simplement à ce que la mission soit lancée proprement
     sans que le scheduler lui-même ne crashe.
+    Reprise : relancé avec le même `run_id` (retry du job), les URLs déjà SUCCESS dans ce
+    run sont ignorées et la pagination repart du dernier checkpoint.
+    `retry_failed_only` ne relance que les URLs FAILED.
+    Retourne False si la mission a échoué (l'exécuteur la replanifie avec backoff).
     """
     logger.info(f"Démarrage MissionConfig ID {mission_id}")
     db = SessionLocal()
@@ -41,7 +76,12 @@ async def process_mission(mission_id: int):
         mission = db.query(MissionConfig).filter_by(id=mission_id).first()
         if not mission or not mission.target_urls:
             logger.warning(f"  -> Mission {mission_id} vide ou introuvable.")
-            return
+            return True
+
+        # Mode distribué : 1 URL = 1 job MISSION_URL, exécuté par les nœuds mission_dispatcher
+        if (mission.extraction_params or {}).get("distributed"):
+            expand_mission(mission_id, run_id=run_id)
+            return True
 
         # Pre-populate pending logs if they don't exist
         for url in mission.target_urls:
@@ -52,8 +92,20 @@ async def process_mission(mission_id: int):
 
         # Run Engine
         engine = ScraperEngine(mission_config_id=mission_id)
-        # L'engine mettra lui-même à jour la table via son _log_url_status
-        await engine.run()
+        mode = parse_mode(mission.extraction_params)
+        # Mode stream : les pages sont parsées pendant que le Worker continue de scraper
+        stream = ParseStream.for_mission(mission).start() if mode == PARSE_MODE_STREAM else None
+        if stream:
+            engine.page_sink = stream.submit
+        try:
+            # L'engine mettra lui-même à jour la table via son _log_url_status
+            result = await engine.run(only_failed=retry_failed_only, run_id=run_id)
+        finally:
+            if stream:
+                await stream.close()
+        if result.has_content and mode == PARSE_MODE_DEFERRED:
+            emit(EVENT_EXTRACTION_DONE, {"mission_id": mission_id, "urls": list(mission.target_urls)})
+        return not (result.errors and not result.has_content)
 
     except Exception as e:
         logger.error(f"  -> Mission {mission_id} a rencontré une erreur fatale: {e}")
@@ -65,46 +117,212 @@ async def process_mission(mission_id: int):
                 db.commit()
         except:
             pass
+        return False
+    finally:
+        db.close()
+
+
+@register_handler(TASK_AGENT_RUN)
+@register_handler(TASK_SCOUT)
+async def _agent_job(job: dict):
+    agent_id = int(job["payload"].get("agent_config_id") or job["target_id"])
+    if not await process_agent(agent_id):
+        raise RuntimeError(f"Agent {agent_id}: extraction sans contenu.")
+
+
+@register_handler(TASK_MISSION_RUN)
+async def _mission_job(job: dict):
+    mission_id = int(job["payload"].get("mission_id") or job["target_id"])
+    # Le job est le run : ses relances (retry, bail expiré) reprennent là où il s'est arrêté
+    if not await process_mission(mission_id, retry_failed_only=job["payload"].get("retry_failed_only", False),
+                                 run_id=str(job["id"])):
+        raise RuntimeError(f"Mission {mission_id}: extraction en échec.")
+
+
+def recover_interrupted_missions():
+    """
+    Au démarrage : une mission locale restée RUNNING sans aucun job MISSION_RUN ouvert
+    n'appartient plus à aucun exécuteur (lancée hors file, process mort). On la repasse IDLE.
+    Une mission dont le job est ouvert tourne peut-être sur un autre process / hôte : les
+    baux JobQueue se chargent de la reprendre si son exécuteur a disparu.
+    """
+    db = SessionLocal()
+    try:
+        running_ids = {
+            target_id for (target_id,) in db.query(JobQueue.target_id).filter(
+                JobQueue.task_type == TASK_MISSION_RUN,
+                JobQueue.status.in_(OPEN_STATUSES),
+            ).all()
+        }
+        stale = db.query(MissionConfig).filter(MissionConfig.status == "RUNNING").all()
+        recovered = 0
+        for mission in stale:
+            if (mission.extraction_params or {}).get("distributed"):
+                continue  # Les leases JobQueue gèrent déjà la reprise
+            if str(mission.id) in running_ids:
+                continue
+            mission.status = "IDLE"
+            mission.error_message = "Interrompue (hors JobQueue) — relancée au prochain créneau."
+            recovered += 1
+        db.commit()
+        if recovered:
+            logger.info(f"{recovered} mission(s) orpheline(s) repassée(s) IDLE.")
+    except Exception as e:
+        logger.error(f"Récupération des missions interrompues échouée: {e}")
+        db.rollback()
     finally:
         db.close()
 
 
-async def main_loop():
-    """Boucle infinie du Scheduler"""
-    logger.info("Scheduler démarré. En attente de jobs...")
-    
-    while True:
+class CronScheduler:
+    """
+    Planificateur cron en mémoire : un tas (min-heap) des prochaines exécutions.
+    La boucle dort jusqu'à l'échéance la plus proche (ou au prochain rafraîchissement
+    des configs) au lieu de relancer tout le parc toutes les 60 secondes.
+    Une échéance atteinte enfile un job (dédoublonné) : l'exécution revient aux JobExecutor.
+      - misfire_grace_s : une exécution manquée (scheduler arrêté) est rattrapée une seule
+        fois si son retard reste sous ce seuil, sinon elle est sautée
+      - jitter_s : décalage aléatoire [0, jitter_s] pour étaler les missions d'un même créneau
+    """
+
+    def __init__(self, misfire_grace_s: int = SCHEDULER_MISFIRE_GRACE_S,
+                 jitter_s: int = SCHEDULER_JITTER_S, refresh_s: int = SCHEDULER_REFRESH_S):
+        self.misfire_grace_s = misfire_grace_s
+        self.jitter_s = jitter_s
+        self.refresh_s = refresh_s
+        self.heap: list[tuple] = []  # (échéance avec jitter, échéance nominale, type, id)
+        self.schedules: dict[tuple, str] = {}
+        self.last_fired: dict[tuple, datetime] = {}
+        self.next_refresh: datetime = None
+
+    def _push(self, kind: str, obj_id, nominal: datetime):
+        due_at = nominal + timedelta(seconds=random.uniform(0, self.jitter_s))
+        heapq.heappush(self.heap, (due_at, nominal, kind, obj_id))
+
+    def _first_fire_time(self, expr: str, last_run: datetime, key: tuple, now: datetime):
+        """Prochaine échéance depuis la dernière exécution connue, avec rattrapage des ratés."""
+        last = last_run.replace(tzinfo=timezone.utc) if last_run else None
+        if key in self.last_fired and (last is None or self.last_fired[key] > last):
+            last = self.last_fired[key]
+        if last is None:
+            return next_fire_time(expr, after=now)
+
+        nominal = next_fire_time(expr, after=last)
+        if nominal is None or nominal > now:
+            return nominal
+
+        # Exécution(s) manquée(s) : on ne garde que la plus récente (coalescence)
+        for _ in range(10000):
+            following = next_fire_time(expr, after=nominal)
+            if following is None or following > now:
+                break
+            nominal = following
+        late_s = (now - nominal).total_seconds()
+        if late_s <= self.misfire_grace_s:
+            logger.info(f"  Rattrapage {key[0]} {key[1]} (créneau {nominal:%Y-%m-%d %H:%M} manqué de {late_s:.0f}s).")
+            return nominal
+        logger.info(f"  Créneau manqué ignoré pour {key[0]} {key[1]} ({late_s:.0f}s > grâce {self.misfire_grace_s}s).")
+        return next_fire_time(expr, after=now)
+
+    def refresh(self, now: datetime):
+        """Recharge les configs actives non-manuelles et reconstruit le tas."""
         db = SessionLocal()
-        tasks = []
         try:
-            # 1. Scrutage des Agents (Legacy Blueprint V2)
-            agents = db.query(AgentConfig).filter(AgentConfig.is_active == True, AgentConfig.frequence_cron != "manual").all()
-            for agent in agents:
-                # Logique simplifiée de cron (run all every loop for testing)
-                # En vrai, parser le frequence_cron et check last_run
-                if agent.status != "RUNNING":
-                    tasks.append(process_agent(agent.id))
-            
-            # 2. Scrutage des Missions (Nouvelle Stratégie multi-URLs V3)
-            missions = db.query(MissionConfig).filter(MissionConfig.is_active == True, MissionConfig.frequence_cron != "manual").all()
-            for mission in missions:
-                if mission.status != "RUNNING":
-                    tasks.append(process_mission(mission.id))
-
-            if tasks:
-                logger.info(f"Lancement batch de {len(tasks)} tâches d'extraction...")
-                await asyncio.gather(*tasks, return_exceptions=True)
-                
+            rows = [
+                ("agent", a.id, a.frequence_cron, a.last_run)
+                for a in db.query(AgentConfig).filter(AgentConfig.is_active == True, AgentConfig.frequence_cron != "manual").all()
+            ] + [
+                ("mission", m.id, m.frequence_cron, m.last_run)
+                for m in db.query(MissionConfig).filter(MissionConfig.is_active == True, MissionConfig.frequence_cron != "manual").all()
+            ]
+            for task_type, expr in SYSTEM_SCHEDULES.items():
+                last_created = db.query(func.max(JobQueue.created_at)).filter(JobQueue.task_type == task_type).scalar()
+                rows.append(("system", task_type, expr, last_created))
         except Exception as e:
-            logger.error(f"Erreur globale dans la boucle Scheduler : {e}")
+            logger.error(f"Rafraîchissement du planning échoué : {e}")
+            return
         finally:
             db.close()
 
-        # Pause pour éviter de spammer la BDD
-        await asyncio.sleep(60)
+        self.heap, self.schedules = [], {}
+        for kind, obj_id, expr, last_run in rows:
+            key = (kind, obj_id)
+            nominal = self._first_fire_time(expr, last_run, key, now)
+            if nominal is None:
+                continue
+            self.schedules[key] = expr
+            self._push(kind, obj_id, nominal)
+        self.next_refresh = now + timedelta(seconds=self.refresh_s)
+        logger.info(f"Planning rechargé : {len(self.heap)} tâche(s) planifiée(s).")
+
+    def _launch(self, kind: str, obj_id):
+        """Enfile le job correspondant (aucun doublon tant qu'un job identique est ouvert)."""
+        if kind == "system":
+            task_type, target_id, payload = obj_id, None, {}
+        elif kind == "agent":
+            task_type, target_id, payload = TASK_AGENT_RUN, str(obj_id), {"agent_config_id": obj_id}
+        else:
+            task_type, target_id, payload = TASK_MISSION_RUN, str(obj_id), {"mission_id": obj_id}
+        try:
+            job_id = enqueue(task_type, target_id=target_id, payload=payload,
+                             priority=TASK_PRIORITY.get(task_type, 10), unique=True)
+            logger.info(f"  -> Job {job_id} ({task_type} {target_id or ''}) en file.")
+        except Exception as e:
+            logger.error(f"  Mise en file {task_type} {target_id} échouée : {e}")
+
+    async def run_forever(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            if self.next_refresh is None or now >= self.next_refresh:
+                self.refresh(now)
+
+            while self.heap and self.heap[0][0] <= now:
+                _, nominal, kind, obj_id = heapq.heappop(self.heap)
+                key = (kind, obj_id)
+                self.last_fired[key] = nominal
+                logger.info(f"Déclenchement {kind} {obj_id} (créneau {nominal:%Y-%m-%d %H:%M}).")
+                self._launch(kind, obj_id)
+                following = next_fire_time(self.schedules[key], after=nominal)
+                if following:
+                    self._push(kind, obj_id, following)
+
+            wake_at = self.next_refresh
+            if self.heap and self.heap[0][0] < wake_at:
+                wake_at = self.heap[0][0]
+            await asyncio.sleep(max(1.0, (wake_at - datetime.now(timezone.utc)).total_seconds()))
+
+
+async def main_loop(role: str = "all", worker_id: str = None, processes: int = 0, stats_queue=None,
+                    pool_size: int = 1):
+    """
+    Boucle infinie du Scheduler.
+    role = "scheduler" (planning seul), "executor" (exécution seule) ou "all" (les deux).
+    processes = 0 : exécuteur dans ce process ; N > 0 : superviseur + N process exécuteurs.
+    pool_size : nombre d'exécuteurs du superviseur parent (slots par task_type divisés d'autant).
+    """
+    logger.info(f"Scheduler démarré (rôle={role}, process={processes or 'inline'}). En attente de jobs...")
+    loops = []
+    if role in ("all", "scheduler"):
+        recover_interrupted_missions()
+        loops.append(CronScheduler().run_forever())
+    if role in ("all", "executor"):
+        if processes > 0:
+            from core.supervisor import Supervisor
+            loops.append(Supervisor(processes, prefix=worker_id).run_forever())
+        else:
+            loops.append(JobExecutor(
+                worker_id or f"{socket.gethostname()}-{os.getpid()}", stats_queue=stats_queue, pool_size=pool_size
+            ).run_forever())
+    await asyncio.gather(*loops)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="STAFF — Scheduler cron & exécuteur JobQueue")
+    parser.add_argument("--role", choices=["all", "scheduler", "executor"], default="all")
+    parser.add_argument("--worker-id", default=None, help="Identifiant (ou préfixe en multi-process) de l'exécuteur")
+    parser.add_argument("--processes", type=int, default=SUPERVISOR_PROCESSES,
+                        help=f"Process exécuteurs à superviser (défaut: {SUPERVISOR_PROCESSES}, 0 = dans ce process)")
+    args = parser.parse_args()
     try:
-        asyncio.run(main_loop())
+        asyncio.run(main_loop(args.role, args.worker_id, args.processes))
     except KeyboardInterrupt:
         logger.info("Scheduler arrêté manuellement.")
@@ -30,15 +30,55 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional
 
+import re
 import requests
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 from core.models import SessionLocal, AgentConfig, MissionConfig
 from core.config import scrapingbee_keys, AllKeysExhaustedError
+from core.key_pool import retry_after_s
+from core.session_store import session_store
+from core.page_artifacts import page_artifacts
+from core.resource_budget import resource_budget
 
 logger = logging.getLogger("scraper_engine")
 
 # Valid worker types
 WORKER_TYPES = {"API_FURTIF", "HEADLESS_CAMELEON", "VISION_SNIPER"}
 
+# Paramètres de query reconnus comme numéro de page (pagination par URL)
+PAGE_QUERY_PARAMS = ("page", "p", "pg", "pagenumber", "page_number", "numpage")
+# Segments de chemin reconnus : /p-3, /page-3, /page/3
+PAGE_PATH_PATTERN = re.compile(r"/(p-|page-|page/)(\d+)(?=/|$)", re.IGNORECASE)
+
+
+class BlockedPageError(RuntimeError):
+    """Page de challenge / blocage anti-bot détectée."""
+    pass
+
+
+def infer_page_template(url: str) -> Optional[tuple[str, int]]:
+    """
+    Déduit un template de pagination depuis une URL déjà paginée.
+    Retourne (template avec '{page}', numéro de page courant) ou None.
+    Ex: 'https://x.fr/c?page=2' -> ('https://x.fr/c?page={page}', 2)
+        'https://x.fr/c/p-1'    -> ('https://x.fr/c/p-{page}', 1)
+    """
+    parsed = urlparse(url)
+
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    for i, (key, value) in enumerate(query):
+        if key.lower() in PAGE_QUERY_PARAMS and value.isdigit():
+            query[i] = (key, "__PAGE__")
+            new_query = urlencode(query).replace("__PAGE__", "{page}")
+            return urlunparse(parsed._replace(query=new_query)), int(value)
+
+    m = PAGE_PATH_PATTERN.search(parsed.path)
+    if m:
+        path = parsed.path[:m.start(2)] + "{page}" + parsed.path[m.end(2):]
+        return urlunparse(parsed._replace(path=path)), int(m.group(2))
+
+    return None
+
 
 # ==========================================================================
 # RÉSULTAT D'EXTRACTION — Conteneur universel
@@ -71,13 +111,14 @@ class BaseWorker(ABC):
     """Interface commune pour tous les moteurs d'extraction."""
 
     @abstractmethod
-    async def extract(self, urls: list[str], params: dict, on_url_status=None) -> ExtractionResult:
+    async def extract(self, urls: list[str], params: dict, on_url_status=None, on_page=None) -> ExtractionResult:
         """
         Exécute l'extraction sur une liste d'URLs.
         Args:
             urls: Liste d'URLs cibles
-            params: Paramètres dynamiques (selectors, headers, scroll, max_pages)
+            params: Paramètres dynamiques (selectors, headers, scroll, max_pages, resume_from)
             on_url_status: Callback(url: str, status: str, message: str) pour loguer l'avancement
+            on_page: Callback(url, page_num, page_url, content) appelé à chaque page capturée (checkpoint)
         Returns:
             ExtractionResult standardisé
         """
@@ -96,7 +137,7 @@ class ApiFurtifWorker(BaseWorker):
     def __init__(self):
         pass
 
-    async def extract(self, urls: list[str], params: dict, on_url_status=None) -> ExtractionResult:
+    async def extract(self, urls: list[str], params: dict, on_url_status=None, on_page=None) -> ExtractionResult:
         result = ExtractionResult(worker_type="API_FURTIF")
         start = time.time()
 
@@ -135,10 +176,14 @@ class ApiFurtifWorker(BaseWorker):
                         )
 
                         if resp.status_code in (401, 403, 429):
-                            logger.warning(f"  ScrapingBee: Clé épuisée ({resp.status_code}). Rotation...")
-                            scrapingbee_keys.mark_exhausted(current_key)
+                            logger.warning(f"  ScrapingBee: Clé refusée ({resp.status_code}). Rotation...")
+                            if resp.status_code == 429:
+                                scrapingbee_keys.mark_exhausted(current_key, retry_after_s(resp.headers))
+                            else:  # 401 / 403 : clé révoquée, pas de réactivation automatique
+                                scrapingbee_keys.mark_invalid(current_key, resp.status_code)
                             continue
-                            
+                        scrapingbee_keys.report_success(current_key)
+
                         # Si succès ou autre erreur sans lien avec le quota
                         break
                 else:
@@ -146,6 +191,7 @@ class ApiFurtifWorker(BaseWorker):
 
                 if resp.status_code == 200:
                     result.pages_html.append(resp.text)
+                    if on_page: on_page(url, 1, url, resp.text)
                     logger.info(f"  Furtif OK: {url} ({len(resp.text)} chars)")
                     if on_url_status: on_url_status(url, "SUCCESS")
                 else:
@@ -173,6 +219,10 @@ class HeadlessCameleonWorker(BaseWorker):
     """
     Playwright headless avec rendu JS, scroll infini et pagination CSS.
     Contourne les protections anti-bot grâce au rendu complet du navigateur.
+    Pagination :
+      - "click" (défaut)  : clic séquentiel sur `pagination_selector`
+      - "url_pattern"     : pages 1..max_pages chargées en parallèle depuis
+                            `pagination_url_template` ('...?page={page}') ou un motif déduit de l'URL
     """
 
     async def _scroll_to_bottom(self, page, max_scrolls: int = 20, pause: float = 1.5):
@@ -209,7 +259,91 @@ class HeadlessCameleonWorker(BaseWorker):
             logger.warning(f"  Pagination click échoué: {e}")
             return False
 
-    async def extract(self, urls: list[str], params: dict, on_url_status=None) -> ExtractionResult:
+    def _resolve_page_template(self, url: str, params: dict) -> Optional[tuple[str, int]]:
+        """Template explicite (pagination_url_template) ou déduit de l'URL en mode 'url_pattern'."""
+        if params.get("pagination_mode", "click") != "url_pattern":
+            return None
+        template = params.get("pagination_url_template")
+        if template:
+            return template, int(params.get("pagination_start", 1))
+        inferred = infer_page_template(url)
+        if not inferred:
+            logger.warning(f"  Aucun motif de pagination déduit pour {url}. Repli sur le mode 'click'.")
+        return inferred
+
+    async def _item_keys(self, page, item_selector: str = None) -> set[str]:
+        """Empreinte des items d'une page (liens produits) pour détecter une page sans nouveauté."""
+        keys = await page.evaluate("""
+            (sel) => {
+                const nodes = Array.from(document.querySelectorAll(sel || 'a[href]'));
+                return nodes.map(n => {
+                    const link = n.matches('a[href]') ? n : n.querySelector('a[href]');
+                    return link ? link.getAttribute('href') : (n.innerText || '').trim().slice(0, 200);
+                }).filter(Boolean);
+            }
+        """, item_selector)
+        return set(keys or [])
+
+    async def _fan_out_pages(self, context, url: str, template: str, start_page: int,
+                             params: dict, first_page: int = None, on_page=None) -> list[str]:
+        """
+        Pagination parallèle par URL : les pages sont chargées par vagues de
+        `pagination_concurrency` onglets du même contexte. Arrêt dès qu'une page
+        n'apporte aucun nouvel item (fin de catalogue, redirection vers la dernière page...).
+        `first_page` permet de reprendre après un checkpoint (pages déjà capturées ignorées).
+        """
+        max_pages = params.get("max_pages", 1)
+        concurrency = max(1, int(params.get("pagination_concurrency", 4)))
+        requires_scroll = params.get("requires_scroll", False)
+        item_selector = params.get("item_selector")
+
+        async def fetch(page_num: int):
+            page_url = url if page_num == start_page else template.format(page=page_num)
+            tab = await context.new_page()
+            try:
+                response = await tab.goto(page_url, wait_until="domcontentloaded", timeout=30000)
+                await tab.wait_for_load_state("networkidle", timeout=15000)
+                if requires_scroll:
+                    await self._scroll_to_bottom(tab)
+                html = await tab.content()
+                if session_store.looks_blocked(response.status if response else None, html):
+                    raise BlockedPageError(f"Blocage anti-bot détecté (page {page_num})")
+                if response and response.status >= 400:
+                    raise RuntimeError(f"HTTP {response.status} sur {page_url}")
+                return html, await self._item_keys(tab, item_selector)
+            finally:
+                await tab.close()
+
+        pages_html = []
+        seen = set()
+        last_page = start_page + max_pages - 1
+        first_page = first_page or start_page
+        wave_start = first_page
+        while wave_start <= last_page:
+            wave = list(range(wave_start, min(wave_start + concurrency, last_page + 1)))
+            logger.info(f"  Caméléon pages {wave[0]}-{wave[-1]} en parallèle: {url}")
+            results = await asyncio.gather(*(fetch(n) for n in wave), return_exceptions=True)
+
+            for page_num, res in zip(wave, results):
+                if isinstance(res, Exception):
+                    # La première page doit réussir ; au-delà, une erreur marque la fin du catalogue
+                    if page_num == first_page or isinstance(res, BlockedPageError):
+                        raise res
+                    logger.info(f"  Fin de pagination page {page_num}: {res}")
+                    return pages_html
+                html, keys = res
+                if page_num != first_page and not (keys - seen):
+                    logger.info(f"  Page {page_num} sans nouvel item. Arrêt de la pagination.")
+                    return pages_html
+                seen |= keys
+                pages_html.append(html)
+                if on_page:
+                    on_page(url, page_num, url if page_num == start_page else template.format(page=page_num), html)
+
+            wave_start += concurrency
+        return pages_html
+
+    async def extract(self, urls: list[str], params: dict, on_url_status=None, on_page=None) -> ExtractionResult:
         result = ExtractionResult(worker_type="HEADLESS_CAMELEON")
         start = time.time()
 
@@ -222,19 +356,23 @@ class HeadlessCameleonWorker(BaseWorker):
         max_pages = params.get("max_pages", 1)
         pagination_selector = params.get("pagination_selector")
         requires_scroll = params.get("requires_scroll", False)
+        persist_session = params.get("persist_session", True)
+        session_ttl_h = params.get("session_ttl_h", session_store.ttl_hours)
+        resume_from = params.get("resume_from", {})
 
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
             
             # Smart Batching: Group URLs by root domain
             from collections import defaultdict
-            from urllib.parse import urlparse
             domain_groups = defaultdict(list)
             for u in urls:
                 domain = urlparse(u).netloc
                 domain_groups[domain].append(u)
 
             for domain, domain_urls in domain_groups.items():
+                # Session persistée (cookies/consentement) réinjectée si encore fraîche
+                storage_state = session_store.get(domain, ttl_hours=session_ttl_h) if persist_session else None
                 context = await browser.new_context(
                     viewport={"width": 1920, "height": 1080},
                     user_agent=(
@@ -242,16 +380,49 @@ class HeadlessCameleonWorker(BaseWorker):
                         "AppleWebKit/537.36 (KHTML, like Gecko) "
                         "Chrome/120.0.0.0 Safari/537.36"
                     ),
+                    storage_state=storage_state,
                 )
+                blocked = False
+                succeeded = 0
                 try:
                     page = await context.new_page()
                     for url in domain_urls:
                         if on_url_status: on_url_status(url, "PROCESSING")
                         try:
-                            await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                            checkpoint = resume_from.get(url) or {}
+                            page_template = self._resolve_page_template(url, params) if max_pages > 1 else None
+                            if page_template:
+                                template, start_page = page_template
+                                first_page = checkpoint["page"] + 1 if checkpoint.get("page") else None
+                                pages = await self._fan_out_pages(
+                                    context, url, template, start_page, params,
+                                    first_page=first_page, on_page=on_page,
+                                )
+                                result.pages_html.extend(pages)
+                                succeeded += 1
+                                if on_url_status: on_url_status(url, "SUCCESS")
+                                continue
+
+                            # Reprise : on revient sur la dernière page capturée puis on passe à la suivante
+                            first_page = 1
+                            start_url = url
+                            if checkpoint.get("page") and checkpoint.get("page_url") and pagination_selector:
+                                first_page = checkpoint["page"] + 1
+                                start_url = checkpoint["page_url"]
+                                logger.info(f"  Reprise de {url} à la page {first_page}")
+
+                            response = await page.goto(start_url, wait_until="domcontentloaded", timeout=30000)
                             await page.wait_for_load_state("networkidle", timeout=15000)
 
-                            for page_num in range(1, max_pages + 1):
+                            if session_store.looks_blocked(response.status if response else None, await page.content()):
+                                raise BlockedPageError("Blocage anti-bot détecté")
+
+                            if first_page > 1 and (
+                                first_page > max_pages or not await self._click_next_page(page, pagination_selector)
+                            ):
+                                first_page = max_pages + 1  # Rien de plus à capturer
+
+                            for page_num in range(first_page, max_pages + 1):
                                 logger.info(f"  Caméléon page {page_num}/{max_pages}: {url}")
 
                                 if requires_scroll:
@@ -259,6 +430,7 @@ class HeadlessCameleonWorker(BaseWorker):
 
                                 html = await page.content()
                                 result.pages_html.append(html)
+                                if on_page: on_page(url, page_num, page.url, html)
 
                                 if page_num < max_pages and pagination_selector:
                                     if not await self._click_next_page(page, pagination_selector):
@@ -268,9 +440,11 @@ class HeadlessCameleonWorker(BaseWorker):
 
                                 await asyncio.sleep(1.5)
 
+                            succeeded += 1
                             if on_url_status: on_url_status(url, "SUCCESS")
 
                         except Exception as e:
+                            blocked = blocked or isinstance(e, BlockedPageError)
                             logger.error(f"Caméléon error on {url}: {e}")
                             result.errors.append(f"Caméléon error on {url}: {str(e)[:200]}")
                             if on_url_status: on_url_status(url, "FAILED", str(e))
@@ -280,13 +454,17 @@ class HeadlessCameleonWorker(BaseWorker):
                                 await page.close()
                             except: pass
                             page = await context.new_page()
+
+                    if persist_session:
+                        if blocked:
+                            session_store.invalidate(domain, reason="blocage anti-bot")
+                        elif succeeded:
+                            await session_store.save(context, domain)
                 finally:
                     await context.close()
 
             await browser.close()
 
-            await browser.close()
-
         result.duration_s = time.time() - start
         return result
 
@@ -301,7 +479,7 @@ class VisionSniperWorker(BaseWorker):
     Idéal pour : Prospectus digitaux, catalogues image, PDFs rendus en HTML.
     """
 
-    async def extract(self, urls: list[str], params: dict, on_url_status=None) -> ExtractionResult:
+    async def extract(self, urls: list[str], params: dict, on_url_status=None, on_page=None) -> ExtractionResult:
         result = ExtractionResult(worker_type="VISION_SNIPER")
         start = time.time()
 
@@ -314,19 +492,21 @@ class VisionSniperWorker(BaseWorker):
         requires_scroll = params.get("requires_scroll", False)
         viewport_width = params.get("viewport_width", 1920)
         viewport_height = params.get("viewport_height", 1080)
+        persist_session = params.get("persist_session", True)
+        session_ttl_h = params.get("session_ttl_h", session_store.ttl_hours)
 
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
             
             # Smart Batching: Group URLs by root domain
             from collections import defaultdict
-            from urllib.parse import urlparse
             domain_groups = defaultdict(list)
             for u in urls:
                 domain = urlparse(u).netloc
                 domain_groups[domain].append(u)
 
             for domain, domain_urls in domain_groups.items():
+                storage_state = session_store.get(domain, ttl_hours=session_ttl_h) if persist_session else None
                 context = await browser.new_context(
                     viewport={"width": viewport_width, "height": viewport_height},
                     device_scale_factor=2,  # Retina-quality screenshots
@@ -335,15 +515,21 @@ class VisionSniperWorker(BaseWorker):
                         "AppleWebKit/537.36 (KHTML, like Gecko) "
                         "Chrome/120.0.0.0 Safari/537.36"
                     ),
+                    storage_state=storage_state,
                 )
+                blocked = False
+                succeeded = 0
                 try:
                     page = await context.new_page()
                     for url in domain_urls:
                         if on_url_status: on_url_status(url, "PROCESSING")
                         try:
-                            await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                            response = await page.goto(url, wait_until="domcontentloaded", timeout=30000)
                             await page.wait_for_load_state("networkidle", timeout=15000)
 
+                            if session_store.looks_blocked(response.status if response else None, await page.content()):
+                                raise BlockedPageError("Blocage anti-bot détecté")
+
                             # Scroll pour charger le contenu lazy si nécessaire
                             if requires_scroll:
                                 previous_height = 0
@@ -361,11 +547,14 @@ class VisionSniperWorker(BaseWorker):
                                 type="png",
                             )
                             result.screenshots.append(screenshot_bytes)
+                            if on_page: on_page(url, 1, url, screenshot_bytes)
                             logger.info(f"  Vision OK: {url} ({len(screenshot_bytes)} bytes)")
 
+                            succeeded += 1
                             if on_url_status: on_url_status(url, "SUCCESS")
 
                         except Exception as e:
+                            blocked = blocked or isinstance(e, BlockedPageError)
                             logger.error(f"Vision error on {url}: {e}")
                             result.errors.append(f"Vision error on {url}: {str(e)[:200]}")
                             if on_url_status: on_url_status(url, "FAILED", str(e))
@@ -375,6 +564,12 @@ class VisionSniperWorker(BaseWorker):
                                 await page.close()
                             except: pass
                             page = await context.new_page()
+
+                    if persist_session:
+                        if blocked:
+                            session_store.invalidate(domain, reason="blocage anti-bot")
+                        elif succeeded:
+                            await session_store.save(context, domain)
                 finally:
                     await context.close()
 
@@ -425,6 +620,10 @@ class ScraperEngine:
         self.agent_config_id = agent_config_id
         self.mission_config_id = mission_config_id
         self.config = None
+        # Consommateur optionnel des pages capturées (ex: core.pipeline.ParseStream.submit)
+        self.page_sink = None
+        # Run en cours (id du job) : seuls ses SUCCESS / checkpoints MissionLog sont repris
+        self.run_id = None
         self._load_config()
 
     def _load_config(self):
@@ -517,6 +716,7 @@ class ScraperEngine:
                 log = MissionLog(mission_id=self.config["id"], url_cible=url)
                 db.add(log)
             log.statut = status
+            log.run_id = self.run_id
             if error_msg:
                 log.message_erreur = error_msg[:2000]
             db.commit()
@@ -526,14 +726,101 @@ class ScraperEngine:
         finally:
             db.close()
 
-    async def run(self) -> ExtractionResult:
+    def _checkpoint_page(self, url: str, page_num: int, page_url: str, content):
+        """Callback workers : persiste la page capturée, avance le checkpoint MissionLog et la transmet au page_sink."""
+        if self.page_sink:
+            self.page_sink(url, page_num, page_url, content)
+        if self.config["source"] != "mission":
+            return
+        from core.models import MissionLog
+        db = SessionLocal()
+        try:
+            page_artifacts.save(self.config["id"], url, page_num, content)
+            log = db.query(MissionLog).filter(
+                MissionLog.mission_id == self.config["id"],
+                MissionLog.url_cible == url
+            ).first()
+            if log and page_num > (log.last_page or 0):
+                log.last_page = page_num
+                log.last_page_url = page_url
+                db.commit()
+        except Exception as e:
+            logger.error(f"Failed to checkpoint page {page_num} of {url}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _plan_resume(self, urls: list[str], only_failed: bool = False) -> tuple[list[str], dict, list]:
+        """
+        Consulte MissionLog + artefacts pour éviter de re-scraper après un crash.
+        Seul le run courant (`run_id`, relance du même job) est repris : un nouveau run
+        repart de zéro quel que soit l'âge des logs précédents.
+        Returns:
+            (urls à exécuter, points de reprise {url: {page, page_url}}, contenus déjà capturés)
+        """
+        if self.config["source"] != "mission":
+            return urls, {}, []
+
+        from core.models import MissionLog
+        mission_id = self.config["id"]
+
+        db = SessionLocal()
+        try:
+            logs = {
+                log.url_cible: log
+                for log in db.query(MissionLog).filter(MissionLog.mission_id == mission_id).all()
+            }
+            to_run, resume_points, preloaded = [], {}, []
+            for url in urls:
+                log = logs.get(url)
+                statut = log.statut if log else None
+                same_run = bool(self.run_id and log and log.run_id == self.run_id)
+
+                if only_failed and statut != "FAILED":
+                    continue
+                if statut == "SUCCESS" and same_run:
+                    preloaded.extend(content for _, content in page_artifacts.load(mission_id, url))
+                    logger.info(f"  Reprise: {url} déjà SUCCESS dans le run {self.run_id}, ignorée.")
+                    continue
+
+                if same_run and log.last_page:
+                    resume_points[url] = {"page": log.last_page, "page_url": log.last_page_url}
+                    preloaded.extend(
+                        content for _, content in page_artifacts.load(mission_id, url, up_to_page=log.last_page)
+                    )
+                else:
+                    page_artifacts.clear(mission_id, url)
+                    if log:
+                        log.last_page = 0
+                        log.last_page_url = None
+                        log.run_id = self.run_id
+                to_run.append(url)
+            db.commit()
+            return to_run, resume_points, preloaded
+        except Exception as e:
+            logger.error(f"Plan de reprise indisponible, exécution complète: {e}")
+            db.rollback()
+            return urls, {}, []
+        finally:
+            db.close()
+
+    async def run(self, urls: list[str] = None, track_status: bool = True,
+                  only_failed: bool = False, run_id: str = None) -> ExtractionResult:
         """
         Point d'entrée principal.
         Route vers le bon Worker et retourne un ExtractionResult.
+        Relance d'un même run (`run_id`) : les URLs déjà SUCCESS dans ce run sont ignorées
+        et la pagination reprend à la dernière page capturée (missions uniquement).
+        Args:
+            urls: Sous-ensemble d'URLs à traiter (défaut: toutes les URLs de la config)
+            track_status: False pour ne pas toucher au statut global (item de file distribuée)
+            only_failed: Ne relancer que les URLs en statut FAILED
+            run_id: Identifiant du run (id du job JobQueue) ; None = run autonome, sans reprise
         """
         cfg = self.config
+        self.run_id = run_id
         worker_type = cfg["worker_type"]
-        urls = cfg["urls"]
+        urls = cfg["urls"] if urls is None else urls
 
         if not urls:
             return ExtractionResult(
@@ -541,12 +828,30 @@ class ScraperEngine:
                 errors=["Aucune URL configurée."],
             )
 
-        self._update_status("RUNNING")
+        if track_status:
+            self._update_status("RUNNING")
 
         try:
-            worker = get_worker(worker_type)
-            result = await worker.extract(urls, cfg["params"], on_url_status=self._log_url_status)
-            self._update_status("IDLE", duration=result.duration_s)
+            to_run, resume_points, preloaded = self._plan_resume(urls, only_failed=only_failed)
+            if to_run:
+                worker = get_worker(worker_type)
+                # Budget navigateur / HTTP du process : les runs excédentaires attendent ici
+                async with resource_budget.worker_slot(worker_type):
+                    result = await worker.extract(
+                        to_run, {**cfg["params"], "resume_from": resume_points},
+                        on_url_status=self._log_url_status, on_page=self._checkpoint_page,
+                    )
+            else:
+                result = ExtractionResult(worker_type=worker_type)
+
+            result.pages_html = [c for c in preloaded if isinstance(c, str)] + result.pages_html
+            result.screenshots = [c for c in preloaded if isinstance(c, bytes)] + result.screenshots
+            result.metadata.update({
+                "skipped_urls": len(urls) - len(to_run),
+                "resumed_urls": len(resume_points),
+            })
+            if track_status:
+                self._update_status("IDLE", duration=result.duration_s)
 
             logger.info(
                 f"Engine '{cfg['nom']}' [{worker_type}]: "
@@ -556,7 +861,8 @@ class ScraperEngine:
 
         except Exception as e:
             logger.error(f"Engine '{cfg['nom']}' erreur: {e}")
-            self._update_status("ERROR", error_msg=str(e))
+            if track_status:
+                self._update_status("ERROR", error_msg=str(e))
             result = ExtractionResult(
                 worker_type=worker_type,
                 errors=[str(e)],
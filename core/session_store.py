@@ -0,0 +1,101 @@
+"""
+MODULE 11 — Session Store (Storage State Playwright par domaine)
+Persiste cookies, consentements et localStorage d'un domaine après un run réussi
+pour les réinjecter dans les prochains `browser.new_context` (Smart Batching inter-missions).
+  - TTL configurable : un état trop vieux est ignoré puis supprimé
+  - Invalidation immédiate dès qu'un blocage anti-bot est détecté
+
+Usage:
+    from core.session_store import session_store
+    state = session_store.get("www.carrefour.fr")          # chemin JSON ou None
+    context = await browser.new_context(storage_state=state)
+    ...
+    await session_store.save(context, "www.carrefour.fr")
+"""
+import os
+import re
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+
+from core.config import SESSIONS_DIR
+
+logger = logging.getLogger("session_store")
+
+# Codes HTTP typiques d'un refus anti-bot (Cloudflare, Datadome, PerimeterX...)
+BLOCK_STATUS_CODES = {403, 429}
+
+# Marqueurs HTML des pages de challenge (volontairement spécifiques pour éviter les faux positifs)
+BLOCK_MARKERS = (
+    "captcha-delivery.com",
+    "challenges.cloudflare.com",
+    "cf-chl-",
+    "px-captcha",
+    "/_incapsula_resource",
+)
+
+
+class DomainSessionStore:
+    """
+    Stockage fichier (1 JSON par domaine) des storage states Playwright.
+    Les écritures sont atomiques (tmp + os.replace) : plusieurs process peuvent partager le dossier.
+    """
+
+    def __init__(self, base_dir: Path = SESSIONS_DIR, ttl_hours: float = 24.0):
+        self.base_dir = Path(base_dir)
+        self.ttl_hours = ttl_hours
+
+    def _path(self, domain: str) -> Path:
+        safe = re.sub(r"[^a-zA-Z0-9._-]", "_", domain.lower())
+        return self.base_dir / f"{safe}.json"
+
+    def get(self, domain: str, ttl_hours: float = None) -> Optional[str]:
+        """Retourne le chemin du storage state si présent et encore frais, sinon None."""
+        path = self._path(domain)
+        if not path.exists():
+            return None
+
+        ttl = self.ttl_hours if ttl_hours is None else ttl_hours
+        age_h = (time.time() - path.stat().st_mtime) / 3600
+        if age_h > ttl:
+            logger.info(f"  Session expirée pour {domain} ({age_h:.1f}h > {ttl}h). Purge.")
+            self.invalidate(domain)
+            return None
+        return str(path)
+
+    async def save(self, context, domain: str):
+        """Sauvegarde le storage state courant du contexte Playwright."""
+        path = self._path(domain)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            await context.storage_state(path=str(tmp))
+            os.replace(tmp, path)
+            logger.info(f"  Session sauvegardée pour {domain}.")
+        except Exception as e:
+            logger.warning(f"  Sauvegarde session échouée pour {domain}: {e}")
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+    def invalidate(self, domain: str, reason: str = None):
+        """Supprime l'état du domaine (blocage détecté, TTL dépassé...)."""
+        try:
+            self._path(domain).unlink()
+            if reason:
+                logger.warning(f"  Session invalidée pour {domain}: {reason}")
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def looks_blocked(status_code: Optional[int], html: str) -> bool:
+        """Heuristique de détection d'une page de blocage / challenge anti-bot."""
+        if status_code in BLOCK_STATUS_CODES:
+            return True
+        head = (html or "")[:20000].lower()
+        return any(marker in head for marker in BLOCK_MARKERS)
+
+
+# --- Instance partagée par les Workers ---
+session_store = DomainSessionStore()
@@ -0,0 +1,160 @@
+"""
+MODULE 18 — Supervisor (Pool multi-process d'exécuteurs JobQueue)
+Le parsing HTML, l'encodage d'images, la validation Pydantic et la Collision sont
+CPU-bound : dans un seul process ils se sérialisent sur le GIL. Le superviseur lance
+N process exécuteurs (défaut : SUPERVISOR_PROCESSES, un par cœur), chacun avec sa propre boucle
+asyncio et son propre JobExecutor ; la répartition du travail passe par la JobQueue (leases).
+  - les budgets de ressources (browser / http / llm) sont partagés entre les process :
+    BUDGET_*_SLOTS reste un plafond pour l'hôte ; les slots par task_type de chaque
+    exécuteur sont divisés par N
+  - un process mort est relancé (backoff exponentiel plafonné si crash en boucle),
+    les slots de ressources qu'il tenait sont rendus
+  - chaque exécuteur publie ses stats sur une multiprocessing.Queue ; le superviseur
+    les agrège et les écrit dans data/worker_stats.json
+
+Usage:
+    python core/scheduler_worker.py --processes 4
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import multiprocessing
+
+from core.config import DATA_DIR, SUPERVISOR_PROCESSES
+from core.resource_budget import resource_budget
+
+logger = logging.getLogger("supervisor")
+
+WORKER_STATS_PATH = DATA_DIR / "worker_stats.json"
+MAX_RESTART_BACKOFF_S = 60
+STABLE_AFTER_S = 120  # un process vivant depuis 2 min remet son compteur de crashs à zéro
+
+
+def _executor_main(worker_id: str, stats_queue, shared_budget: dict, row: int):
+    """Point d'entrée d'un process exécuteur (importable pour le mode spawn)."""
+    from core import scheduler_worker  # enregistre les handlers AGENT_RUN / MISSION_RUN
+    resource_budget.attach(shared_budget, row)
+    try:
+        asyncio.run(scheduler_worker.main_loop(
+            "executor", worker_id, processes=0, stats_queue=stats_queue, pool_size=shared_budget["rows"],
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """Lance, surveille et relance les process exécuteurs."""
+
+    def __init__(self, processes: int = None, prefix: str = None, check_s: float = 2.0,
+                 report_s: float = 60.0):
+        self.processes = processes or SUPERVISOR_PROCESSES
+        self.prefix = prefix or socket.gethostname()
+        self.check_s = check_s
+        self.report_s = report_s
+        self.ctx = multiprocessing.get_context("spawn")
+        self.stats_queue = self.ctx.Queue()
+        self.shared_budget = resource_budget.make_shared(self.ctx, self.processes)
+        self.rows: dict[str, int] = {}
+        self.workers: dict[str, multiprocessing.Process] = {}
+        self.started_at: dict[str, float] = {}
+        self.crashes: dict[str, int] = {}
+        self.restart_at: dict[str, float] = {}
+        self.stats: dict[str, dict] = {}
+
+    def _spawn(self, worker_id: str):
+        proc = self.ctx.Process(
+            target=_executor_main, args=(worker_id, self.stats_queue, self.shared_budget, self.rows[worker_id]),
+            name=worker_id, daemon=True,
+        )
+        proc.start()
+        self.workers[worker_id] = proc
+        self.started_at[worker_id] = time.time()
+        self.restart_at.pop(worker_id, None)
+        logger.info(f"  Exécuteur {worker_id} lancé (pid {proc.pid}).")
+
+    def _drain_stats(self):
+        while True:
+            try:
+                snapshot = self.stats_queue.get_nowait()
+            except Exception:
+                return
+            self.stats[snapshot["worker_id"]] = snapshot
+
+    def _check_workers(self):
+        now = time.time()
+        for worker_id, proc in list(self.workers.items()):
+            if proc.is_alive():
+                if now - self.started_at[worker_id] > STABLE_AFTER_S:
+                    self.crashes[worker_id] = 0
+                continue
+            if worker_id not in self.restart_at:
+                self.crashes[worker_id] = self.crashes.get(worker_id, 0) + 1
+                delay = min(MAX_RESTART_BACKOFF_S, 2 ** (self.crashes[worker_id] - 1))
+                self.restart_at[worker_id] = now + delay
+                resource_budget.release_row(self.shared_budget, self.rows[worker_id])
+                logger.error(f"  Exécuteur {worker_id} arrêté (code {proc.exitcode}). Relance dans {delay}s.")
+            elif now >= self.restart_at[worker_id]:
+                self._spawn(worker_id)
+
+    def aggregate(self) -> dict:
+        """Stats par worker + totaux par task_type."""
+        totals: dict[str, dict] = {}
+        for snapshot in self.stats.values():
+            for task_type, values in snapshot.get("tasks", {}).items():
+                entry = totals.setdefault(task_type, {"done": 0, "failed": 0, "total_s": 0.0})
+                for key in entry:
+                    entry[key] += values.get(key, 0)
+        return {
+            "updated_at": time.time(),
+            "workers": {
+                worker_id: {
+                    "pid": proc.pid,
+                    "alive": proc.is_alive(),
+                    "crashes": self.crashes.get(worker_id, 0),
+                    **{k: v for k, v in self.stats.get(worker_id, {}).items() if k not in ("worker_id", "pid")},
+                }
+                for worker_id, proc in self.workers.items()
+            },
+            "totals": totals,
+        }
+
+    def _report(self):
+        report = self.aggregate()
+        tmp = WORKER_STATS_PATH.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(report, indent=2), encoding="utf-8")
+            os.replace(tmp, WORKER_STATS_PATH)
+        except OSError as e:
+            logger.warning(f"  Écriture {WORKER_STATS_PATH.name} échouée: {e}")
+        alive = sum(1 for w in report["workers"].values() if w["alive"])
+        done = sum(t["done"] for t in report["totals"].values())
+        failed = sum(t["failed"] for t in report["totals"].values())
+        logger.info(f"Pool: {alive}/{len(self.workers)} exécuteurs vivants, {done} jobs OK, {failed} en échec.")
+
+    def shutdown(self):
+        for proc in self.workers.values():
+            if proc.is_alive():
+                proc.terminate()
+        for proc in self.workers.values():
+            proc.join(timeout=10)
+
+    async def run_forever(self):
+        logger.info(f"Superviseur: démarrage de {self.processes} exécuteur(s).")
+        for i in range(self.processes):
+            worker_id = f"{self.prefix}-w{i + 1}"
+            self.rows[worker_id] = i
+            self._spawn(worker_id)
+        last_report = time.time()
+        try:
+            while True:
+                await asyncio.sleep(self.check_s)
+                self._drain_stats()
+                self._check_workers()
+                if time.time() - last_report >= self.report_s:
+                    self._report()
+                    last_report = time.time()
+        finally:
+            self.shutdown()
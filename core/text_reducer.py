@@ -0,0 +1,178 @@
+"""
+MODULE 23 — Text Reducer (HTML / innerText -> texte compact sous budget de tokens)
+Les prompts recevaient le texte brut tronqué à un nombre arbitraire de caractères :
+menus, pieds de page et bannières passaient, la fin utile de la page était coupée.
+Le réducteur :
+  - supprime scripts, styles, nav, header, footer, aside, formulaires et blocs
+    "cookie / newsletter / menu / breadcrumb" (HTML)
+  - isole le contenu principal (<main>, <article>, [role=main]) s'il est assez fourni
+  - garde chaque carte produit (bloc contenant un prix) comme un bloc unique
+  - normalise les espaces et supprime les blocs répétés
+  - si le budget est dépassé, classe les blocs par pertinence (termes de la requête,
+    prix, EAN) et garde les meilleurs, dans l'ordre d'origine de la page
+
+Usage:
+    from core.text_reducer import reduce_html, reduce_text
+    prompt_text = reduce_html(html, query="Oral-B iO", max_tokens=4000)
+    prompt_text = reduce_text(inner_text, query="3600523614455", max_tokens=1500)
+"""
+import re
+import logging
+import unicodedata
+from typing import Optional
+
+import lxml.html
+from lxml import etree
+
+from core.config import REDUCER_CHARS_PER_TOKEN
+
+logger = logging.getLogger("text_reducer")
+
+DROP_TAGS = ("script", "style", "noscript", "svg", "nav", "header", "footer", "aside",
+             "form", "iframe", "button", "select", "template")
+BOILERPLATE_RE = re.compile(r"cookie|consent|newsletter|breadcrumb|menu|navbar|footer|header|modal|popup|banner",
+                            re.IGNORECASE)
+CARD_RE = re.compile(r"product|produit|card|tile|offer|offre|item|result|article", re.IGNORECASE)
+BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "td", "th", "dd", "dt",
+              "blockquote", "pre", "section", "article", "div", "tr", "figcaption"}
+PRICE_RE = re.compile(r"\d+[.,]\d{2}\s?(?:€|eur)|€\s?\d+", re.IGNORECASE)
+EAN_RE = re.compile(r"\b\d{13}\b")
+SEPARATOR_RE = re.compile(r"\n\s*(?:===[A-Z]+===|---+)\s*\n|\n\s*\n")
+WORD_RE = re.compile(r"\w{2,}")
+
+MIN_MAIN_CHARS = 500  # en dessous, <main> est probablement un conteneur vide / partiel
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // REDUCER_CHARS_PER_TOKEN + 1
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def _fold(text: str) -> str:
+    """Minuscules sans accents (comparaison requête / bloc)."""
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+
+
+def _is_boilerplate(el) -> bool:
+    if el.tag in ("html", "body", "main"):
+        return False
+    marker = f"{el.get('id', '')} {el.get('class', '')} {el.get('role', '')}"
+    return bool(marker.strip()) and bool(BOILERPLATE_RE.search(marker)) and not CARD_RE.search(marker)
+
+
+def _text(el) -> str:
+    return _normalize(" ".join(el.itertext()))
+
+
+def html_blocks(html: str) -> list[str]:
+    """Blocs de texte du contenu principal d'une page HTML, dans l'ordre du document."""
+    try:
+        root = lxml.html.fromstring(html)
+    except (etree.ParserError, ValueError):
+        return text_blocks(html)
+
+    for el in list(root.iter(*DROP_TAGS)):
+        el.drop_tree()
+    for el in [el for el in root.iter() if isinstance(el.tag, str) and _is_boilerplate(el)]:
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    for selector in ("//main", "//article", "//*[@role='main']"):
+        candidates = root.xpath(selector)
+        if candidates:
+            best = max(candidates, key=lambda el: len(el.text_content()))
+            if len(_text(best)) >= MIN_MAIN_CHARS:
+                root = best
+                break
+
+    elements = [el for el in root.iter() if isinstance(el.tag, str)]
+    # Conteneurs : éléments ayant un descendant de type bloc (seules les feuilles sont gardées)
+    containers = set()
+    for el in elements:
+        if el.tag in BLOCK_TAGS:
+            for anc in el.iterancestors():
+                if anc in containers:
+                    break
+                containers.add(anc)
+
+    blocks, cards = [], set()
+    for el in elements:
+        if cards and any(anc in cards for anc in el.iterancestors()):
+            continue
+        marker = f"{el.get('class', '')} {el.get('id', '')} {el.get('data-component-type', '')}"
+        is_card = bool(CARD_RE.search(marker))
+        if not is_card and (el.tag not in BLOCK_TAGS or el in containers):
+            continue
+        text = _text(el)
+        if not text:
+            continue
+        # Carte produit : un seul bloc (nom + prix + remise restent ensemble)
+        if is_card and PRICE_RE.search(text) and len(text) < 1500:
+            blocks.append(text)
+            cards.add(el)
+        elif el.tag in BLOCK_TAGS and el not in containers:
+            blocks.append(text)
+    return blocks or text_blocks(_text(root))
+
+
+def text_blocks(text: str) -> list[str]:
+    """Blocs d'un innerText : paragraphes et séparateurs (===PRODUCT===, ---) des agents."""
+    return [block for block in (_normalize(part) for part in SEPARATOR_RE.split(text or "")) if block]
+
+
+def _dedupe(blocks: list[str]) -> list[str]:
+    seen, unique = set(), []
+    for block in blocks:
+        key = _fold(block)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(block)
+    return unique
+
+
+def _score(block: str, terms: set[str]) -> float:
+    folded = _fold(block)
+    words = set(WORD_RE.findall(folded))
+    score = 3.0 * len(terms & words)
+    if PRICE_RE.search(block):
+        score += 2.0
+    if EAN_RE.search(block):
+        score += 2.0
+    # Les blocs très courts (libellés, boutons) pèsent peu
+    return score + min(len(block), 400) / 400
+
+
+def _fit(blocks: list[str], query: Optional[str], max_tokens: int) -> str:
+    blocks = _dedupe(blocks)
+    text = "\n".join(blocks)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    terms = set(WORD_RE.findall(_fold(query or "")))
+    ranked = sorted(range(len(blocks)), key=lambda i: _score(blocks[i], terms), reverse=True)
+    budget_chars = max_tokens * REDUCER_CHARS_PER_TOKEN
+    kept, used = set(), 0
+    for i in ranked:
+        cost = len(blocks[i]) + 1
+        if used + cost > budget_chars:
+            continue
+        kept.add(i)
+        used += cost
+    if not kept and blocks:  # un bloc unique plus grand que le budget
+        return blocks[ranked[0]][:budget_chars]
+    logger.debug(f"Réduction: {len(blocks)} blocs -> {len(kept)} ({used} caractères).")
+    return "\n".join(blocks[i] for i in sorted(kept))
+
+
+def reduce_html(html: str, query: str = None, max_tokens: int = 4000) -> str:
+    """HTML -> texte compact du contenu principal, sous `max_tokens`."""
+    return _fit(html_blocks(html), query, max_tokens)
+
+
+def reduce_text(text: str, query: str = None, max_tokens: int = 4000) -> str:
+    """innerText -> texte compact (blocs dédoublonnés, classés par pertinence si nécessaire)."""
+    return _fit(text_blocks(text), query, max_tokens)
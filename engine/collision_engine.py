@@ -16,8 +16,13 @@ class CollisionEngine:
     def __init__(self, min_roi_percent: float = 15.0):
         self.min_roi_percent = min_roi_percent
 
-    def _get_active_offers(self, db) -> list:
-        return db.query(OffreRetail).filter(OffreRetail.is_active == True).all()
+    def _get_active_offers(self, db, offre_ids: list[int] = None, eans: list[str] = None) -> list:
+        query = db.query(OffreRetail).filter(OffreRetail.is_active == True)
+        if offre_ids is not None:
+            query = query.filter(OffreRetail.id.in_(offre_ids))
+        if eans is not None:
+            query = query.filter(OffreRetail.ean.in_(eans))
+        return query.all()
 
     def _get_matching_levers(self, db, ean: str, marque: str, enseigne: str) -> list:
         now = datetime.utcnow()
@@ -141,10 +146,11 @@ class CollisionEngine:
             return "C"
         return "REJECTED"
 
-    def run_collision(self):
+    def run_collision(self, offre_ids: list[int] = None, eans: list[str] = None):
+        """Calcule les pépites. `offre_ids` / `eans` restreignent le calcul aux offres impactées (pipeline)."""
         db = SessionLocal()
         try:
-            offers = self._get_active_offers(db)
+            offers = self._get_active_offers(db, offre_ids=offre_ids, eans=eans)
             logger.info(f"[COLLISION] Lancement sur {len(offers)} offres actives.")
             new_pepites = 0
             rejected = 0
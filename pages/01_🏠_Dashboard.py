@@ -105,6 +105,37 @@ try:
         else:
             st.caption("Aucune promotion extraite pour l'instant.")
 
+    st.subheader("🤖 Coût IA par mission (7 jours)")
+    from core.llm_metrics import llm_metrics
+    mission_costs = llm_metrics.cost_by_mission(since_h=24 * 7)
+    if mission_costs:
+        mission_names = dict(db.query(MissionConfig.id, MissionConfig.nom).all())
+        df_costs = pd.DataFrame([
+            {"Mission": mission_names.get(c["mission_id"], f"#{c['mission_id']}") if c["mission_id"] else "Hors mission (agents)",
+             "Appels": c["calls"], "p50 (ms)": c["p50_ms"], "p95 (ms)": c["p95_ms"],
+             "Tokens": c["input_tokens"] + c["output_tokens"], "Coût ($)": c["cost_usd"]}
+            for c in mission_costs
+        ])
+        st.dataframe(df_costs, use_container_width=True, hide_index=True)
+    else:
+        st.caption("Aucun appel LLM journalisé sur 7 jours.")
+
+    st.subheader("🛡️ File de jobs (24 h)")
+    from core.job_queue import queue_stats
+    q_stats = queue_stats()
+    if q_stats:
+        st.dataframe(pd.DataFrame([
+            {
+                "Tâche": task_type, "En attente": v["pending"], "En cours": v["running"], "Dead-letter": v["failed"],
+                "Plus ancien en attente": f"{v['oldest_pending_s'] / 60:.0f} min" if v["pending"] else "-",
+                "Attente moy.": f"{v['avg_wait_s']:.0f}s" if v["avg_wait_s"] is not None else "-",
+                "Exécution moy.": f"{v['avg_run_s']:.0f}s" if v["avg_run_s"] is not None else "-",
+            }
+            for task_type, v in sorted(q_stats.items())
+        ]), use_container_width=True, hide_index=True)
+    else:
+        st.caption("Aucun job en file sur 24 h.")
+
 except Exception as e:
     st.error(f"Erreur de chargement du Dashboard: {e}")
 finally:
@@ -6,6 +6,7 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+import json
 import streamlit as st
 import pandas as pd
 import asyncio
@@ -100,6 +101,13 @@ with tab_builder:
         with c4:
             ai_prompt_override = st.text_input("Prompt Custom (Optionnel)", value=get_def("ai_prompt", ""))
 
+        cur_profile = get_def("extraction_profile", None)
+        profile_text = st.text_area(
+            "Profil d'extraction CSS / XPath (Optionnel, avant Gemini)",
+            value=json.dumps(cur_profile, ensure_ascii=False, indent=2) if isinstance(cur_profile, dict) else (cur_profile or ""),
+            help='Nom d\'un profil intégré ("schema_org") ou JSON {"card", "name", "price", "strike_price", "promo", "ean", "brand", "image", "min_coverage"}.',
+        )
+
         st.divider()
         
         btn_label = "💾 Mettre à jour la mission" if is_editing else "🚀 Déployer la mission"
@@ -116,9 +124,14 @@ with tab_builder:
                 db_save = SessionLocal()
                 try:
                     params = {"max_pages": get_def("max_pages", 1), "requires_scroll": get_def("requires_scroll", False)}
-                    
+                    profile_text = profile_text.strip()
+                    if profile_text:
+                        params["extraction_profile"] = json.loads(profile_text) if profile_text.startswith("{") else profile_text
+
                     if is_editing:
                         mission = db_save.query(MissionConfig).filter(MissionConfig.id == st.session_state["edit_mission_id"]).first()
+                        # Les autres paramètres (pipeline, parse_mode...) sont conservés
+                        params = {**{k: v for k, v in (mission.extraction_params or {}).items() if k != "extraction_profile"}, **params}
                         mission.nom = mission_name
                         mission.mission_type = mission_type
                         mission.worker_type = worker_type
@@ -241,6 +254,13 @@ with tab_history:
                     st.success("Mission exécutée !")
                     st.rerun()
 
+                if st.button("🔁 Relancer uniquement les FAILED", use_container_width=True):
+                    from core.scraper_engine import ScraperEngine
+                    st.toast(f"Relance des URLs en échec de '{selected_hm}'...", icon="🔁")
+                    asyncio.run(ScraperEngine(mission_config_id=sel_id).run(only_failed=True))
+                    st.success("URLs FAILED relancées !")
+                    st.rerun()
+
                 if st.button("🔄 Dupliquer", use_container_width=True):
                     load_mission_to_editor(sel_id, duplicate=True)
                     st.success("Formulaire pré-rempli dans l'éditeur.")
@@ -9,13 +9,23 @@ import streamlit as st
 import pandas as pd
 import io
 from datetime import datetime
-from core.models import SessionLocal, OffreRetail, ProduitReference
+from sqlalchemy import func
+from core.models import SessionLocal, OffreRetail, ProduitReference, PriceHistory
+from core.market_cache import market_cache, SOURCE_SERPAPI
 
 st.set_page_config(page_title="Market Export | STAFF v3", page_icon="📈", layout="wide")
 
 st.markdown("### 📈 Market Export — B2B Data Pipeline")
 st.caption("Filtrez les opportunités validées, ajustez les prix manuellement, et générez des exports B2B propres.")
 
+
+def format_age(age_s) -> str:
+    """Fraîcheur d'un prix marché : « 5 h », « 3 j » ou « — » si jamais relevé."""
+    if age_s is None:
+        return "—"
+    return f"{age_s / 3600:.0f} h" if age_s < 48 * 3600 else f"{age_s / 86400:.0f} j"
+
+
 tab_arene, tab_export = st.tabs([
     "⚔️ L'Arène (Éditable)",
     "📦 Quai d'Export (B2B)"
@@ -40,6 +50,16 @@ with tab_arene:
             rows = []
             offre_objects = {}
 
+            # Fraîcheur du prix marché : cotation du cache, sinon dernier relevé historisé
+            eans = sorted({o.ean for o, _ in offres_val if o.ean})
+            price_ages = market_cache.ages(SOURCE_SERPAPI, eans)
+            now = datetime.utcnow()
+            for ean, last_fetch in db.query(PriceHistory.ean, func.max(PriceHistory.fetch_date)).filter(
+                PriceHistory.ean.in_(eans)
+            ).group_by(PriceHistory.ean):
+                if last_fetch:
+                    price_ages[ean] = min(price_ages.get(ean, float("inf")), (now - last_fetch).total_seconds())
+
             for o, p in offres_val:
                 nom_ref = p.nom_genere if p else o.enseigne
                 net_net = o.prix_net_net_calcule or 0.0
@@ -54,6 +74,7 @@ with tab_arene:
                     "Marchand": o.enseigne,
                     "Net-Net (€)": net_net,
                     "Revente Marché (€)": revente,
+                    "Âge prix marché": format_age(price_ages.get(o.ean)),
                     "Profit (€)": profit,
                     "ROI (%)": roi,
                     "Score QA": o.reliability_score,
@@ -75,6 +96,7 @@ with tab_arene:
                     "Revente Marché (€)": st.column_config.NumberColumn(format="%.2f", disabled=False),
                     "Produit": st.column_config.TextColumn(disabled=True),
                     "Marchand": st.column_config.TextColumn(disabled=True),
+                    "Âge prix marché": st.column_config.TextColumn(disabled=True),
                     "Profit (€)": st.column_config.NumberColumn(format="%.2f", disabled=True),
                     "ROI (%)": st.column_config.NumberColumn(format="%.1f", disabled=True),
                     "Score QA": st.column_config.NumberColumn(format="%.2f", disabled=True),
@@ -7,24 +7,38 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import streamlit as st
 import pandas as pd
+from datetime import datetime
 from core.models import SessionLocal, ApiKey
-from core.config import gemini_keys, serpapi_keys, scrapingbee_keys
+from core.config import gemini_keys, serpapi_keys, scrapingbee_keys, firecrawl_keys
 
 st.set_page_config(page_title="Settings | STAFF v3", page_icon="⚙️", layout="wide")
 
 st.markdown("### ⚙️ Paramètres & Système")
 st.caption("Gérez les clés API (Moteurs) et les préférences de l'outil SaaS.")
 
-tab_api, tab_prefs = st.tabs([
+
+def invalidate_key_pools():
+    """Les pools de clés en mémoire relisent la table au prochain appel (ajout / édition)."""
+    for manager in (gemini_keys, serpapi_keys, scrapingbee_keys, firecrawl_keys):
+        manager.pool.invalidate()
+
+
+tab_api, tab_llm, tab_market, tab_calls, tab_prefs = st.tabs([
     "🔑 Gestionnaire de Clés API",
+    "🧠 Cache LLM",
+    "🛒 Cache Marché",
+    "⏱️ Appels LLM",
     "⚙️ Préférences SaaS"
 ])
 
 with tab_api:
     st.subheader("🔑 Clés API et Rotations (Tier Gratuit)")
-    st.markdown("Editez vos clés. Les clés repérées *EXHAUSTED* sont ignorées par les moteurs jusqu'à leur réinitialisation.")
+    st.markdown("Editez vos clés. Une clé refusée (429) est mise *EXHAUSTED* et réactivée automatiquement à la fin de sa pause, "
+                "une clé révoquée (401/403) reste *INVALIDE* jusqu'à la réinitialisation ; "
+                "un *Quota restant* à 0 l'écarte jusqu'à sa mise à jour (vide = quota inconnu) ou jusqu'à la remise "
+                "périodique à son *Quota / période* (KEY_QUOTA_RESET_H).")
 
-    if st.button("🔄 Réinitialiser le Quota (Passer EXHAUSTED en ACTIVE)"):
+    if st.button("🔄 Réinitialiser le Quota (Passer EXHAUSTED / INVALID en ACTIVE)"):
         with st.spinner("Réinitialisation..."):
             gemini_keys.reset()
             serpapi_keys.reset()
@@ -38,12 +52,22 @@ with tab_api:
         
         rows = []
         for k in keys_data:
-            badge = "🟢 ACTIVE" if k.status == "ACTIVE" else "🔴 EXHAUSTED"
+            if k.status == "ACTIVE":
+                badge = "🟢 ACTIVE"
+            elif k.status == "INVALID":
+                badge = "⛔ INVALIDE (401/403)"
+            elif k.cooldown_until and k.cooldown_until > datetime.utcnow():
+                badge = f"🟠 PAUSE jusqu'à {k.cooldown_until.strftime('%H:%M')} UTC"
+            else:
+                badge = "🔴 EXHAUSTED"
             rows.append({
                 "id": k.id,
                 "Service": k.service_name,
                 "API Key": k.api_key,
                 "Statut": badge,
+                "Quota restant": k.quota_remaining,
+                "Quota / période": k.quota_limit,
+                "Remise du quota": k.quota_reset_at.strftime("%Y-%m-%d %H:%M") if k.quota_reset_at else "—",
                 "Dernière Utilisation": k.last_used.strftime("%Y-%m-%d %H:%M:%S") if k.last_used else "Jamais",
                 "Action": False
             })
@@ -63,6 +87,7 @@ with tab_api:
                         new_api_key = ApiKey(service_name=new_service, api_key=new_key.strip())
                         db.add(new_api_key)
                         db.commit()
+                        invalidate_key_pools()
                         st.success(f"Clé pour {new_service} ajoutée.")
                         st.rerun()
                     else:
@@ -83,6 +108,9 @@ with tab_api:
                     ),
                     "API Key": st.column_config.TextColumn("Clé complète", required=True),
                     "Statut": st.column_config.TextColumn(disabled=True),
+                    "Quota restant": st.column_config.NumberColumn(min_value=0, step=1),
+                    "Quota / période": st.column_config.NumberColumn(min_value=0, step=1),
+                    "Remise du quota": st.column_config.TextColumn(disabled=True),
                     "Dernière Utilisation": st.column_config.TextColumn(disabled=True),
                 },
                 num_rows="dynamic"
@@ -112,9 +140,19 @@ with tab_api:
                             if k_obj.service_name != row["Service"]:
                                 k_obj.service_name = row["Service"]
                                 updated += 1
+                            quota = None if pd.isna(row.get("Quota restant")) else int(row["Quota restant"])
+                            if k_obj.quota_remaining != quota:
+                                k_obj.quota_remaining = quota
+                                updated += 1
+                            limit = None if pd.isna(row.get("Quota / période")) else int(row["Quota / période"])
+                            if k_obj.quota_limit != limit:
+                                k_obj.quota_limit = limit
+                                k_obj.quota_reset_at = None  # nouvelle période dès le prochain rechargement
+                                updated += 1
                 
                 if updated > 0 or deleted > 0:
                     db.commit()
+                    invalidate_key_pools()
                     st.success(f"Opération réussie. {updated} mises à jour, {deleted} suppressions.")
                     st.rerun()
 
@@ -124,6 +162,123 @@ with tab_api:
         db.close()
 
 
+with tab_llm:
+    st.subheader("🧠 Cache des réponses Gemini")
+    st.markdown("Une page ou une image identique à un appel précédent est relue depuis le cache au lieu de consommer du quota.")
+    try:
+        from core.llm_cache import llm_cache
+        cache_stats = llm_cache.stats()
+        namespaces = {k: v for k, v in cache_stats["namespaces"].items() if k != "_all"}
+        hits = sum(v.get("hits", 0) for v in namespaces.values())
+        misses = sum(v.get("misses", 0) for v in namespaces.values())
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Entrées", f"{cache_stats['entries']} / {cache_stats['max_entries']}")
+        c2.metric("Hits", hits)
+        c3.metric("Misses", misses)
+        c4.metric("Taux de hit", f"{hits / (hits + misses):.0%}" if hits + misses else "—")
+        if namespaces:
+            df_cache = pd.DataFrame([
+                {"Appelant": name, "Hits": v.get("hits", 0), "Misses": v.get("misses", 0),
+                 "Écritures": v.get("stores", 0), "Taux de hit": v.get("hit_rate")}
+                for name, v in sorted(namespaces.items())
+            ])
+            st.dataframe(df_cache, use_container_width=True, hide_index=True)
+        st.caption(f"TTL {cache_stats['ttl_h']:.0f} h, éviction LRU au-delà de {cache_stats['max_entries']} entrées "
+                   f"({cache_stats['namespaces'].get('_all', {}).get('evictions', 0)} évincées).")
+        if st.button("🗑️ Vider le cache LLM"):
+            llm_cache.clear()
+            st.rerun()
+    except Exception as e:
+        st.error(f"Erreur UI Cache LLM: {e}")
+
+
+with tab_market:
+    st.subheader("🛒 Cache des cotations marché")
+    st.markdown("Les recherches SerpAPI, Amazon.fr et Google Shopping récentes (y compris sans résultat) sont relues "
+                "depuis le cache partagé au lieu d'être repayées ou renavigées.")
+    try:
+        from core.market_cache import market_cache
+        market_stats = market_cache.stats()
+        sources = market_stats["sources"]
+        hits = sum(v.get("hits", 0) + v.get("negative_hits", 0) for v in sources.values())
+        misses = sum(v.get("misses", 0) for v in sources.values())
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Cotations", sum(v["entries"] for v in sources.values()))
+        c2.metric("Recherches évitées", hits)
+        c3.metric("Recherches payées / naviguées", misses)
+        c4.metric("Taux de hit", f"{hits / (hits + misses):.0%}" if hits + misses else "—")
+        if sources:
+            df_market = pd.DataFrame([
+                {"Source": name, "Cotations": v["entries"], "Sans résultat": v["negatives"],
+                 "Âge médian (h)": v["median_age_h"], "Plus ancienne (h)": v["max_age_h"], "TTL (h)": v["ttl_h"],
+                 "Hits": v.get("hits", 0), "Hits négatifs": v.get("negative_hits", 0),
+                 "Misses": v.get("misses", 0), "Taux de hit": v.get("hit_rate")}
+                for name, v in sorted(sources.items())
+            ])
+            st.dataframe(df_market, use_container_width=True, hide_index=True)
+        st.caption(f"Recherches sans résultat mémorisées {market_stats['negative_ttl_h']:.0f} h.")
+        if st.button("🗑️ Vider le cache marché"):
+            market_cache.clear()
+            st.rerun()
+    except Exception as e:
+        st.error(f"Erreur UI Cache Marché: {e}")
+
+    st.divider()
+    st.subheader("🎯 Prochains rafraîchissements")
+    st.markdown("Le Market Fetcher et la Sonde Marché relèvent d'abord les EAN dont un nouveau prix vaut le plus : "
+                "profit et ROI en jeu, volatilité et âge du dernier relevé, fin de promo proche.")
+    try:
+        from core.refresh_planner import RefreshPlanner, SCOPE_FETCHER, SCOPE_PROBE
+        from core.config import MARKET_REFRESH_BUDGET
+        scope_label = st.radio("Budget", ["API SerpAPI (Market Fetcher)", "Navigateur (Sonde Marché)"], horizontal=True)
+        scope = SCOPE_FETCHER if scope_label.startswith("API") else SCOPE_PROBE
+        plan = RefreshPlanner().plan(scope, budget=MARKET_REFRESH_BUDGET)
+        if plan:
+            st.dataframe(pd.DataFrame([
+                {"EAN": c.ean, "Produit": c.nom, "Score": round(c.score, 2),
+                 "Profit (€)": c.profit, "ROI (%)": c.roi_percent,
+                 "Volatilité": round(c.volatility, 3) if c.volatility is not None else None,
+                 "Âge relevé (h)": round(c.age_h, 1) if c.age_h is not None else None,
+                 "Fin promo (h)": round(c.promo_hours_left, 1) if c.promo_hours_left is not None else None,
+                 "Offres": len(c.offre_ids)}
+                for c in plan[:50]
+            ]), use_container_width=True, hide_index=True)
+            st.caption(f"{len(plan)} EAN planifiés (50 premiers affichés).")
+        else:
+            st.info("Aucun EAN à rafraîchir.")
+    except Exception as e:
+        st.error(f"Erreur UI Planification: {e}")
+
+
+with tab_calls:
+    st.subheader("⏱️ Latence, tokens et coût des appels Gemini")
+    st.markdown("Chaque appel réel (hors cache) est journalisé : latence, tokens entrée / sortie, retries et coût estimé.")
+    try:
+        from core.llm_metrics import llm_metrics
+        window_h = st.selectbox("Fenêtre", [1, 24, 24 * 7, 24 * 30], index=1,
+                                format_func=lambda h: f"{h} h" if h < 48 else f"{h // 24} jours")
+        summary = llm_metrics.summary(since_h=window_h)
+        total = summary["total"]
+        c1, c2, c3, c4, c5 = st.columns(5)
+        c1.metric("Appels", total["calls"], delta=f"{total['errors']} erreur(s)", delta_color="inverse")
+        c2.metric("Latence p50", f"{total['p50_ms'] / 1000:.1f} s" if total["p50_ms"] else "—")
+        c3.metric("Latence p95", f"{total['p95_ms'] / 1000:.1f} s" if total["p95_ms"] else "—")
+        c4.metric("Tokens", f"{total['input_tokens'] + total['output_tokens']:,}".replace(",", " "))
+        c5.metric("Coût estimé", f"{total['cost_usd']:.2f} $")
+        if summary["namespaces"]:
+            df_calls = pd.DataFrame([
+                {"Template": name, "Appels": v["calls"], "Erreurs": v["errors"], "Retries": v["retries"],
+                 "p50 (ms)": v["p50_ms"], "p95 (ms)": v["p95_ms"], "Tokens entrée": v["input_tokens"],
+                 "Tokens sortie": v["output_tokens"], "Coût ($)": v["cost_usd"]}
+                for name, v in summary["namespaces"].items()
+            ]).sort_values("Coût ($)", ascending=False)
+            st.dataframe(df_calls, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Aucun appel LLM sur la fenêtre.")
+    except Exception as e:
+        st.error(f"Erreur UI Appels LLM: {e}")
+
+
 with tab_prefs:
     st.subheader("⚙️ Préférences de l'application SaaS")
     
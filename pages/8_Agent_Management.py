@@ -51,7 +51,7 @@ try:
     running_count = sum(1 for a in all_agents if a.status == "RUNNING")
     error_count = sum(1 for a in all_agents if a.status == "ERROR")
     total_keys = db.query(ApiKey).count()
-    active_keys = db.query(ApiKey).filter(ApiKey.is_active == True).count()
+    active_keys = db.query(ApiKey).filter(ApiKey.status == "ACTIVE").count()
 finally:
     db.close()
 
@@ -189,20 +189,25 @@ with st.expander("Ajouter une cl\u00e9 API", expanded=False):
 
 db = SessionLocal()
 try:
-    all_keys = db.query(ApiKey).order_by(ApiKey.service).all()
-    if all_keys:
-        for key in all_keys:
-            status_emoji = "\ud83d\udfe2" if key.is_active else "\ud83d\udd34"
-            preview = f"{key.key_value[:8]}...{key.key_value[-4:]}" if len(key.key_value) > 12 else "***"
+    services = [row[0] for row in db.query(ApiKey.service_name).distinct().order_by(ApiKey.service_name)]
+finally:
+    db.close()
+
+if services:
+    from core.credential_manager import CredentialManager
+    for service in services:
+        for key in CredentialManager(service_name=service).get_pool_status()["keys_detail"]:
+            status_emoji = "\ud83d\udfe2" if key["status"] == "ACTIVE" else "\ud83d\udd34"
+            state = "Active" if key["status"] == "ACTIVE" else (
+                "Quota \u00e9puis\u00e9" if key["status"] == "QUOTA" else f"En cooldown ({key['cooldown_s'] / 60:.0f} min)"
+            )
             st.markdown(f"""
             <div class="key-pool">
-                {status_emoji} <strong>{key.service.upper()}</strong> \u2014 
-                <code>{preview}</code> \u2014 
-                Erreurs: {key.error_count} \u2014 
-                {'Active' if key.is_active else 'En cooldown'}
+                {status_emoji} <strong>{service.upper()}</strong> \u2014 
+                <code>{key["key_preview"]}</code> \u2014 
+                Erreurs: {key["errors"]} \u2014 
+                {state}
             </div>
             """, unsafe_allow_html=True)
-    else:
-        st.info("Aucune cl\u00e9 API enregistr\u00e9e. Ajoute tes cl\u00e9s Gemini et autres ci-dessus.")
-finally:
-    db.close()
+else:
+    st.info("Aucune cl\u00e9 API enregistr\u00e9e. Ajoute tes cl\u00e9s Gemini et autres ci-dessus.")
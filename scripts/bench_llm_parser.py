@@ -0,0 +1,78 @@
+"""
+BENCH SCRIPT — Débit de l'AI Parser contre la doublure locale de Gemini (core/fake_llm.py).
+Aucune clé ni base requise : N pages HTML synthétiques sont parsées (parse_page, threads
+concurrents comme le ParseStream) puis validées, avec latence / 429 / JSON invalide injectés.
+Usage: python scripts/bench_llm_parser.py --pages 200 --concurrency 8 --latency-ms 800 --rate-429 0.05
+       python scripts/bench_llm_parser.py --backend http   # serveur python -m core.fake_llm déjà lancé
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from core.ai_parser import AiParser
+from core.extraction_schemas import validate_batch
+from core.llm_backend import make_backend
+from core.llm_cache import llm_cache
+from core.llm_client import llm_client
+
+
+def fake_page(i: int) -> str:
+    cards = "".join(
+        f"<div class='product-card'><h3>Produit {i}-{j}</h3><span>{9 + j},99 €</span></div>" for j in range(20)
+    )
+    return f"<html><body><main><h1>Promotions page {i}</h1>{cards}</main></body></html>"
+
+
+def main():
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--pages", type=int, default=100)
+    cli.add_argument("--concurrency", type=int, default=4)
+    cli.add_argument("--template", default="catalogue", choices=["catalogue", "regles"])
+    cli.add_argument("--backend", default="fake", choices=["fake", "http"])
+    cli.add_argument("--latency-ms", type=float, default=500)
+    cli.add_argument("--jitter-ms", type=float, default=150)
+    cli.add_argument("--rate-429", type=float, default=0.0)
+    cli.add_argument("--malformed", type=float, default=0.0)
+    args = cli.parse_args()
+
+    if args.backend == "fake":
+        llm_client.backend = make_backend("fake", latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                          rate_429=args.rate_429, malformed_rate=args.malformed, seed=42)
+    else:
+        llm_client.backend = make_backend("http")
+    llm_cache.enabled = False  # chaque page doit réellement passer par le backend
+
+    parser = AiParser(args.template)
+    url = "https://www.carrefour.fr/promotions"
+    stats = {"pages_ok": 0, "pages_failed": 0, "items": 0, "valid": 0}
+
+    def parse(i: int):
+        try:
+            raw = parser.parse_page(fake_page(i), f"{url}?page={i}")
+        except Exception:
+            stats["pages_failed"] += 1
+            return
+        valid, _ = validate_batch(args.template, parser.prepare(raw, url))
+        stats["pages_ok"] += 1
+        stats["items"] += len(raw)
+        stats["valid"] += len(valid)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(parse, range(args.pages)))
+    elapsed = time.perf_counter() - start
+
+    print(f"Backend      : {args.backend} (latence {args.latency_ms} ms, 429 {args.rate_429:.0%}, "
+          f"invalide {args.malformed:.0%})")
+    print(f"Pages        : {stats['pages_ok']}/{args.pages} ({stats['pages_failed']} en échec) en {elapsed:.1f}s")
+    print(f"Débit        : {stats['pages_ok'] / elapsed:.2f} pages/s, {stats['valid'] / elapsed:.1f} éléments valides/s")
+    print(f"Éléments     : {stats['items']} extraits, {stats['valid']} valides")
+    print(f"Client LLM   : {llm_client.stats}")
+
+
+if __name__ == "__main__":
+    main()
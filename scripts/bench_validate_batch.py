@@ -0,0 +1,80 @@
+"""
+BENCH SCRIPT — Débit de validate_batch (TypeAdapter par lot) contre la boucle model_validate.
+Génère N éléments catalogue synthétiques (dont une part invalide et, en mode lax, des prix
+en chaîne "24,99 €") et affiche le nombre d'éléments validés par seconde. Les deux chemins
+partagent les contraintes pydantic-core de CatalogueItem : l'écart mesure le seul appel par lot.
+Chaque mesure garde le meilleur de --repeat passages (hôte partagé, débit bruité).
+Usage: python scripts/bench_validate_batch.py --items 100000 --invalid 0.02 --repeat 3
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import time
+import random
+import argparse
+
+from core.extraction_schemas import CatalogueItem, validate_batch, get_batch_adapter
+
+
+def make_items(n: int, invalid_rate: float, string_prices: bool) -> list[dict]:
+    rng = random.Random(42)
+    items = []
+    for i in range(n):
+        prix = round(rng.uniform(1, 300), 2)
+        item = {
+            "ean": f"3{rng.randint(10 ** 11, 10 ** 12 - 1)}",
+            "nom_produit": f"Produit de test {i}",
+            "marque": rng.choice(["Oral-B", "Nivea", "Lego", "Philips"]),
+            "prix_public": f"{prix:.2f}".replace(".", ",") + " €" if string_prices else prix,
+            "prix_initial_barre": round(prix * 1.3, 2),
+            "promo_directe_type": "REMISE_IMMEDIATE",
+            "enseigne": "Carrefour",
+        }
+        if rng.random() < invalid_rate:
+            item["nom_produit"] = "X"  # min_length=3
+        items.append(item)
+    return items
+
+
+def legacy_loop(items: list[dict]) -> tuple[list, list]:
+    valid, errors = [], []
+    for i, item in enumerate(items):
+        try:
+            valid.append(CatalogueItem.model_validate(item))
+        except Exception as e:
+            errors.append({"index": i, "data": item, "error": str(e)[:300]})
+    return valid, errors
+
+
+def timed(label: str, fn, items: list[dict], repeat: int = 1):
+    elapsed = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        valid, errors = fn(items)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"{label:<40} {len(items) / elapsed:>12,.0f} éléments/s  "
+          f"({len(valid)} valides, {len(errors)} erreurs, {elapsed:.2f}s)")
+
+
+def main():
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--items", type=int, default=100_000)
+    cli.add_argument("--invalid", type=float, default=0.02)
+    cli.add_argument("--repeat", type=int, default=3)
+    args = cli.parse_args()
+
+    numeric = make_items(args.items, args.invalid, string_prices=False)
+    strings = make_items(args.items, args.invalid, string_prices=True)
+    get_batch_adapter("catalogue"), get_batch_adapter("catalogue", True)  # compilation hors mesure
+
+    timed("Boucle model_validate", legacy_loop, numeric, args.repeat)
+    timed("validate_batch (strict)", lambda items: validate_batch("catalogue", items), numeric, args.repeat)
+    timed("validate_batch (lax, prix numériques)",
+          lambda items: validate_batch("catalogue", items, lax_prices=True), numeric, args.repeat)
+    timed("validate_batch (lax, prix '24,99 €')",
+          lambda items: validate_batch("catalogue", items, lax_prices=True), strings, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
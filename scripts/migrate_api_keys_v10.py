@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, inspect, text
+from core.config import DATABASE_URL
+
+# Colonnes ajoutées à api_keys par la V10 (ordonnancement des clés : cooldown, quota)
+NEW_COLUMNS = {
+    "cooldown_until": "TIMESTAMP",
+    "error_count": "INTEGER DEFAULT 0",
+    "quota_remaining": "INTEGER",
+}
+
+def migrate():
+    engine = create_engine(DATABASE_URL)
+    inspector = inspect(engine)
+
+    if "api_keys" not in inspector.get_table_names():
+        print("La table 'api_keys' n'existe pas encore : lancez l'application une première fois.")
+        return
+
+    existing = {col["name"] for col in inspector.get_columns("api_keys")}
+    with engine.begin() as conn:
+        for name, sql_type in NEW_COLUMNS.items():
+            if name in existing:
+                print(f"La colonne 'api_keys.{name}' existe déjà.")
+                continue
+            print(f"V10: Ajout de la colonne 'api_keys.{name}'...")
+            conn.execute(text(f"ALTER TABLE api_keys ADD COLUMN {name} {sql_type}"))
+    print("Migration V10 terminée.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, inspect, text
+from core.config import DATABASE_URL
+
+# Colonnes ajoutées à job_queue par la V6 (file d'URLs distribuée)
+NEW_COLUMNS = {
+    "lease_expires_at": "TIMESTAMP",
+}
+
+def migrate():
+    engine = create_engine(DATABASE_URL)
+    inspector = inspect(engine)
+
+    if "job_queue" not in inspector.get_table_names():
+        print("La table 'job_queue' n'existe pas encore : lancez init_db() d'abord.")
+        return
+
+    existing = {col["name"] for col in inspector.get_columns("job_queue")}
+    with engine.begin() as conn:
+        for name, sql_type in NEW_COLUMNS.items():
+            if name in existing:
+                print(f"La colonne 'job_queue.{name}' existe déjà.")
+                continue
+            print(f"V6: Ajout de la colonne 'job_queue.{name}'...")
+            conn.execute(text(f"ALTER TABLE job_queue ADD COLUMN {name} {sql_type}"))
+    print("Migration V6 terminée.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, inspect
+from core.config import DATABASE_URL
+from core.models import LlmCallLog
+
+def migrate():
+    engine = create_engine(DATABASE_URL)
+
+    # Table llm_call_logs (instrumentation par appel LLM : latence, tokens, coût)
+    if "llm_call_logs" in inspect(engine).get_table_names():
+        print("La table 'llm_call_logs' existe déjà.")
+        return
+    print("V9: Création table 'llm_call_logs'...")
+    LlmCallLog.__table__.create(engine)
+    print("Table 'llm_call_logs' créée avec succès.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, inspect, text
+from core.config import DATABASE_URL
+
+# Colonnes ajoutées à mission_logs par la V11 (reprise liée au run, plus à une fenêtre de temps)
+NEW_COLUMNS = {
+    "run_id": "VARCHAR",
+}
+
+def migrate():
+    engine = create_engine(DATABASE_URL)
+    inspector = inspect(engine)
+
+    if "mission_logs" not in inspector.get_table_names():
+        print("La table 'mission_logs' n'existe pas encore : lancez scripts/migrate_missionlogs_v4.py d'abord.")
+        return
+
+    existing = {col["name"] for col in inspector.get_columns("mission_logs")}
+    with engine.begin() as conn:
+        for name, sql_type in NEW_COLUMNS.items():
+            if name in existing:
+                print(f"La colonne 'mission_logs.{name}' existe déjà.")
+                continue
+            print(f"V11: Ajout de la colonne 'mission_logs.{name}'...")
+            conn.execute(text(f"ALTER TABLE mission_logs ADD COLUMN {name} {sql_type}"))
+    print("Migration V11 terminée.")
+
+if __name__ == "__main__":
+    migrate()